@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Content-addressed cache of extraction results.
+
+Results are keyed by a hash of the HTML handed to the parser (and the
+backend, whose whitespace handling differs slightly, and the charset the
+bytes were served with), so a syndicated
+article or a retried download costs a lookup instead of a parse. A second
+index maps a URL plus its ``ETag``/``Last-Modified`` validators to the
+content hash, letting callers skip a download entirely.
+
+Entries live in an in-memory LRU tier with a TTL and, optionally, in an
+on-disk tier in any database SQLAlchemy can reach (sqlite works fine).
+'''
+
+import time
+import hashlib
+
+from lattr.conf import settings
+from lattr.lru import LRUCache
+from lattr.parser import Extraction, extract
+
+
+def content_key(html, backend=None, encoding=None):
+    if isinstance(html, unicode):
+        html = html.encode('utf-8')
+    digest = hashlib.sha1(html)
+    digest.update('\0%s' % (backend or settings.PARSER_BACKEND))
+    if encoding:
+        # The same bytes read in another charset are another document
+        digest.update('\0%s' % encoding.lower())
+    return digest.hexdigest()
+
+
+def url_key(url, etag=None, last_modified=None):
+    if not (etag or last_modified):
+        return None
+    key = u'\0'.join((url, etag or u'', last_modified or u''))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class MemoryTier(object):
+    '''LRU tier whose entries expire ``ttl`` seconds after being stored.'''
+
+    def __init__(self, maxsize, ttl=None):
+        self._cache = LRUCache(maxsize)
+        self.ttl = ttl
+
+    def get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires < time.time():
+            self._cache.pop(key)
+            return None
+        return value
+
+    def put(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        self._cache.put(key, (expires, value))
+
+    def info(self):
+        return self._cache.info()
+
+
+class SqlTier(object):
+    '''On-disk tier in a SQL table.
+
+    Expired rows are dropped when read, and once the table grows past
+    ``maxsize`` rows the oldest are deleted.
+    '''
+
+    def __init__(self, engine, ttl=None, maxsize=None,
+                 table_name='extraction_cache'):
+        from sqlalchemy import (MetaData, Table, Column, String,
+                                UnicodeText, Float)
+
+        self.engine = engine
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._writes = 0
+        metadata = MetaData()
+        self.table = Table(table_name, metadata,
+                           Column('key', String(40), primary_key=True),
+                           Column('title', UnicodeText),
+                           Column('content', UnicodeText),
+                           Column('created_at', Float, index=True))
+        metadata.create_all(engine)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        from sqlalchemy import create_engine
+        return cls(create_engine(url), **kwargs)
+
+    def get(self, key):
+        table = self.table
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                table.select().where(table.c.key == key)).first()
+            if row is None:
+                return None
+            if self.ttl and row.created_at + self.ttl < time.time():
+                connection.execute(table.delete().where(table.c.key == key))
+                return None
+            # Only full extractions are cached, the mode is not stored
+            return Extraction(row.title, row.content, 'full')
+
+    def put(self, key, value):
+        table = self.table
+        values = {'title': value.title, 'content': value.content,
+                  'created_at': time.time()}
+        with self.engine.begin() as connection:
+            updated = connection.execute(
+                table.update().where(table.c.key == key).values(**values))
+            if not updated.rowcount:
+                connection.execute(table.insert().values(key=key, **values))
+        self._writes += 1
+        if self.maxsize and self._writes % 100 == 0:
+            self.trim()
+
+    def trim(self):
+        '''Delete expired rows and the oldest ones beyond ``maxsize``.'''
+        from sqlalchemy import select
+
+        table = self.table
+        with self.engine.begin() as connection:
+            if self.ttl:
+                connection.execute(table.delete().where(
+                    table.c.created_at < time.time() - self.ttl))
+            if self.maxsize:
+                cutoff = connection.execute(
+                    select([table.c.created_at])
+                    .order_by(table.c.created_at.desc())
+                    .offset(self.maxsize).limit(1)).scalar()
+                if cutoff is not None:
+                    connection.execute(table.delete().where(
+                        table.c.created_at <= cutoff))
+
+
+class ExtractionCache(object):
+    '''Two-tier cache in front of :func:`lattr.parser.extract`.
+
+    Every lookup tries the memory tier, then the optional ``store``; a
+    store hit is copied back to memory.
+    '''
+
+    def __init__(self, maxsize=None, ttl=None, store=None):
+        if maxsize is None:
+            maxsize = settings.EXTRACTION_CACHE_SIZE
+        if ttl is None:
+            ttl = settings.EXTRACTION_CACHE_TTL
+        self.memory = MemoryTier(maxsize, ttl)
+        self.store = store
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_settings(cls):
+        store = None
+        if settings.EXTRACTION_CACHE_URL:
+            store = SqlTier.from_url(settings.EXTRACTION_CACHE_URL,
+                                     ttl=settings.EXTRACTION_CACHE_TTL,
+                                     maxsize=settings.EXTRACTION_CACHE_ROWS)
+        return cls(store=store)
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.store is not None:
+            self.store.put(key, value)
+
+    def lookup(self, url, etag=None, last_modified=None):
+        '''The cached result for ``url`` if its validators still match.'''
+        key = url_key(url, etag, last_modified)
+        if key is None:
+            return None
+        content = self.get(key)
+        if content is None:
+            return None
+        return self.get(content.content)
+
+    def extract(self, html, url=None, etag=None, last_modified=None,
+                backend=None, time_budget=None, encoding=None):
+        '''Extract ``html``, bytes in the charset ``encoding`` when it is
+        known, or return the cached result for identical input. With
+        ``url`` and a validator the result is also indexed for
+        :meth:`lookup`. A result from the fast fallback of a document out
+        of its time budget is returned without being cached.
+        '''
+        key = content_key(html, backend, encoding)
+        result = self.get(key)
+        if result is None:
+            result = extract(html, backend=backend, time_budget=time_budget,
+                             encoding=encoding)
+            if result.mode == 'fast':
+                return result
+            self.put(key, result)
+        validators_key = url and url_key(url, etag, last_modified)
+        if validators_key:
+            # The URL index stores the content key in place of the content
+            self.put(validators_key, Extraction(None, unicode(key)))
+        return result
@@ -3,7 +3,6 @@
 
 import os
 import importlib
-import logging.config
 
 from lattr.conf import default_settings
 
@@ -13,7 +12,10 @@ ENVIRONMENT_VARIABLE = 'LATTR_SETTINGS'
 
 class Settings(object):
 
+    _configured = False
+
     def configure(self, defaults=default_settings, module_env=ENVIRONMENT_VARIABLE):
+        self._configured = True
         # Load settings from defaults
         self._from_object(defaults)
 
@@ -21,9 +23,20 @@ class Settings(object):
         if module_env:
             self._from_envvar(module_env, True)
 
+    def __getattr__(self, name):
+        # Only reached for missing attributes: configure with the defaults
+        # on first use so library code can read settings directly.
+        if name.isupper() and not self._configured:
+            self.configure()
+            return getattr(self, name)
+        raise AttributeError(name)
+
     def _from_object(self, obj):
-        for k in filter(lambda x: x.isupper(), dir(obj)):
-            setattr(self, k, getattr(obj, k))
+        # vars() is a plain dict copy, dir() would also sort and walk the
+        # class hierarchy of every settings object
+        for k, v in vars(obj).items():
+            if k.isupper():
+                setattr(self, k, v)
 
     def _from_envvar(self, variable_name, silent=False):
         module_name = os.environ.get(variable_name)
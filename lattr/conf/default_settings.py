@@ -3,3 +3,114 @@
 
 LOGGING_CONFIG = None
 DB_BACKEND = 'mysql'
+
+# Tree backend used by lattr.parser.Document, either 'soup' or 'lxml'
+PARSER_BACKEND = 'soup'
+
+# Candidate scoring used by lattr.parser.Document: 'python', or 'numpy' to
+# score over arrays with NumPy (lattr.parser.vectorized), which pays off on
+# large pages
+SCORING_ENGINE = 'python'
+
+# Seconds a Document may spend extracting, counted from the start of the
+# tree build. Past it parse() falls back to a fast text-density pick
+# without sibling merging. None means no limit
+DOCUMENT_TIME_BUDGET = None
+
+# Leave scripts, styles, embeds and unlikely candidates out of the tree
+# while the page is parsed instead of removing them once it is built. Off
+# for pages whose next page is looked for, which needs pagination blocks
+PRUNE_WHILE_PARSING = True
+
+# Local files of at least this many bytes are memory-mapped instead of
+# read whole (lattr.parser.source), None always reads them
+MMAP_MIN_SIZE = 1024 * 1024
+
+# Number of (class, id) pairs whose scoring verdict is memoized
+CLASS_WEIGHT_CACHE_SIZE = 2048
+
+# Batch extraction (lattr.parser.batch): worker processes (None means one
+# per CPU), documents per dispatched chunk, seconds allowed per document and
+# jobs a worker runs before it is replaced (None keeps workers for good)
+BATCH_PROCESSES = None
+BATCH_CHUNKSIZE = 8
+BATCH_TIMEOUT = 30
+BATCH_MAX_TASKS_PER_CHILD = None
+
+# HTTP fetching (lattr.fetch): seconds before a request times out, maximum
+# decoded body size in bytes, concurrent connections per host and threads
+# used by Fetcher.fetch_many
+FETCH_TIMEOUT = 10
+FETCH_MAX_SIZE = 10 * 1024 * 1024
+FETCH_CONNECTIONS_PER_HOST = 8
+FETCH_WORKERS = 32
+FETCH_USER_AGENT = 'lattr/0.1'
+
+# Extraction result cache (lattr.cache): entries kept in memory, seconds
+# before an entry expires, and an optional SQLAlchemy URL for an on-disk
+# tier holding at most EXTRACTION_CACHE_ROWS rows
+EXTRACTION_CACHE_SIZE = 1024
+EXTRACTION_CACHE_TTL = 24 * 60 * 60
+EXTRACTION_CACHE_URL = None
+EXTRACTION_CACHE_ROWS = 100000
+
+# Streaming extraction (lattr.parser.streaming): bytes read before the
+# rest of a page is ignored, None reads everything
+STREAMING_BYTE_BUDGET = None
+
+# Extraction service (lattr.service): worker processes (None means one per
+# CPU), documents queued before requests are refused with a 503, largest
+# batch accepted and the address lattr-server listens on
+SERVICE_PROCESSES = None
+SERVICE_QUEUE_SIZE = 64
+SERVICE_MAX_BATCH = 100
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8000
+
+# Article store (lattr.datastore): a SQLAlchemy URL, or when DB_URL is None
+# one built from DB_BACKEND and the connection settings below (sqlite uses
+# DB_NAME as the file name), the connection pool and rows written per
+# bulk upsert
+DB_URL = None
+DB_HOST = 'localhost'
+DB_PORT = None
+DB_USER = None
+DB_PASSWORD = None
+DB_NAME = 'lattr'
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+DB_POOL_RECYCLE = 3600
+DB_BULK_SIZE = 500
+
+# Low-memory extraction: free pruned subtrees as they are removed, drop the
+# raw HTML once it is parsed and keep only the detached main content after
+# parsing
+LOW_MEMORY = False
+
+# Per-domain extraction templates (lattr.parser.templates), used for
+# Documents given a url: domains remembered, failed validations in a row
+# before a template is dropped, and the least text and most link density a
+# node found by a template may have
+EXTRACTION_TEMPLATES = False
+TEMPLATE_CACHE_SIZE = 1024
+TEMPLATE_MAX_FAILURES = 3
+TEMPLATE_MIN_TEXT_LENGTH = 250
+TEMPLATE_MAX_LINK_DENSITY = 0.5
+
+# Incremental re-extraction (lattr.parser.incremental), used for Documents
+# given a url: the content region of the last INCREMENTAL_CACHE_SIZE URLs
+# is remembered, and only what changed in it is scored when one of them
+# is parsed again
+INCREMENTAL_EXTRACTION = False
+INCREMENTAL_CACHE_SIZE = 1024
+
+# Near-duplicate detection (lattr.dedup): most bits two fingerprints may
+# differ by and an optional SQLAlchemy URL where fingerprints are kept
+DEDUP_MAX_DISTANCE = 3
+DEDUP_URL = None
+
+# Multi-page articles (lattr.parser.pagination): whether Documents given a
+# url look for their next page link, and the most pages assembled into
+# one article
+FIND_NEXT_PAGE = False
+MULTIPAGE_MAX_PAGES = 10
@@ -1,4 +1,260 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-from sqlalchemy import create_engine
+'''Persistence of extracted articles.
+
+Articles live in one ``articles`` table, keyed by a hash of their URL and
+indexed by a hash of their content to find the same article under several
+URLs. The engine is built from ``settings`` (``DB_URL``, or ``DB_BACKEND``
+and the ``DB_*`` connection settings) with a connection pool sized by
+``DB_POOL_SIZE``. sqlite works as well, which keeps local runs and tests
+free of a MySQL server.
+
+Writes are batched: :meth:`ArticleStore.save` upserts ``DB_BULK_SIZE``
+articles per transaction with one query for the existing rows, one
+``executemany`` insert and one ``executemany`` update. Reads page through
+the table by primary key, so walking the whole table stays cheap however
+far in it is.
+'''
+
+import time
+import hashlib
+from collections import namedtuple, OrderedDict
+
+from lattr.conf import settings
+
+
+_articles = None
+
+
+def articles_table():
+    '''The ``articles`` table. It is defined on first use so that SQLAlchemy
+    is only loaded once persistence is used.
+    '''
+    global _articles
+    if _articles is None:
+        from sqlalchemy import (MetaData, Table, Column, Integer, Float,
+                                String, Text, UnicodeText)
+
+        _articles = Table(
+            'articles', MetaData(),
+            Column('id', Integer, primary_key=True),
+            # sha1 of the URL, which can be too long to index in MySQL
+            Column('url_key', String(40), nullable=False, unique=True),
+            Column('url', Text, nullable=False),
+            Column('content_hash', String(40), index=True),
+            Column('title', UnicodeText),
+            Column('content', UnicodeText),
+            Column('final_url', Text),
+            Column('status', Integer),
+            Column('etag', String(255)),
+            Column('last_modified', String(64)),
+            Column('fetched_at', Float),
+            Column('updated_at', Float, nullable=False),
+        )
+    return _articles
+
+
+_FIELDS = ('url', 'title', 'content', 'content_hash', 'final_url', 'status',
+           'etag', 'last_modified', 'fetched_at')
+
+
+class Article(namedtuple('Article', ('id',) + _FIELDS)):
+    '''An extracted article. ``content_hash`` is filled in from ``content``
+    when left out.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, url, title=None, content=None, content_hash=None,
+                final_url=None, status=None, etag=None, last_modified=None,
+                fetched_at=None, id=None):
+        if content_hash is None and content is not None:
+            content_hash = hash_content(content)
+        return super(Article, cls).__new__(
+            cls, id, url, title, content, content_hash, final_url, status,
+            etag, last_modified, fetched_at)
+
+
+def hash_content(content):
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+def _url_key(url):
+    if isinstance(url, unicode):
+        url = url.encode('utf-8')
+    return hashlib.sha1(url).hexdigest()
+
+
+def database_url():
+    '''The SQLAlchemy URL described by ``settings``.'''
+    if settings.DB_URL:
+        return settings.DB_URL
+    if settings.DB_BACKEND == 'sqlite':
+        return 'sqlite:///%s' % settings.DB_NAME
+    from sqlalchemy.engine.url import URL
+
+    make_url = getattr(URL, 'create', URL)
+    return make_url(settings.DB_BACKEND,
+                    username=settings.DB_USER,
+                    password=settings.DB_PASSWORD,
+                    host=settings.DB_HOST,
+                    port=settings.DB_PORT,
+                    database=settings.DB_NAME)
+
+
+def create_pooled_engine(url=None):
+    '''An engine for ``url`` (by default :func:`database_url`) whose
+    connections are pooled, checked before use and recycled before the
+    server drops them.
+    '''
+    from sqlalchemy import create_engine
+
+    url = url or database_url()
+    options = {'pool_pre_ping': True}
+    if not str(url).startswith('sqlite'):
+        # sqlite uses its own pools, which take none of these
+        options.update(pool_size=settings.DB_POOL_SIZE,
+                       max_overflow=settings.DB_MAX_OVERFLOW,
+                       pool_recycle=settings.DB_POOL_RECYCLE)
+    return create_engine(url, **options)
+
+
+def _article(row):
+    return Article(id=row.id, **dict((field, row[field]) for field in _FIELDS))
+
+
+class ArticleStore(object):
+
+    def __init__(self, engine, bulk_size=None):
+        self.engine = engine
+        self.bulk_size = bulk_size or settings.DB_BULK_SIZE
+        self.table = articles_table()
+        self.table.metadata.create_all(engine)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(create_pooled_engine())
+
+    def save(self, items):
+        '''Insert or update ``items`` by URL, ``bulk_size`` at a time.
+        Returns the number of inserted and updated rows.
+        '''
+        inserted = updated = 0
+        batch = []
+        for article in items:
+            batch.append(article)
+            if len(batch) >= self.bulk_size:
+                counts = self._save_batch(batch)
+                inserted += counts[0]
+                updated += counts[1]
+                batch = []
+        if batch:
+            counts = self._save_batch(batch)
+            inserted += counts[0]
+            updated += counts[1]
+        return inserted, updated
+
+    def _save_batch(self, batch):
+        from sqlalchemy import bindparam, select
+
+        articles = self.table
+        now = time.time()
+        rows = OrderedDict()
+        for article in batch:
+            row = dict((field, getattr(article, field)) for field in _FIELDS)
+            row['url_key'] = _url_key(article.url)
+            row['updated_at'] = now
+            # The last write of a URL in the batch wins
+            rows[row['url_key']] = row
+        with self.engine.begin() as connection:
+            existing = set(key for key, in connection.execute(
+                select([articles.c.url_key])
+                .where(articles.c.url_key.in_(list(rows)))))
+            new = [row for key, row in rows.iteritems() if key not in existing]
+            # Bound names may not clash with the columns being set
+            changed = [dict(('new_' + name, value)
+                            for name, value in row.iteritems())
+                       for key, row in rows.iteritems() if key in existing]
+            if new:
+                connection.execute(articles.insert(), new)
+            if changed:
+                connection.execute(
+                    articles.update()
+                    .where(articles.c.url_key == bindparam('new_url_key'))
+                    .values(dict((field, bindparam('new_' + field))
+                                 for field in _FIELDS + ('updated_at',))),
+                    changed)
+        return len(new), len(changed)
+
+    def save_results(self, results, fetched_at=None, duplicates=None):
+        '''Save the successful :class:`lattr.parser.batch.BatchResult` in
+        ``results``, whose sources are URLs, and yield every result on.
+
+        With ``duplicates``, a :class:`lattr.dedup.SimHashIndex`, results
+        whose content is a near-duplicate of an indexed one are not saved.
+        '''
+        if duplicates is not None:
+            from lattr.dedup import html_fingerprint
+
+        fetched_at = fetched_at or time.time()
+        batch = []
+        for result in results:
+            if duplicates is not None and not result.error:
+                if duplicates.check(result.source,
+                                    html_fingerprint(result.content or u'')):
+                    yield result
+                    continue
+            if not result.error:
+                batch.append(Article(result.source, result.title,
+                                     result.content, fetched_at=fetched_at))
+                if len(batch) >= self.bulk_size:
+                    self._save_batch(batch)
+                    batch = []
+            yield result
+        if batch:
+            self._save_batch(batch)
+
+    def get(self, url):
+        articles = self.table
+        with self.engine.connect() as connection:
+            row = connection.execute(articles.select().where(
+                articles.c.url_key == _url_key(url))).first()
+        return _article(row) if row is not None else None
+
+    def find_by_content_hash(self, content_hash):
+        '''Articles with the given content, oldest first.'''
+        articles = self.table
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                articles.select()
+                .where(articles.c.content_hash == content_hash)
+                .order_by(articles.c.id)).fetchall()
+        return [_article(row) for row in rows]
+
+    def iter_articles(self, page_size=None, after=0):
+        '''Yield every article with an id above ``after`` in id order,
+        reading ``page_size`` rows per query.
+        '''
+        articles = self.table
+        page_size = page_size or self.bulk_size
+        while True:
+            with self.engine.connect() as connection:
+                rows = connection.execute(
+                    articles.select()
+                    .where(articles.c.id > after)
+                    .order_by(articles.c.id)
+                    .limit(page_size)).fetchall()
+            for row in rows:
+                yield _article(row)
+            if len(rows) < page_size:
+                return
+            after = rows[-1].id
+
+    def count(self):
+        from sqlalchemy import select, func
+
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select([func.count()]).select_from(self.table)).scalar()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Near-duplicate detection of extracted articles.
+
+A syndicated or re-templated copy of an article rarely has the same HTML
+as the original, but its main content text barely changes. Each extracted
+text gets a 64 bit SimHash over its three-word shingles. Texts that share
+most of their shingles get fingerprints a few bits apart::
+
+    index = SimHashIndex()
+    match = index.check(url, document_fingerprint(doc), extraction)
+    if match is not None:
+        # a copy of match.key, whose result is match.value
+        ...
+
+The index splits fingerprints into ``max_distance + 1`` bands. Two
+fingerprints within ``max_distance`` bits agree on at least one band, so
+a lookup only compares against the few entries sharing a band instead of
+every entry. With a :class:`SqlFingerprints` store the fingerprints
+outlive the process. The values do not, so entries loaded from the store
+only carry their key.
+'''
+
+import re
+import hashlib
+from collections import namedtuple
+
+from lattr.conf import settings
+
+
+BITS = 64
+SHINGLE_SIZE = 3
+
+Match = namedtuple('Match', ['key', 'distance', 'value'])
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+_TAGS = re.compile(r'<[^>]*>')
+
+
+# For each bit of a byte, the translation of every byte to '1' when it has
+# the bit and '0' when it does not
+_BIT_TABLES = [''.join('1' if byte >> bit & 1 else '0' for byte in xrange(256))
+               for bit in xrange(8)]
+
+
+def _feature_hash(shingle):
+    # 64 bits, little endian
+    return hashlib.md5(shingle.encode('utf-8')).digest()[:8]
+
+
+def simhash(text):
+    '''64 bit SimHash of ``text``, 0 for a text without words.'''
+    words = _WORDS.findall(text.lower())
+    if len(words) > SHINGLE_SIZE:
+        shingles = [u' '.join(words[i:i + SHINGLE_SIZE])
+                    for i in xrange(len(words) - SHINGLE_SIZE + 1)]
+    else:
+        shingles = [u' '.join(words)] if words else []
+    if not shingles:
+        return 0
+    # A bit is set when more than half of the shingles have it. The hashes
+    # are counted a byte position at a time: translating the bytes to '1'
+    # or '0' for one bit and counting the '1's keeps the loop out of Python.
+    half = len(shingles) / 2.0
+    hashes = ''.join(_feature_hash(shingle) for shingle in shingles)
+    fingerprint = 0
+    for position in xrange(8):
+        column = hashes[position::8]
+        for bit, table in enumerate(_BIT_TABLES):
+            if column.translate(table).count('1') > half:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+
+def html_fingerprint(html):
+    '''SimHash of the text of an HTML fragment, as stored by
+    :class:`lattr.datastore.ArticleStore`. Entities are left as they are,
+    which is the same for every copy.
+    '''
+    if isinstance(html, str):
+        html = html.decode('utf-8', 'replace')
+    return simhash(_TAGS.sub(u' ', html))
+
+
+def document_fingerprint(doc):
+    '''SimHash of the main content text of a parsed
+    :class:`lattr.parser.Document`.
+    '''
+    if doc.main_content is None:
+        return 0
+    return simhash(doc._tree.text(doc.main_content))
+
+
+def distance(a, b):
+    '''Number of bits that differ between two fingerprints.'''
+    return bin(a ^ b).count('1')
+
+
+class SimHashIndex(object):
+    '''Fingerprints by key, found by any fingerprint at most
+    ``max_distance`` bits away.
+    '''
+
+    def __init__(self, max_distance=None, store=None):
+        if max_distance is None:
+            max_distance = settings.DEDUP_MAX_DISTANCE
+        self.max_distance = max_distance
+        self.store = store
+        bands = max_distance + 1
+        width = BITS // bands
+        # (shift, mask) of each band, the last one takes the leftover bits
+        self._bands = [(band * width,
+                        (1 << (width if band < bands - 1
+                               else BITS - band * width)) - 1)
+                       for band in xrange(bands)]
+        self._buckets = {}
+        # key -> [fingerprint, value, insertion order]
+        self._entries = {}
+        self._added = 0
+        if store is not None:
+            for key, fingerprint in store.load():
+                self._add(key, fingerprint, None)
+
+    @classmethod
+    def from_settings(cls):
+        store = None
+        if settings.DEDUP_URL:
+            store = SqlFingerprints.from_url(settings.DEDUP_URL)
+        return cls(store=store)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _band_keys(self, fingerprint):
+        return [(band, fingerprint >> shift & mask)
+                for band, (shift, mask) in enumerate(self._bands)]
+
+    def _add(self, key, fingerprint, value):
+        self._discard(key)
+        self._entries[key] = [fingerprint, value, self._added]
+        self._added += 1
+        for band_key in self._band_keys(fingerprint):
+            self._buckets.setdefault(band_key, []).append(key)
+
+    def add(self, key, fingerprint, value=None):
+        self._add(key, fingerprint, value)
+        if self.store is not None:
+            self.store.put(key, fingerprint)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for band_key in self._band_keys(entry[0]):
+            bucket = self._buckets[band_key]
+            bucket.remove(key)
+            if not bucket:
+                del self._buckets[band_key]
+        return True
+
+    def remove(self, key):
+        if self._discard(key) and self.store is not None:
+            self.store.delete(key)
+
+    def find(self, fingerprint):
+        '''The closest entry to ``fingerprint``, the earliest added among
+        equally close ones, or None when none is within ``max_distance``.
+        '''
+        best = None
+        seen = set()
+        for band_key in self._band_keys(fingerprint):
+            for key in self._buckets.get(band_key, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                entry = self._entries[key]
+                bits = distance(fingerprint, entry[0])
+                if bits > self.max_distance:
+                    continue
+                if best is None or (bits, entry[2]) < best[0]:
+                    best = ((bits, entry[2]), key, entry[1])
+        if best is None:
+            return None
+        return Match(best[1], best[0][0], best[2])
+
+    def check(self, key, fingerprint, value=None):
+        '''Return the :class:`Match` ``key`` duplicates, or add it and return
+        None when it is new. Empty texts (fingerprint 0) are never matched.
+        '''
+        if fingerprint:
+            match = self.find(fingerprint)
+            if match is not None and match.key != key:
+                return match
+            self.add(key, fingerprint, value)
+        return None
+
+
+class SqlFingerprints(object):
+    '''Fingerprints of a :class:`SimHashIndex` kept in a SQL table.'''
+
+    def __init__(self, engine, table_name='fingerprints'):
+        from sqlalchemy import MetaData, Table, Column, String, Text
+
+        self.engine = engine
+        metadata = MetaData()
+        self.table = Table(table_name, metadata,
+                           Column('key', Text, nullable=False),
+                           # Hex, 64 bit unsigned values overflow BIGINT
+                           Column('fingerprint', String(16), nullable=False),
+                           # sha1 of the key, which can be too long to index
+                           Column('key_hash', String(40), primary_key=True))
+        metadata.create_all(engine)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        from sqlalchemy import create_engine
+        return cls(create_engine(url), **kwargs)
+
+    @staticmethod
+    def _key_hash(key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return hashlib.sha1(key).hexdigest()
+
+    def load(self):
+        with self.engine.connect() as connection:
+            rows = connection.execute(self.table.select()).fetchall()
+        return [(row.key, int(row.fingerprint, 16)) for row in rows]
+
+    def put(self, key, fingerprint):
+        table = self.table
+        key_hash = self._key_hash(key)
+        values = {'key': key, 'fingerprint': '%016x' % fingerprint}
+        with self.engine.begin() as connection:
+            updated = connection.execute(
+                table.update().where(table.c.key_hash == key_hash)
+                .values(**values))
+            if not updated.rowcount:
+                connection.execute(table.insert().values(key_hash=key_hash,
+                                                         **values))
+
+    def delete(self, key):
+        table = self.table
+        with self.engine.begin() as connection:
+            connection.execute(table.delete().where(
+                table.c.key_hash == self._key_hash(key)))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''HTTP fetching with pooled sessions.
+
+Each thread keeps its own ``requests.Session`` so connections are reused
+with keep-alive. :meth:`Fetcher.fetch_many` runs on one pool of worker
+threads kept for the life of the fetcher, so its sessions are reused from
+call to call, and the sessions of threads that have exited are closed. A
+semaphore per host caps concurrent requests to
+one server, and bodies are streamed so oversized responses are cut off
+before they are buffered. Compressed bodies are decoded by requests while
+streaming, so the size limit applies to the decoded content.
+'''
+
+import cgi
+import time
+import threading
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lattr.conf import settings
+
+
+FetchResult = namedtuple('FetchResult', ['url', 'final_url', 'status',
+                                         'headers', 'content', 'encoding',
+                                         'error', 'elapsed'])
+
+
+# The body of a response being downloaded: the charset from its headers
+# and a generator of its chunks
+StreamedBody = namedtuple('StreamedBody', ['encoding', 'chunks'])
+
+
+class FetchError(Exception):
+    pass
+
+
+def _charset(headers):
+    content_type = headers.get('content-type')
+    if not content_type:
+        return None
+    _, params = cgi.parse_header(content_type)
+    return params.get('charset')
+
+
+class Fetcher(object):
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, timeout=None, max_size=None, per_host=None,
+                 workers=None, user_agent=None):
+        self.timeout = timeout or settings.FETCH_TIMEOUT
+        self.max_size = max_size or settings.FETCH_MAX_SIZE
+        self.per_host = per_host or settings.FETCH_CONNECTIONS_PER_HOST
+        self.workers = workers or settings.FETCH_WORKERS
+        self.user_agent = user_agent or settings.FETCH_USER_AGENT
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (thread, session) pairs
+        self._sessions = []
+        self._host_slots = {}
+        self._pool = None
+
+    @property
+    def session(self):
+        '''The calling thread's session.'''
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers,
+                                  pool_maxsize=self.per_host)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = self.user_agent
+            self._local.session = session
+            with self._lock:
+                self._drop_exited()
+                self._sessions.append((threading.current_thread(), session))
+        return session
+
+    def _drop_exited(self):
+        # Called with the lock held
+        sessions = []
+        for thread, session in self._sessions:
+            if thread.is_alive():
+                sessions.append((thread, session))
+            else:
+                session.close()
+        self._sessions = sessions
+
+    def _worker_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def _slots(self, host):
+        with self._lock:
+            slots = self._host_slots.get(host)
+            if slots is None:
+                slots = self._host_slots[host] = \
+                    threading.BoundedSemaphore(self.per_host)
+            return slots
+
+    def fetch(self, url):
+        '''Fetch ``url``; errors are reported in the result, not raised.'''
+        started = time.time()
+        try:
+            with self._slots(urlparse(url).netloc):
+                status, final_url, headers, content = self._get(url)
+        except (requests.RequestException, FetchError) as e:
+            return FetchResult(url, None, None, None, None, None,
+                               '%s: %s' % (e.__class__.__name__, e),
+                               time.time() - started)
+        error = None
+        if status >= 400:
+            error = 'HTTP %d' % status
+        return FetchResult(url, final_url, status, headers, content,
+                           _charset(headers), error, time.time() - started)
+
+    def _get(self, url):
+        response = self.session.get(url, timeout=self.timeout, stream=True)
+        try:
+            length = response.headers.get('content-length')
+            if length and length.isdigit() and int(length) > self.max_size:
+                raise FetchError('body of %s bytes exceeds %d' %
+                                 (length, self.max_size))
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_size:
+                    raise FetchError('body exceeds %d bytes' % self.max_size)
+                chunks.append(chunk)
+            return (response.status_code, response.url,
+                    response.headers, ''.join(chunks))
+        finally:
+            response.close()
+
+    def stream(self, url):
+        '''Yield the body of ``url`` in chunks as they arrive.
+
+        Unlike :meth:`fetch`, errors raise :class:`FetchError` or a
+        ``requests`` exception. Closing the generator early releases the
+        connection.
+        '''
+        body = self.open(url)
+        try:
+            for chunk in body.chunks:
+                yield chunk
+        finally:
+            body.chunks.close()
+
+    def open(self, url):
+        '''Start downloading ``url`` and return a :class:`StreamedBody` as
+        soon as its headers are in, the body being left to its ``chunks``.
+        Errors raise as with :meth:`stream`.
+        '''
+        chunks = self._stream(url)
+        return StreamedBody(_charset(next(chunks)), chunks)
+
+    def _stream(self, url):
+        # Yields the headers, then the chunks of the body
+        with self._slots(urlparse(url).netloc):
+            response = self.session.get(url, timeout=self.timeout,
+                                        stream=True)
+            try:
+                if response.status_code >= 400:
+                    raise FetchError('HTTP %d' % response.status_code)
+                yield response.headers
+                size = 0
+                for chunk in response.iter_content(self.CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise FetchError('body exceeds %d bytes' %
+                                         self.max_size)
+                    yield chunk
+            finally:
+                response.close()
+
+    def fetch_many(self, urls, ordered=False):
+        '''Fetch ``urls`` over ``workers`` threads, yielding results as they
+        complete (or in order with ``ordered``). The URLs already handed
+        to the workers are still fetched when the generator is closed
+        early.
+        '''
+        pool = self._worker_pool()
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(self.fetch, urls):
+            yield result
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            sessions, self._sessions = self._sessions, []
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for _, session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
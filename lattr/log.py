@@ -1,8 +1,147 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-import logging.config
+'''Logging setup and extraction metrics.
+
+A :class:`Metrics` collects the wall time of each extraction stage and a
+few counters (nodes kept, nodes removed, candidates scored). Documents only
+collect metrics when they are given a :class:`Metrics` or when a hook is
+registered, so with no hooks the parser does no extra work::
+
+    from lattr import log
+
+    log.add_hook(log.log_metrics)      # or any callable taking a Metrics
+'''
+
+import sys
+import time
+import logging
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+metrics_logger = logging.getLogger('lattr.metrics')
+
+_hooks = []
 
 
 def configure(config_file):
-    logging.config.fileConfig(config_file)
+    import logging.config
+
+    # Module level loggers exist before the config is read, keep them
+    logging.config.fileConfig(config_file, disable_existing_loggers=False)
+
+
+def add_hook(callback):
+    '''Call ``callback(metrics)`` after each document is extracted.'''
+    if callback not in _hooks:
+        _hooks.append(callback)
+
+
+def remove_hook(callback):
+    if callback in _hooks:
+        _hooks.remove(callback)
+
+
+def hooks_enabled():
+    return bool(_hooks)
+
+
+class Metrics(object):
+    '''Stage durations in seconds, in the order the stages ran, and
+    counters of one extraction.
+    '''
+
+    def __init__(self):
+        self.durations = OrderedDict()
+        self.counters = {}
+
+    def record(self, stage, started):
+        '''Add the time since ``started`` to ``stage`` and return the
+        current time, so the next stage can start from it.
+        '''
+        now = time.time()
+        self.durations[stage] = self.durations.get(stage, 0) + now - started
+        return now
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def emit(self):
+        for hook in list(_hooks):
+            hook(self)
+
+
+def peak_rss_kb():
+    '''Peak resident set size of this process in KB, None where it
+    cannot be measured.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+class PeakRSS(object):
+    '''Peak resident set size of this process in KB between :meth:`start`
+    and :meth:`stop`.
+
+    On Linux the kernel's high-water mark is reset at the start, by
+    writing ``5`` to ``/proc/self/clear_refs``, and read back from
+    ``VmHWM``. Elsewhere this is how much the process peak grew in
+    between, 0 when it stayed under an earlier peak.
+    '''
+
+    CLEAR_REFS = '/proc/self/clear_refs'
+    STATUS = '/proc/self/status'
+
+    def __init__(self):
+        self.reset = False
+        self.baseline = None
+
+    def start(self):
+        try:
+            with open(self.CLEAR_REFS, 'w') as fp:
+                fp.write('5')
+            self.reset = True
+        except (IOError, OSError):
+            self.reset = False
+            self.baseline = peak_rss_kb()
+
+    def stop(self):
+        if self.reset:
+            return self._high_water_mark()
+        peak = peak_rss_kb()
+        if peak is None or self.baseline is None:
+            return None
+        return peak - self.baseline
+
+    def _high_water_mark(self):
+        try:
+            with open(self.STATUS) as fp:
+                for line in fp:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1])
+        except (IOError, OSError, ValueError, IndexError):
+            pass
+        return None
+
+
+def log_metrics(metrics):
+    '''Hook writing the metrics of each extraction to the
+    ``lattr.metrics`` logger.
+    '''
+    if not metrics_logger.isEnabledFor(logging.INFO):
+        return
+    metrics_logger.info(
+        '%s %s',
+        ' '.join('%s=%.2fms' % (stage, seconds * 1000)
+                 for stage, seconds in metrics.durations.iteritems()),
+        ' '.join('%s=%d' % item for item in sorted(metrics.counters.items())))
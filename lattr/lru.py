@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import threading
+from collections import namedtuple
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+# Fields of a link in the recency list
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+
+class LRUCache(object):
+    '''Mapping bounded to ``maxsize`` entries that evicts the least
+    recently used one first.
+
+    Entries are kept in a circular doubly linked list of small lists, the
+    same layout ``functools.lru_cache`` uses, so a hit is a dict lookup plus
+    a few pointer updates. The list is shared by every thread using the
+    cache, so each operation holds a lock while it relinks it.
+    '''
+
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def get(self, key, default=None):
+        with self._lock:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._move_to_front(link)
+            return link[_VALUE]
+
+    def put(self, key, value):
+        with self._lock:
+            link = self._links.get(key)
+            if link is not None:
+                link[_VALUE] = value
+                self._move_to_front(link)
+                return
+            root = self._root
+            if len(self._links) >= self.maxsize:
+                oldest = root[_NEXT]
+                oldest[_PREV][_NEXT] = oldest[_NEXT]
+                oldest[_NEXT][_PREV] = oldest[_PREV]
+                del self._links[oldest[_KEY]]
+            last = root[_PREV]
+            link = [last, root, key, value]
+            last[_NEXT] = root[_PREV] = link
+            self._links[key] = link
+
+    def pop(self, key, default=None):
+        with self._lock:
+            link = self._links.pop(key, None)
+            if link is None:
+                return default
+            link[_PREV][_NEXT] = link[_NEXT]
+            link[_NEXT][_PREV] = link[_PREV]
+            return link[_VALUE]
+
+    def clear(self):
+        with self._lock:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None]
+            self.hits = self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self._links))
+
+    def keys(self):
+        '''Keys from least to most recently used.'''
+        keys = []
+        with self._lock:
+            link = self._root[_NEXT]
+            while link is not self._root:
+                keys.append(link[_KEY])
+                link = link[_NEXT]
+        return keys
+
+    def _move_to_front(self, link):
+        root = self._root
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+        last = root[_PREV]
+        last[_NEXT] = root[_PREV] = link
+        link[_PREV] = last
+        link[_NEXT] = root
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def __len__(self):
+        return len(self._links)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.info())
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-from .parser import HTMLCleaner, Document, main
+from .parser import HTMLCleaner, Document, Extraction, extract, main
 
 __all__ = [
     'HTMLCleaner',
     'Document',
+    'Extraction',
+    'extract',
     'main'
 ]
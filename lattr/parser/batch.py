@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Extract many documents at once over a pool of worker processes.
+
+Sources can be a directory, a glob pattern or a JSONL stream. Each JSONL
+line is an object with an ``id`` and either the ``html`` itself or the
+``path`` of a file to read::
+
+    {"id": "a", "html": "<html>...</html>"}
+    {"id": "b", "path": "/data/pages/b.html"}
+
+Files are read by the workers, so only paths cross process boundaries.
+'''
+
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import multiprocessing
+from collections import namedtuple
+
+from lattr.conf import settings
+from lattr.log import PeakRSS
+from lattr.parser.parser import Document
+from lattr.parser.source import read_file
+
+
+class BatchResult(namedtuple('BatchResult', ['source', 'title', 'content',
+                                             'error', 'elapsed',
+                                             'peak_rss_kb', 'mode'])):
+    '''Outcome of one job. ``peak_rss_kb`` is the peak memory of the
+    process while it extracted this document, as measured by
+    :class:`lattr.log.PeakRSS`. ``mode`` is the :attr:`Document.mode` that
+    produced the result.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, source, title, content, error, elapsed,
+                peak_rss_kb=None, mode=None):
+        return super(BatchResult, cls).__new__(cls, source, title, content,
+                                               error, elapsed,
+                                               peak_rss_kb, mode)
+
+
+class Job(namedtuple('Job', ['source', 'path', 'html', 'error',
+                             'encoding'])):
+    '''A unit of work: either a ``path`` to read or the ``html`` itself,
+    bytes being in the charset ``encoding`` when it is known. A job
+    carrying an ``error`` (a failed download, say) is reported without
+    being extracted.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, source, path=None, html=None, error=None,
+                encoding=None):
+        return super(Job, cls).__new__(cls, source, path, html, error,
+                                       encoding)
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+class _Deadline(object):
+    '''Raise :class:`ExtractionTimeout` in the main thread once ``timeout``
+    seconds have passed.
+
+    An exception raised inside ``__del__`` or a garbage collector callback
+    is swallowed, so the alarm keeps firing every ``REPEAT`` seconds until
+    it is cancelled, and ``expired`` tells whether it fired at all. The
+    caller's SIGALRM handler is put back on :meth:`cancel`.
+    '''
+
+    REPEAT = 0.05
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expired = False
+        self.armed = False
+        self._previous = None
+
+    def _fire(self, signum, frame):
+        self.expired = True
+        raise ExtractionTimeout()
+
+    def start(self):
+        if not self.timeout:
+            return
+        try:
+            self._previous = signal.signal(signal.SIGALRM, self._fire)
+        except ValueError:
+            # Not in the main thread, run without a deadline
+            return
+        signal.setitimer(signal.ITIMER_REAL, self.timeout, self.REPEAT)
+        self.armed = True
+
+    def cancel(self):
+        if self.armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            # None when the handler was not installed from Python
+            signal.signal(signal.SIGALRM, self._previous or signal.SIG_DFL)
+            self.armed = False
+
+
+def iter_jobs(spec, stream=None):
+    '''Turn ``spec`` into jobs.
+
+    ``spec`` is a directory (every file in it, sorted), a ``.jsonl`` file,
+    ``-`` for JSONL on ``stream`` (stdin by default) or a glob pattern.
+    '''
+    if spec == '-':
+        return _iter_jsonl(stream or sys.stdin)
+    if os.path.isdir(spec):
+        return (Job(path, path, None) for path in
+                sorted(os.path.join(spec, name) for name in os.listdir(spec))
+                if os.path.isfile(path))
+    if spec.endswith('.jsonl') and os.path.isfile(spec):
+        return _iter_jsonl_file(spec)
+    return (Job(path, path, None) for path in sorted(glob.glob(spec))
+            if os.path.isfile(path))
+
+
+def _iter_jsonl_file(path):
+    with open(path, 'rb') as fp:
+        for job in _iter_jsonl(fp):
+            yield job
+
+
+def _iter_jsonl(fp):
+    # Bad lines become jobs carrying an error: an exception raised here
+    # would be lost in the pool's task feeder thread
+    for number, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield Job(number, error='invalid JSON on line %d' % number)
+            continue
+        if not isinstance(record, dict):
+            yield Job(number, error='not a JSON object on line %d' % number)
+            continue
+        source = record.get('id', number)
+        if not (record.get('path') or record.get('html')):
+            yield Job(source,
+                      error='neither html nor path on line %d' % number)
+            continue
+        yield Job(source, record.get('path'), record.get('html'))
+
+
+def extract_job(job, backend=None, timeout=None, low_memory=None,
+                time_budget=None):
+    '''Extract a single job, never raising: failures and timeouts are
+    reported in ``BatchResult.error``. A document past its ``time_budget``
+    is still extracted, in fast mode.
+    '''
+    started = time.time()
+    if job.error:
+        return BatchResult(job.source, None, None, job.error, 0)
+    deadline = _Deadline(timeout)
+    peak_rss = PeakRSS()
+    peak_rss.start()
+    try:
+        try:
+            deadline.start()
+            html = job.html
+            if html is None:
+                html = read_file(job.path)
+            url = job.source
+            if not (isinstance(url, basestring) and
+                    url.startswith(('http://', 'https://'))):
+                url = None
+            doc = Document(html, backend=backend, low_memory=low_memory,
+                           url=url, time_budget=time_budget,
+                           encoding=job.encoding)
+            # Let the document drop the raw HTML in low-memory mode
+            html = None
+            doc.parse()
+            title, content, mode = doc.title, doc.content_html(), doc.mode
+        finally:
+            # First thing once the work is done, still inside the try so
+            # an alarm firing meanwhile is reported as a timeout
+            deadline.cancel()
+        if deadline.expired:
+            raise ExtractionTimeout()
+    except ExtractionTimeout:
+        # Again, in case the alarm interrupted the first cancel
+        deadline.cancel()
+        return BatchResult(job.source, None, None,
+                           'timed out after %ss' % timeout,
+                           time.time() - started)
+    except Exception as e:
+        return BatchResult(job.source, None, None,
+                           '%s: %s' % (e.__class__.__name__, e),
+                           time.time() - started)
+    return BatchResult(job.source, title, content, None,
+                       time.time() - started, peak_rss.stop(), mode)
+
+
+class _Worker(object):
+    # Picklable stand-in for a closure over the extraction options
+
+    def __init__(self, backend, timeout, low_memory=None, time_budget=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.low_memory = low_memory
+        self.time_budget = time_budget
+
+    def __call__(self, job):
+        return extract_job(job, self.backend, self.timeout, self.low_memory,
+                           self.time_budget)
+
+
+def extract_many(jobs, processes=None, chunksize=None, timeout=None,
+                 ordered=True, backend=None, low_memory=None,
+                 max_tasks_per_child=None, time_budget=None):
+    '''Extract ``jobs`` over a pool of ``processes`` workers and yield a
+    :class:`BatchResult` for each of them.
+
+    Jobs are dispatched ``chunksize`` at a time. With ``ordered`` results
+    come back in job order, otherwise as soon as they are ready. Each
+    document gets ``timeout`` seconds. Workers are replaced after
+    ``max_tasks_per_child`` jobs, which returns memory lost to
+    fragmentation. Documents past ``time_budget`` seconds finish in fast
+    mode instead of running into the ``timeout``. With a single process
+    everything runs in the calling process.
+    '''
+    if processes is None:
+        processes = settings.BATCH_PROCESSES or multiprocessing.cpu_count()
+    chunksize = chunksize or settings.BATCH_CHUNKSIZE
+    if timeout is None:
+        timeout = settings.BATCH_TIMEOUT
+    if max_tasks_per_child is None:
+        max_tasks_per_child = settings.BATCH_MAX_TASKS_PER_CHILD
+    worker = _Worker(backend, timeout, low_memory, time_budget)
+
+    if processes <= 1:
+        for job in jobs:
+            yield worker(job)
+        return
+
+    pool = multiprocessing.Pool(processes,
+                                maxtasksperchild=max_tasks_per_child)
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(worker, jobs, chunksize):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def fetched_jobs(urls, fetcher):
+    '''Download ``urls`` concurrently with ``fetcher`` and yield a job for
+    each response as soon as it arrives.
+    '''
+    for result in fetcher.fetch_many(urls):
+        yield Job(result.url, None, result.content, result.error,
+                  result.encoding)
+
+
+def extract_urls(urls, fetcher=None, **options):
+    '''Fetch and extract ``urls``; ``options`` go to :func:`extract_many`.
+
+    Downloads run on the fetcher's threads while the pool extracts the
+    pages that have already arrived.
+    '''
+    from lattr.fetch import Fetcher
+
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = Fetcher()
+    try:
+        options.setdefault('ordered', False)
+        for result in extract_many(fetched_jobs(urls, fetcher), **options):
+            yield result
+    finally:
+        if own_fetcher:
+            fetcher.close()
+
+
+def write_results(results, output):
+    '''Write ``results`` to ``output`` as JSON lines, returns the number of
+    failed documents.
+    '''
+    failures = 0
+    for result in results:
+        if result.error:
+            failures += 1
+        output.write(json.dumps(result._asdict()))
+        output.write('\n')
+    return failures
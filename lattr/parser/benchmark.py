@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Benchmark the extraction pipeline over a corpus of pages.
+
+The stage timings come from the :class:`lattr.log.Metrics` the parser
+records, so the report shows where the time goes::
+
+    clean     HTMLCleaner.clean
+    build     Document.__init__ (tree construction)
+    scan      pruning, text stats and paragraph scores
+    title     title lookup
+    top       link density and top candidate selection
+    siblings  sibling merge
+
+The corpus is a few generated pages (small, large and deeply nested) plus
+any files or directories given on the command line. Results are printed
+and can be saved as JSON and compared with an earlier run::
+
+    parser-bench --backend soup lxml --save before.json
+    parser-bench --backend soup lxml --compare before.json
+    parser-bench --backend lxml --scoring numpy --compare before.json
+'''
+
+import os
+import gc
+import sys
+import json
+import time
+import platform
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from lattr.log import Metrics, peak_rss_kb
+from lattr.parser.parser import HTMLCleaner, Document, SCORING_ENGINES
+
+
+STAGES = ('clean', 'build', 'scan', 'title', 'top', 'siblings')
+
+_PARAGRAPH = ('<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, '
+              'sed do eiusmod tempor incididunt ut labore et dolore magna '
+              'aliqua. Ut enim ad minim veniam, quis nostrud exercitation.</p>')
+_NAVIGATION = ('<div class="menu"><ul>%s</ul></div>' %
+               ''.join('<li><a href="/section/%d">Section %d</a></li>' %
+                       (i, i) for i in range(20)))
+_COMMENT = ('<div class="comment"><p class="author">reader</p>%s'
+            '<script>track("comment");</script></div>' % _PARAGRAPH)
+
+
+def _page(title, body):
+    return ('<!DOCTYPE html><html><head><title>%s</title>'
+            '<script>var analytics = {};</script></head>'
+            '<body>%s</body></html>' % (title, body))
+
+
+def generate_corpus():
+    '''Synthetic pages covering the shapes that stress the parser.'''
+    small = _page('Small article - Example',
+                  _NAVIGATION +
+                  '<div class="post"><h1>Small article</h1>%s</div>' %
+                  (_PARAGRAPH * 5))
+    large_body = [_NAVIGATION]
+    for section in range(200):
+        large_body.append('<div class="entry"><h2>Section %d</h2>%s</div>' %
+                          (section, _PARAGRAPH * 8))
+        large_body.append('<div class="sidebar">%s</div>' % _NAVIGATION)
+    large_body.append(_COMMENT * 300)
+    large = _page('Large article | Example', ''.join(large_body))
+    depth = 400
+    nested = _page('Deeply nested article',
+                   '<div class="wrapper">' * depth +
+                   (_PARAGRAPH * 3 + '<div class="content">') * 20 +
+                   '</div>' * (depth + 20))
+    return [('small', small), ('large', large), ('nested', nested)]
+
+
+def load_corpus(paths):
+    corpus = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.path.join(path, name)
+                           for name in os.listdir(path))
+        else:
+            names = [path]
+        for name in names:
+            if os.path.isfile(name):
+                with open(name, 'rb') as fp:
+                    corpus.append((os.path.basename(name), fp.read()))
+    return corpus
+
+
+def _run_stages(html, backend, scoring=None):
+    '''Run the pipeline once and return the wall time of each stage along
+    with the parsed document.
+    '''
+    metrics = Metrics()
+    HTMLCleaner().clean(html, metrics)
+    doc = Document(html, backend=backend, metrics=metrics, scoring=scoring)
+    doc.parse()
+    return metrics.durations, doc
+
+
+def _allocations(html, backend, scoring=None):
+    '''Memory allocated while extracting ``html`` once.
+
+    Uses tracemalloc when available (peak bytes and blocks held by the
+    parsed document); on older interpreters falls back to the number of
+    gc-tracked objects the parsed document holds.
+    '''
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            timings, doc = _run_stages(html, backend, scoring)
+            current, peak = tracemalloc.get_traced_memory()
+            blocks = sum(stat.count for stat in
+                         tracemalloc.take_snapshot().statistics('filename'))
+        finally:
+            tracemalloc.stop()
+        return {'peak_bytes': peak, 'blocks': blocks}
+    before = len(gc.get_objects())
+    timings, doc = _run_stages(html, backend, scoring)
+    return {'peak_bytes': None, 'objects': len(gc.get_objects()) - before}
+
+
+def benchmark(corpus, backend, repeat=5, scoring='python'):
+    '''Run every page of ``corpus`` ``repeat`` times and collect the
+    per-stage timings.
+    '''
+    documents = []
+    total = 0.0
+    for name, html in corpus:
+        runs = []
+        modes = []
+        for _ in range(repeat):
+            timings, doc = _run_stages(html, backend, scoring)
+            runs.append(timings)
+            modes.append(doc.mode)
+        stages = OrderedDict()
+        for stage in STAGES:
+            # A document out of its time budget skips the later stages
+            samples = [run.get(stage, 0.0) for run in runs]
+            stages[stage] = {'min': min(samples),
+                             'mean': sum(samples) / len(samples)}
+        elapsed = [sum(run.values()) for run in runs]
+        total += sum(elapsed)
+        documents.append(OrderedDict([
+            ('name', name),
+            ('bytes', len(html)),
+            ('modes', modes),
+            ('stages', stages),
+            ('total', {'min': min(elapsed),
+                       'mean': sum(elapsed) / len(elapsed)}),
+            ('memory', _allocations(html, backend, scoring)),
+        ]))
+    return OrderedDict([
+        ('backend', backend),
+        ('scoring', scoring),
+        ('repeat', repeat),
+        ('documents', documents),
+        ('docs_per_sec', len(corpus) * repeat / total if total else None),
+        ('peak_rss_kb', peak_rss_kb()),
+    ])
+
+
+def _format_report(result, baseline=None):
+    lines = ['backend %s, %s scoring: %.1f docs/sec, peak RSS %s KB' % (
+        result['backend'], result['scoring'], result['docs_per_sec'] or 0,
+        result['peak_rss_kb'])]
+    lines.append('%-12s %10s %-9s ' % ('document', 'bytes', 'mode') +
+                 ' '.join('%9s' % stage for stage in STAGES + ('total',)))
+    previous = {}
+    if baseline:
+        previous = dict((document['name'], document)
+                        for document in baseline['documents'])
+    for document in result['documents']:
+        times = [document['stages'][stage]['min'] for stage in STAGES]
+        times.append(document['total']['min'])
+        # Every mode the runs ended in, in order of first appearance
+        modes = []
+        for mode in document.get('modes', []):
+            if mode not in modes:
+                modes.append(mode)
+        lines.append('%-12s %10d %-9s ' % (document['name'][:12],
+                                           document['bytes'],
+                                           ','.join(modes)) +
+                     ' '.join('%8.2fms' % (t * 1000) for t in times))
+        old = previous.get(document['name'])
+        if old:
+            old_times = [old['stages'][stage]['min'] for stage in STAGES]
+            old_times.append(old['total']['min'])
+            lines.append('%-12s %10s %-9s ' % ('  vs before', '', '') +
+                         ' '.join('%8.2fx ' % (t / o if o else 0)
+                                  for t, o in zip(times, old_times)))
+    return '\n'.join(lines)
+
+
+def _define_options():
+    arg_parser = ArgumentParser(description='Benchmark lattr extraction')
+    arg_parser.add_argument('paths', nargs='*',
+                            help='extra HTML files or directories to include')
+    arg_parser.add_argument('-b', '--backend', dest='backends', nargs='+',
+                            default=['soup'], choices=('soup', 'lxml'),
+                            help='tree backends to benchmark')
+    arg_parser.add_argument('-s', '--scoring', dest='scoring',
+                            default='python', choices=SCORING_ENGINES,
+                            help='candidate scoring engine')
+    arg_parser.add_argument('-n', '--repeat', dest='repeat', type=int,
+                            default=5, help='runs per document')
+    arg_parser.add_argument('--no-generated', dest='generated',
+                            action='store_false',
+                            help='only use the pages given as arguments')
+    arg_parser.add_argument('--save', dest='save',
+                            help='write the results to this JSON file')
+    arg_parser.add_argument('--compare', dest='compare',
+                            help='JSON results of an earlier run to compare to')
+    return arg_parser
+
+
+def main(argv=None, output=None):
+    '''Run the benchmark command line, writing the reports to ``output``
+    (stdout by default).
+    '''
+    args = _define_options().parse_args(argv)
+    output = output or sys.stdout
+    corpus = load_corpus(args.paths)
+    if args.generated:
+        corpus = generate_corpus() + corpus
+    if not corpus:
+        print >>sys.stderr, 'Nothing to benchmark'
+        return 1
+
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as fp:
+            for result in json.load(fp)['results']:
+                # Runs saved before scoring engines were benchmarked
+                key = (result['backend'], result.get('scoring', 'python'))
+                baselines[key] = result
+
+    results = [benchmark(corpus, backend, args.repeat, args.scoring)
+               for backend in args.backends]
+    for result in results:
+        print >>output, _format_report(
+            result, baselines.get((result['backend'], result['scoring'])))
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump(OrderedDict([
+                ('python', platform.python_version()),
+                ('platform', platform.platform()),
+                ('timestamp', time.time()),
+                ('results', results),
+            ]), fp, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Incremental re-extraction of refreshed pages.
+
+A page downloaded again to pick up edits mostly keeps its layout, and its
+article mostly keeps its blocks. After a page has been scored, a
+fingerprint of it is remembered by URL. The fingerprint records the path
+to the content region, which is the parent of the top candidate. For each
+child of the region it records a digest of the child's subtree and what
+the child adds to the scoring.
+
+When the URL is parsed again with the very same bytes, the title and
+main content kept in the fingerprint are the result, and only the content
+is parsed. Otherwise only the region is pruned and measured:
+
+* If the region and every child have their old digests, the children
+  merged last time are the main content again, without any scoring.
+* Otherwise only the children with a new digest are scored. The others
+  keep their old scores, and the top candidate and its siblings are
+  picked from those.
+
+The rest of the page is not scored. It is assumed to keep losing to the
+region. A page whose region is gone, or whose top candidate is no longer
+a child of the region, is scored in full and remembered again, or
+forgotten when its top candidate is now the body::
+
+    fingerprints = FingerprintCache()
+    doc = Document(html, url=url, fingerprints=fingerprints)
+'''
+
+import hashlib
+from collections import namedtuple
+
+from lattr.conf import settings
+from lattr.lru import LRUCache
+from lattr.parser.templates import node_path, resolve_path
+
+
+# What a child of the content region adds to the scoring. ``score`` is its
+# own score as a candidate and ``best`` the best score of a candidate
+# under it, both after the link density scaling and None when there is
+# none. ``paragraph`` is what it gives the region as a paragraph and
+# ``half`` what its paragraphs give the region as their grandparent.
+# Everything comes from the child's subtree alone, so a child with the
+# same digest has the same state wherever it is.
+ChildState = namedtuple('ChildState', ['digest', 'score', 'best',
+                                       'paragraph', 'half'])
+
+class Fingerprint(namedtuple('Fingerprint', ['path', 'digest', 'children',
+                                             'merged', 'source', 'title',
+                                             'content'])):
+    '''``merged`` holds the positions of the children in the main content.
+    ``source`` is the :func:`source_digest` of the page, and ``title`` and
+    ``content`` the result extracted from it, as HTML.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, path, digest, children, merged, source=None,
+                title=None, content=None):
+        return super(Fingerprint, cls).__new__(cls, path, digest, children,
+                                               merged, source, title,
+                                               content)
+
+Snapshot = namedtuple('Snapshot', ['path', 'digest', 'children', 'states'])
+
+Refresh = namedtuple('Refresh', ['content', 'fingerprint', 'mode',
+                                 'rescored'])
+
+RefreshStats = namedtuple('RefreshStats',
+                          ['reused', 'rescored', 'misses', 'failures',
+                           'currsize', 'maxsize'])
+
+
+def source_digest(html, backend, encoding=None):
+    '''Digest of a page as it was downloaded, before it is parsed.'''
+    digest = hashlib.sha1('%s\0%s\0' % (backend, encoding or ''))
+    digest.update(html.encode('utf-8') if isinstance(html, unicode) else html)
+    return digest.digest()
+
+
+def _digest(tree, node):
+    return hashlib.sha1(tree.to_bytes(node)).digest()
+
+
+def _region_digest(tree, region):
+    # The region's own attributes and text count towards its score
+    digest = hashlib.sha1()
+    for value in [tree.get_id(region), tree.class_name(region)] + \
+            list(tree.strings(region)):
+        digest.update(value.encode('utf-8'))
+        digest.update('\0')
+    return digest.digest()
+
+
+def _descendants(tree, node):
+    '''The elements under ``node``, not ``node`` itself.'''
+    pending = list(tree.children(node))
+    while pending:
+        node = pending.pop()
+        yield node
+        pending.extend(tree.children(node))
+
+
+def _child_state(doc, child, candidates, digest=None):
+    tree = doc.tree
+    best = None
+    for node in _descendants(tree, child):
+        candidate = candidates.get(id(node))
+        if candidate is not None and (best is None or candidate.score > best):
+            best = candidate.score
+    half = None
+    for node in tree.children(child):
+        content_score = doc.paragraph_score(node)
+        if content_score is not None:
+            half = (half or 0) + content_score / 2
+    candidate = candidates.get(id(child))
+    return ChildState(digest or _digest(tree, child),
+                      candidate.score if candidate is not None else None,
+                      best, doc.paragraph_score(child),
+                      half)
+
+
+def _score_child(doc, child, digest):
+    '''State of a changed child, scoring its subtree alone.'''
+    candidates = doc.score_paragraphs(_descendants(doc.tree, child))
+    return _child_state(doc, child, candidates, digest)
+
+
+def snapshot(doc, top, candidates):
+    '''What the fingerprint of a scored page needs, taken before the
+    siblings of the ``top`` candidate are merged. None when the top
+    candidate is the body, which has no region.
+    '''
+    tree = doc.tree
+    region = tree.parent(top.node)
+    if region is None or tree.tag(top.node) == 'body':
+        return None
+    children = tree.children(region)
+    return Snapshot(node_path(tree, region), _region_digest(tree, region),
+                    children, tuple(_child_state(doc, child, candidates)
+                                    for child in children))
+
+
+def fingerprint(tree, snapshot, content):
+    '''Fingerprint of a page from its ``snapshot`` and main ``content``.'''
+    merged = tuple(position for position, child in
+                   enumerate(snapshot.children)
+                   if tree.parent(child) is content)
+    return Fingerprint(snapshot.path, snapshot.digest, snapshot.states,
+                       merged)
+
+
+def refresh(doc, fingerprint):
+    '''Main content of ``doc`` from the ``fingerprint`` of its previous
+    version, as a :class:`Refresh`. None when the page has to be scored in
+    full. The mode is 'reused' when the region is unchanged and
+    'incremental' when some of its children were scored again.
+    '''
+    tree = doc.tree
+    tree.ensure_body()
+    region = resolve_path(tree, fingerprint.path)
+    if region is None:
+        return None
+    doc.measure(region)
+    children = tree.children(region)
+    digests = [_digest(tree, child) for child in children]
+    region_digest = _region_digest(tree, region)
+    if (region_digest == fingerprint.digest and
+            digests == [state.digest for state in fingerprint.children]):
+        content = tree.new_container()
+        for position in fingerprint.merged:
+            tree.append(content, children[position])
+        return Refresh(content, fingerprint, 'reused', 0)
+
+    previous = dict((state.digest, state) for state in fingerprint.children)
+    states = []
+    rescored = 0
+    for child, digest in zip(children, digests):
+        state = previous.get(digest)
+        if state is None:
+            state = _score_child(doc, child, digest)
+            rescored += 1
+        states.append(state)
+
+    # The region is a candidate when it has paragraphs or grandparagraphs
+    points = ([state.paragraph for state in states
+               if state.paragraph is not None] +
+              [state.half for state in states if state.half is not None])
+    best = None
+    if points:
+        best = doc.candidate_score(region, sum(points))
+    # Ties go to the candidate first in the document: the region, then
+    # each child followed by the candidates under it
+    top = None
+    for position, state in enumerate(states):
+        if state.score is not None and (best is None or state.score > best):
+            best, top = state.score, position
+        if state.best is not None and (best is None or state.best > best):
+            best, top = state.best, None
+    if top is None or tree.tag(children[top]) == 'body':
+        return None
+
+    content = doc.merge_siblings(children[top],
+                                 [(child, state.score) for child, state
+                                  in zip(children, states)
+                                  if state.score is not None])
+    merged = tuple(position for position, child in enumerate(children)
+                   if tree.parent(child) is content)
+    return Refresh(content, Fingerprint(fingerprint.path, region_digest,
+                                        tuple(states), merged),
+                   'incremental', rescored)
+
+
+class FingerprintCache(object):
+    '''Fingerprints of the ``maxsize`` most recently parsed URLs.'''
+
+    def __init__(self, maxsize=None):
+        self._cache = LRUCache(maxsize or settings.INCREMENTAL_CACHE_SIZE)
+        self.reused = self.rescored = self.misses = self.failures = 0
+
+    def get(self, url):
+        fingerprint = self._cache.get(url)
+        if fingerprint is None:
+            self.misses += 1
+        return fingerprint
+
+    def learn(self, url, fingerprint):
+        self._cache.put(url, fingerprint)
+
+    def refreshed(self, mode):
+        '''Record a page found from its fingerprint in ``mode``.'''
+        if mode == 'reused':
+            self.reused += 1
+        else:
+            self.rescored += 1
+
+    def failed(self, url):
+        '''Record a page that had to be scored in full.'''
+        self.failures += 1
+
+    def forget(self, url):
+        self._cache.pop(url)
+
+    def info(self):
+        return RefreshStats(self.reused, self.rescored, self.misses,
+                            self.failures, len(self._cache),
+                            self._cache.maxsize)
+
+    def clear(self):
+        self._cache.clear()
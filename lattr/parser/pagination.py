@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Articles split over several pages.
+
+The links of a page are scored for how much they look like a link to the
+next page of the same article. The score comes from the link text ("next",
+"»", a page number), its class, id and rel, the classes of the elements
+around it, and whether its URL is the page's URL with a page number. This
+runs before pruning, which would drop most pagination blocks as unlikely
+candidates.
+
+:func:`assemble_pages` follows those links. When the first page links to
+its later pages by number, they are all fetched at once, so the article
+costs about as much as its slowest page instead of the sum of all pages.
+Pages without numbered links are followed one at a time. The number of
+pages is bounded, and so are loops: a URL that was already read, or a page
+whose content repeats an earlier one, ends the article.
+'''
+
+import re
+import hashlib
+from collections import namedtuple
+from urlparse import urljoin, urlsplit, urlunsplit, parse_qsl
+from urllib import urlencode
+
+from lattr.conf import settings
+from lattr.parser.parser import Document, Extraction
+
+
+Pagination = namedtuple('Pagination', ['next_url', 'numbered'])
+
+Assembly = namedtuple('Assembly', ['document', 'urls'])
+
+# Pages are numbered in the path (/page/2, -2, _2) or the query string
+_PAGE_SUFFIX = re.compile(r'(?:[/_\-](?:page|pg|p)?[/_\-]?\d{1,3})/?$',
+                          re.IGNORECASE)
+_PAGE_PARAMETERS = ('page', 'pg', 'p', 'pagenum', 'start', 'offset')
+_DIGIT = re.compile(r'\d')
+
+_NEXT = re.compile(ur'next|weiter|continue|>([^\|]|$)|\xbb([^\|]|$)',
+                   re.IGNORECASE)
+_PREVIOUS = re.compile(ur'prev|earl|old|new|<|\xab', re.IGNORECASE)
+_FIRST_LAST = re.compile(r'first|last', re.IGNORECASE)
+_EXTRANEOUS = re.compile(r'print|archive|comment|discuss|e[\-]?mail|share|'
+                         r'reply|all|login|sign|single', re.IGNORECASE)
+_PAGINATION = re.compile(r'pag(e|ing|inat)', re.IGNORECASE)
+_NEGATIVE = re.compile(r'combx|comment|contact|foot|footer|footnote|masthead|'
+                       r'media|meta|outbrain|promo|related|scroll|shoutbox|'
+                       r'sidebar|sponsor|shopping|tags|tool|widget',
+                       re.IGNORECASE)
+
+# Least score of a link taken as the next page
+NEXT_PAGE_SCORE = 50
+# Longest link text of a next page link
+MAXIMUM_LINK_TEXT = 25
+
+
+def normalize_url(url):
+    '''``url`` without its fragment and trailing slash.'''
+    scheme, netloc, path, query, _ = urlsplit(url)
+    return urlunsplit((scheme, netloc.lower(), path.rstrip('/'), query, ''))
+
+
+def base_url(url):
+    '''``url`` without a page number, the URL shared by all the pages.'''
+    scheme, netloc, path, query, _ = urlsplit(normalize_url(url))
+    query = urlencode([(name, value) for name, value in
+                       parse_qsl(query, keep_blank_values=True)
+                       if name.lower() not in _PAGE_PARAMETERS])
+    return urlunsplit((scheme, netloc, _PAGE_SUFFIX.sub('', path), query, ''))
+
+
+def page_number(url):
+    '''Number of the page at ``url``, 1 when it has none.'''
+    scheme, netloc, path, query, _ = urlsplit(normalize_url(url))
+    for name, value in parse_qsl(query):
+        if name.lower() in _PAGE_PARAMETERS and value.isdigit():
+            return int(value)
+    suffix = _PAGE_SUFFIX.search(path)
+    if suffix:
+        return int(re.search(r'\d+', suffix.group()).group())
+    return 1
+
+
+def _score_link(tree, link, text, href, base, number):
+    score = 0
+    if not href.startswith(base):
+        score -= 25
+    data = u' '.join((text, tree.class_name(link), tree.get_id(link),
+                      tree.attribute(link, 'rel') or u''))
+    if 'next' in (tree.attribute(link, 'rel') or u'').split():
+        score += 100
+    if _EXTRANEOUS.search(data):
+        score -= 25
+    if _NEXT.search(data):
+        score += 50
+    elif _FIRST_LAST.search(data):
+        score -= 65
+    if _PAGINATION.search(data):
+        score += 25
+    if _PREVIOUS.search(data):
+        score -= 200
+    positive = negative = False
+    parent = tree.parent(link)
+    while parent is not None and not (positive and negative):
+        parent_data = u'%s %s' % (tree.class_name(parent), tree.get_id(parent))
+        if not positive and _PAGINATION.search(parent_data):
+            positive = True
+            score += 25
+        if (not negative and _NEGATIVE.search(parent_data) and
+                'content' not in parent_data):
+            negative = True
+            score -= 25
+        parent = tree.parent(parent)
+    if text.isdigit():
+        linked = int(text)
+        score += -10 if linked == 1 else max(0, 10 - linked)
+        if linked == number + 1:
+            score += 25
+    return score
+
+
+def find_pagination(tree, url):
+    '''The next page link of the page at ``url`` and its links to pages
+    by number, as a :class:`Pagination`.
+    '''
+    current = normalize_url(url)
+    base = base_url(url)
+    number = page_number(url)
+    host = urlsplit(current).netloc
+    scores = {}
+    numbered = {}
+    for link in tree.find_all('a'):
+        href = tree.attribute(link, 'href')
+        if not href:
+            continue
+        href = normalize_url(urljoin(url, href.strip()))
+        if href in (current, base) or urlsplit(href).netloc != host:
+            continue
+        # A link to another page has a page number
+        if not _DIGIT.search(href[len(base):] if href.startswith(base)
+                             else href):
+            continue
+        text = tree.text(link).strip()
+        if len(text) > MAXIMUM_LINK_TEXT:
+            continue
+        score = _score_link(tree, link, text, href, base, number)
+        if score > scores.get(href, score - 1):
+            scores[href] = score
+        if text.isdigit() and int(text) > 1 and href.startswith(base):
+            numbered.setdefault(int(text), href)
+    next_url = None
+    if scores:
+        best = max(scores, key=scores.get)
+        if scores[best] >= NEXT_PAGE_SCORE:
+            next_url = best
+    return Pagination(next_url, [href for number, href in
+                                 sorted(numbered.iteritems())])
+
+
+def _text_hash(doc):
+    text = u''
+    if doc.main_content is not None:
+        text = doc._tree.text(doc.main_content)
+    return hashlib.sha1(u' '.join(text.split()).encode('utf-8')).digest()
+
+
+def _parse_page(html, url, backend, encoding=None):
+    doc = Document(html, backend=backend, url=url, find_next_page=True,
+                   encoding=encoding)
+    doc.parse()
+    return doc
+
+
+def _plan(pagination, seen):
+    '''URLs to fetch next: the next page, and when it is one of the
+    numbered pages, the numbered pages after it.
+    '''
+    next_url = pagination.next_url
+    if next_url is None or next_url in seen:
+        return []
+    urls = [next_url]
+    if next_url in pagination.numbered:
+        position = pagination.numbered.index(next_url)
+        urls.extend(url for url in pagination.numbered[position + 1:]
+                    if url not in seen)
+    return urls
+
+
+def _read_page(result, backend, seen, texts):
+    '''The parsed page of a download, or None when the article ends
+    before it.
+    '''
+    if result.error:
+        return None
+    url = result.final_url or result.url
+    # Past the last page some sites redirect to, or serve, an earlier one
+    if normalize_url(url) != result.url and normalize_url(url) in seen:
+        return None
+    doc = _parse_page(result.content, url, backend, result.encoding)
+    text = _text_hash(doc)
+    if text in texts:
+        return None
+    texts.add(text)
+    return doc
+
+
+def assemble_pages(url, html=None, fetcher=None, max_pages=None,
+                   backend=None):
+    '''Extract the article at ``url`` (whose first page is ``html``, or is
+    downloaded) with all its pages.
+
+    Returns an :class:`Assembly` of the first page's :class:`Document`,
+    whose main content holds the main content of every page in order, and
+    the URLs of the pages used. A page that fails to download ends the
+    article there.
+    '''
+    from lattr.fetch import Fetcher, FetchError
+
+    if max_pages is None:
+        max_pages = settings.MULTIPAGE_MAX_PAGES
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = Fetcher()
+    try:
+        seen = set([normalize_url(url)])
+        encoding = None
+        if html is None:
+            result = fetcher.fetch(url)
+            if result.error:
+                raise FetchError('%s: %s' % (url, result.error))
+            html, encoding = result.content, result.encoding
+            url = result.final_url or url
+        first = _parse_page(html, url, backend, encoding)
+        pages = [first]
+        seen.update((normalize_url(url), base_url(url)))
+        texts = set([_text_hash(first)])
+        planned = _plan(first.pagination, seen)
+        while planned and len(pages) < max_pages:
+            planned = planned[:max_pages - len(pages)]
+            seen.update(planned)
+            complete = True
+            for result in fetcher.fetch_many(planned, ordered=True):
+                doc = _read_page(result, backend, seen, texts)
+                if doc is None:
+                    complete = False
+                    break
+                pages.append(doc)
+            if not complete:
+                break
+            planned = _plan(pages[-1].pagination, seen)
+    finally:
+        if own_fetcher:
+            fetcher.close()
+
+    tree = first._tree
+    for doc in pages[1:]:
+        if doc.main_content is not None:
+            tree.append(first.main_content, doc.main_content)
+    return Assembly(first, [doc.url for doc in pages])
+
+
+def extract_pages(url, html=None, fetcher=None, max_pages=None,
+                  backend=None):
+    '''Title and main content as HTML of the article at ``url`` with all
+    its pages.
+    '''
+    doc = assemble_pages(url, html, fetcher, max_pages, backend).document
+    return Extraction(doc.title, doc.content_html(), doc.mode)
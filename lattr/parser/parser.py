@@ -4,23 +4,80 @@
 import re
 import sys
 import math
-from collections import deque as queue
-from argparse import ArgumentParser
+import time
+import logging
+from collections import namedtuple
 
-import requests
-from bs4 import BeautifulSoup, NavigableString, Tag
+from lattr import log
+from lattr.conf import settings
+from lattr.parser import incremental
+from lattr.parser.serializer import FORMATS, write_document
+from lattr.parser.source import read_file, sniff_encoding
+from lattr.parser.templates import (
+    Template, TemplateCache, node_path, node_signature, resolve_path)
+from lattr.parser.trees import get_backend
+from lattr.parser.weights import (
+    ClassWeightCache, RE_UNLIKELY_CANDIDATES, RE_POSITIVE_TAG, RE_NEGATIVE_TAG)
 
-def _dbg(msg):
-    print >>sys.stderr, msg
 
+logger = logging.getLogger(__name__)
 
-def _class_name(node):
-    if 'class' in node.attrs:
-        class_name = node['class']
-        if isinstance(class_name, basestring):
-            return class_name
-        return ' '.join(class_name)
-    return ''
+
+class _TextStats(object):
+    '''Text measurements of a subtree, as ``node.text`` would see it,
+    plus the preorder position of its root.
+
+    The record holds on to the node itself: lxml hands out proxy objects
+    that only keep their ``id()`` while something references them.
+    '''
+    __slots__ = ('node', 'index', 'text_length', 'comma_count', 'link_length')
+
+    def __init__(self, node, index):
+        self.node = node
+        self.index = index
+        self.text_length = 0
+        self.comma_count = 0
+        self.link_length = 0
+
+
+def _finish_text_stats(tree, table, node, stats):
+    '''Fold the stats of ``node``'s children and its own strings into
+    ``stats``. The children must already be in ``table``.
+    '''
+    for child in tree.children(node):
+        child_stats = table[id(child)]
+        stats.text_length += child_stats.text_length
+        stats.comma_count += child_stats.comma_count
+        stats.link_length += child_stats.link_length
+        if tree.tag(child) == 'a':
+            stats.link_length += child_stats.text_length
+    for string in tree.strings(node):
+        stats.text_length += len(string)
+        stats.comma_count += string.count(',')
+
+
+def _collect_text_stats(tree, root):
+    '''Compute text length, comma count and link text length for every
+    element under ``root`` in one bottom-up pass.
+
+    Returns a dict keyed by ``id(node)``. Only the strings ``Tag.text``
+    would include are counted, so comments and the like are skipped.
+    '''
+    table = {}
+    index = 0
+    pending = [(root, None)]
+    while pending:
+        node, stats = pending.pop()
+        if stats is None:
+            stats = _TextStats(node, index)
+            index += 1
+            pending.append((node, stats))
+            for child in reversed(tree.children(node)):
+                pending.append((child, None))
+            continue
+        _finish_text_stats(tree, table, node, stats)
+        table[id(node)] = stats
+    return table
 
 
 class Replacement(object):
@@ -37,72 +94,223 @@ class Replacement(object):
         return '%s:%s' % (self.desc, str(self.regex.findall(content)))
 
 
+class ScannedReplacement(Replacement):
+    """A replacement whose matches can only begin where ``start`` matches.
+
+    ``regex`` is tried once at each such place, and a place where it fails
+    skips the rest of the tag: a later start inside the same tag cannot
+    match either. It replaces what ``regex.sub`` would, but stays linear
+    on pages full of unterminated tags, where ``sub`` tries the whole rest
+    of the tag again from every ``<``.
+    """
+
+    def __init__(self, desc, regex, replacement, start):
+        Replacement.__init__(self, desc, regex, replacement)
+        self.start = start
+
+    def _skip(self, content, start):
+        # Where to look for the next start after a failed one, None to stop
+        end = content.find('>', start)
+        return end + 1 if end >= 0 else None
+
+    def finditer(self, content):
+        search = self.start.search
+        match_at = self.regex.match
+        position = 0
+        while True:
+            start = search(content, position)
+            if not start:
+                return
+            match = match_at(content, start.start())
+            if match:
+                yield match
+                position = match.end()
+            else:
+                position = self._skip(content, start.start())
+                if position is None:
+                    return
+
+    def apply(self, content):
+        pieces = []
+        position = 0
+        for match in self.finditer(content):
+            pieces.append(content[position:match.start()])
+            pieces.append(match.expand(self.replacement))
+            position = match.end()
+        pieces.append(content[position:])
+        return ''.join(pieces)
+
+    def dry_run(self, content):
+        # In the format of re.findall
+        found = []
+        for match in self.finditer(content):
+            groups = match.groups('')
+            if not groups:
+                groups = match.group()
+            elif len(groups) == 1:
+                groups = groups[0]
+            found.append(groups)
+        return '%s:%s' % (self.desc, str(found))
+
+
+class BlockReplacement(Replacement):
+    """Replaces everything from ``start`` up to the first ``>`` after the
+    next ``end``, like ``start.*?end[^>]*>``.
+
+    The end is found with a plain search rather than by extending the
+    match, and once no ``end`` followed by ``>`` comes after a ``start``,
+    none comes after the later ones either, so the page is read once
+    however many blocks are left open.
+    """
+
+    def __init__(self, desc, start, end, replacement, flags=0):
+        Replacement.__init__(self,
+                             desc,
+                             re.compile('%s.*?%s[^>]*>' % (start, end),
+                                        re.DOTALL | flags),
+                             replacement)
+        self.start = re.compile(start, flags)
+        self.end = re.compile(end, flags)
+
+    def spans(self, content):
+        position = 0
+        while True:
+            start = self.start.search(content, position)
+            if not start:
+                return
+            end = self.end.search(content, start.end())
+            if not end:
+                return
+            close = content.find('>', end.end())
+            if close < 0:
+                return
+            position = close + 1
+            yield start.start(), position
+
+    def apply(self, content):
+        pieces = []
+        position = 0
+        for start, end in self.spans(content):
+            pieces.append(content[position:start])
+            pieces.append(self.replacement)
+            position = end
+        pieces.append(content[position:])
+        return ''.join(pieces)
+
+    def dry_run(self, content):
+        found = [content[start:end] for start, end in self.spans(content)]
+        return '%s:%s' % (self.desc, str(found))
+
+
+# Runs of letters are matched one letter at a time below: ``[a-zA-Z]+``
+# followed by a class that also takes letters lets the regex engine split
+# the run every possible way before giving up.
 defined_replacements = [
-    Replacement('javascript',
-                re.compile('<script.*?</script[^>]*>', re.DOTALL | re.IGNORECASE),
-                replacement=''),
+    BlockReplacement('javascript',
+                     '<script', '</script',
+                     replacement='',
+                     flags=re.IGNORECASE),
     Replacement('double double-quoted attributes',
                 re.compile('(="[^"]+")"+'),
                 '\\1'),
-    Replacement('unclosed tags',
-                re.compile('(<[a-zA-Z]+[^>]*)(<[a-zA-Z]+[^<>]*>)'),
-                '\\1>\\2'),
-    Replacement('unclosed (numerical) attribute values',
-                re.compile('(<[^>]*[a-zA-Z]+\s*=\s*"[0-9]+)( [a-zA-Z]+="\w+"|/?>)'),
-                '\\1"\\2')
+    ScannedReplacement('unclosed tags',
+                       re.compile('(<[a-zA-Z][^>]*)(<[a-zA-Z][^<>]*>)'),
+                       '\\1>\\2',
+                       re.compile('<[a-zA-Z]')),
+    ScannedReplacement('unclosed (numerical) attribute values',
+                       re.compile('(<[^>]*[a-zA-Z]\s*=\s*"[0-9]+)'
+                                  '( [a-zA-Z]+="\w+"|/?>)'),
+                       '\\1"\\2',
+                       re.compile('<'))
 ]
 
 
-RE_UNLIKELY_CANDIDATES = re.compile(
-    'combx|comment|community|disqus|extra|foot|'
-    'header|menu|remark|rss|shoutbox|sidebar|'
-    'sponsor|ad-break|agegate|pagination|pager|'
-    'popup|tweet|twitter', re.I)
-RE_POSITIVE_TAG = re.compile(
-    'article|body|content|entry|hentry|post|text', re.I)
-RE_NEGATIVE_TAG = re.compile(
-    'combx|comment|contact|foot|footer|footnote|'
-    'link|media|meta|promo|related|scroll|shoutbox|sponsor|tags|widget', re.I)
+class HTMLCleaner(object):
+    """Repairs broken markup with ``replacements``, applied one after the
+    other so each repair sees the output of the previous one.
+    """
 
+    def __init__(self, replacements=None):
+        self.replacements = replacements or defined_replacements
 
-class HTMLCleaner(object):
-    def clean(self, html):
-        for replacement in defined_replacements:
+    def clean(self, html, metrics=None):
+        if metrics is None:
+            return self._apply(html)
+        started = time.time()
+        html = self._apply(html)
+        metrics.record('clean', started)
+        return html
+
+    def dry_run(self, html):
+        """Report what each replacement matches, in the text it is
+        applied to.
+        """
+        found = []
+        for replacement in self.replacements:
+            found.append(replacement.dry_run(html))
+            html = replacement.apply(html)
+        return found
+
+    def _apply(self, html):
+        for replacement in self.replacements:
             html = replacement.apply(html)
         return html
 
 
-class _HashableNode(object):
-    def __init__(self, node):
-        assert isinstance(node, Tag)
+class _Candidate(object):
+    '''Score record of a candidate node, keyed by ``id(node)``.'''
+    __slots__ = ('node', 'index', 'score', 'text_length', 'link_density')
+
+    def __init__(self, node, stats, score):
         self.node = node
-        self._hash = None
+        self.index = stats.index
+        self.score = score
+        # Filled in once the subtree has been fully measured
+        self.text_length = 0
+        self.link_density = 0
 
-    @property
-    def hash(self):
-        if not self._hash:
-            reverse_path = []
-            node = self.node
-            while node:
-                node_id = (node.name, tuple(node.attrs), node.string)
-                reverse_path.append(node_id)
-                node = node.parent
-            self._hash = abs(hash(tuple(reverse_path)))
-        return self._hash
-
-    def __repr__(self):
-        return '<%s@%s %s[id=%s,class=%s]>' % (
-            self.__class__.__name__,
-            self.hash,
-            self.node.name,
-            self.node.attrs.get('id') or '',
-            _class_name(self.node))
-
-    def __hash__(self):
-        return self.hash
-
-    def __eq__(self, other):
-        return self.hash == other.hash
+
+# Shared by every Document unless one is given a cache of its own
+default_class_weights = ClassWeightCache(settings.CLASS_WEIGHT_CACHE_SIZE)
+# Used by Documents given a url when settings.EXTRACTION_TEMPLATES is on
+default_templates = TemplateCache()
+# Used by Documents given a url when settings.INCREMENTAL_EXTRACTION is on
+default_fingerprints = incremental.FingerprintCache()
+
+SCORING_ENGINES = ('python', 'numpy')
+
+# Elements dropped with everything in them before scoring
+PRUNED_TAGS = frozenset(['script', 'style', 'noscript', 'iframe', 'svg'])
+
+# Elements never removed as unlikely candidates, whatever their class
+KEPT_TAGS = frozenset(['html', 'body'])
+
+# Nodes the scan visits between two looks at the clock
+BUDGET_CHECK_INTERVAL = 256
+
+
+class _BuildPruner(object):
+    '''``prune(tag, attrs)`` for the tree backends, dropping what
+    :meth:`Document._scan` would while the page is parsed. Counts what it
+    drops for the metrics.
+    '''
+
+    def __init__(self, verdict):
+        self.verdict = verdict
+        self.tags = self.unlikely = 0
+
+    def __call__(self, name, attrs):
+        if name in PRUNED_TAGS:
+            self.tags += 1
+            return True
+        # As the backends' class_name() and get_id() would read them
+        if name in KEPT_TAGS:
+            return False
+        class_name = u' '.join((attrs.get('class') or u'').split())
+        if self.verdict(class_name, attrs.get('id') or u'').unlikely:
+            self.unlikely += 1
+            return True
+        return False
 
 
 class Document(object):
@@ -111,233 +319,774 @@ class Document(object):
     MINIMUM_TITLE_LENGTH = 15
     NODE_TO_SCORE_MIN_LENGHT = 25
 
-    def __init__(self, html):
+    def __init__(self, html, backend=None, class_weights=None, metrics=None,
+                 low_memory=None, url=None, templates=None, scoring=None,
+                 time_budget=None, find_next_page=None, encoding=None,
+                 prune_while_parsing=None, fingerprints=None):
         if not html:
             raise RuntimeError('No html document specified for parser!')
+        if templates is None and settings.EXTRACTION_TEMPLATES:
+            templates = default_templates
+        if fingerprints is None and settings.INCREMENTAL_EXTRACTION:
+            fingerprints = default_fingerprints
+        if find_next_page is None:
+            find_next_page = settings.FIND_NEXT_PAGE
+        self._setup(backend, class_weights, metrics, low_memory, time_budget,
+                    scoring, url, templates, fingerprints, find_next_page)
         self.html = html
-        self._soup = BeautifulSoup(html, 'lxml')
+        # Bytes are parsed as they are, ``encoding`` being the charset they
+        # were served with
+        if not isinstance(html, unicode):
+            encoding = sniff_encoding(html, encoding)
+        self.encoding = encoding
+        if prune_while_parsing is None:
+            prune_while_parsing = settings.PRUNE_WHILE_PARSING
+        # find_pagination needs the pagination blocks, unlikely candidates
+        pruner = None
+        if prune_while_parsing and not self.find_next_page:
+            pruner = _BuildPruner(self._class_weights.verdict)
+        if self._fingerprints is not None:
+            self._previous = self._fingerprints.get(url)
+            self._source = incremental.source_digest(html, self.backend,
+                                                     encoding)
+            # Pagination comes from the whole page
+            self._unchanged = (self._previous is not None and
+                               self._previous.source == self._source and
+                               not self.find_next_page)
+        if self._unchanged:
+            # The page is the one seen last time, only its content is needed
+            html, encoding, pruner = self._previous.content, None, None
+        metrics = self.metrics
+        started = metrics and time.time()
+        self._tree = get_backend(self.backend)(html, encoding, pruner,
+                                               self._deadline)
+        # Only the part of the page built before the deadline is in the tree
+        self.truncated = self._tree.truncated
+        if metrics:
+            metrics.record('build', started)
+            if pruner is not None:
+                metrics.count('removed_scripts', pruner.tags)
+                metrics.count('removed_unlikely', pruner.unlikely)
+        if self.low_memory:
+            # Everything from here on works on the tree
+            self.html = None
+
+    def _setup(self, backend, class_weights, metrics, low_memory,
+               time_budget, scoring, url=None, templates=None,
+               fingerprints=None, find_next_page=False):
+        '''Settings and empty results shared by every kind of document,
+        before its tree is built.
+        '''
+        self._start_budget(time_budget)
+        if metrics is None and log.hooks_enabled():
+            metrics = log.Metrics()
+        if low_memory is None:
+            low_memory = settings.LOW_MEMORY
+        self.metrics = metrics
+        self.low_memory = low_memory
+        self.url = url
+        # Links are resolved against the url, so it is needed
+        self.find_next_page = find_next_page and bool(url)
+        self.pagination = None
+        self._templates = templates if url else None
+        self._fingerprints = fingerprints if url else None
+        self._previous = self._learned = self._source = None
+        self._unchanged = False
+        self.used_template = False
+        # How parse() found the main content: 'full', 'template', 'fast',
+        # or 'reused' and 'incremental' from the page's previous version
+        self.mode = None
+        self.html = None
+        self.backend = backend or settings.PARSER_BACKEND
+        self._class_weights = class_weights or default_class_weights
+        self._use_scoring(scoring)
         self.title = None
         self.main_content = None
+        self._text_stats = {}
+        self._node_table = None
+        self._title_nodes = (None, None, [])
 
     def parse(self):
-        # Remove these tags first
-        self._remove_tags('script')
         # TODO(jiluo): Remove css sheets
         # TODO(jiluo): Add body to body_cache
-        # TODO(jiluo): Find next page link
+        metrics = self.metrics
+        started = metrics and time.time()
+        if self.find_next_page:
+            # Before pruning, which drops most pagination blocks
+            from lattr.parser.pagination import find_pagination
+            self.pagination = find_pagination(self._tree, self.url)
+            if metrics:
+                started = metrics.record('pagination', started)
+        # A tree cut short at the deadline is only good for the fast mode
+        truncated = self._tree.truncated
+        if self._fingerprints is not None and not truncated:
+            self.main_content = self._refresh()
+        if self.main_content is not None:
+            if metrics:
+                metrics.record('refresh', started)
+        else:
+            if self._templates is not None and not truncated:
+                self.main_content = self._apply_template()
+                self.used_template = self.main_content is not None
+            if self.used_template:
+                self.mode = 'template'
+                self.title = self._parse_title()
+                if metrics:
+                    metrics.record('template', started)
+                    metrics.count('template_hits')
+            elif truncated or not self._parse_scored(metrics, started):
+                self._parse_fast()
+                if metrics:
+                    metrics.record('fast', started)
+                    metrics.count('budget_exceeded')
+        if self._learned is not None:
+            self._fingerprints.learn(self.url, self._learned._replace(
+                source=self._source, title=self.title,
+                content=self.content_html()))
+        if self.low_memory:
+            self._release()
+        if metrics:
+            metrics.emit()
+
+    def _use_scoring(self, scoring):
+        scoring = scoring or settings.SCORING_ENGINE
+        if scoring not in SCORING_ENGINES:
+            raise ValueError('Unknown scoring engine %r, expected one of %s' %
+                             (scoring, ', '.join(SCORING_ENGINES)))
+        self.scoring = scoring
+        self._vectorized = None
+        if scoring == 'numpy':
+            from lattr.parser import vectorized
+            if not vectorized.available():
+                raise ImportError("scoring='numpy' needs NumPy installed")
+            self._vectorized = vectorized
+
+    def _start_budget(self, time_budget):
+        if time_budget is None:
+            time_budget = settings.DOCUMENT_TIME_BUDGET
+        self.time_budget = time_budget
+        # Counted from here, so a slow tree build uses up the budget too
+        self._deadline = time.time() + time_budget if time_budget else None
+
+    def _out_of_time(self):
+        return self._deadline is not None and time.time() > self._deadline
+
+    def _parse_scored(self, metrics, started):
+        '''Find the main content by scoring the whole tree. Returns False
+        when the time budget runs out before the result is complete.
+        '''
+        if self._vectorized is None:
+            candidates = self._scan(deadline=self._deadline)
+        else:
+            # Scored after the scan, over the whole table at once
+            candidates = self._scan(score=False, deadline=self._deadline,
+                                    layout=True)
+        if candidates is None:
+            return False
+        if metrics:
+            started = metrics.record('scan', started)
+        self.title = self._parse_title()
+        if metrics:
+            started = metrics.record('title', started)
+        if self._out_of_time():
+            return False
+        # After we've calculated scores, loop through all of the possible
+        # candidate nodes we found and find the one with the highest score.
+        if self._vectorized is None:
+            top = self._find_top_candidate(candidates)
+        else:
+            candidates, top = self._score_vectorized()
+        if metrics:
+            started = metrics.record('top', started)
+        if self._out_of_time():
+            return False
+        learn = (self._templates is not None and
+                 self._tree.tag(top.node) != 'body')
+        if learn:
+            path = node_path(self._tree, top.node)
+        snapshot = None
+        if self._fingerprints is not None:
+            snapshot = incremental.snapshot(self, top, candidates)
+        self.main_content = self._merge_siblings(top, candidates)
+        if snapshot is not None:
+            # Learnt once the title is known, in parse()
+            self._learned = incremental.fingerprint(self._tree, snapshot,
+                                                    self.main_content)
+        elif self._fingerprints is not None:
+            # No region now, the old one would only fail again
+            self._fingerprints.forget(self.url)
+        if learn:
+            siblings = frozenset(node_signature(self._tree, sibling)
+                                 for sibling in
+                                 self._tree.children(self.main_content)
+                                 if sibling is not top.node)
+            self._templates.learn(self.url, Template(path, siblings))
+        if metrics:
+            metrics.record('siblings', started)
+        self.mode = 'full'
+        return True
+
+    def _parse_fast(self):
+        '''Main content by text density alone, for documents out of time:
+        the element whose paragraphs hold the most text, without link
+        density or siblings.
 
-        self._prepare_document()
+        The title comes from the title elements the scan got to. Looking
+        the others up would walk the whole tree again.
+        '''
+        tree = self._tree
+        body = tree.ensure_body()
+        title_by_id, title, h1_nodes = self._title_nodes
+        if title is None:
+            self._title_nodes = (title_by_id, tree.find('title'), h1_nodes)
         self.title = self._parse_title()
-        self.main_content = self._grab_main_content()
-
-    def _remove_tags(self, *tags):
-        for tag in tags:
-            for node in self._soup.find_all(tag):
-                node.extract()
-
-    def _walk_nodes(self, root):
-        pending = queue()
-        pending.append(root)
-        while len(pending):
-            node = pending.popleft()
-            if isinstance(node, Tag):
-                for child in node.children:
-                    pending.append(child)
-                yield node
-
-    def _prepare_document(self):
-        if not self._soup.body:
-            self._soup.html.append(self._soup.new_tag('body'))
-
-        self._soup.body.id = 'lattrBody'
+        lengths = {}
+        best = None
+        best_length = 0
+        for paragraph in tree.find_all('p'):
+            parent = tree.parent(paragraph)
+            if parent is None:
+                continue
+            entry = lengths.get(id(parent))
+            if entry is None:
+                # Holding the node keeps its id() for lxml
+                entry = lengths[id(parent)] = [parent, 0]
+            entry[1] += len(tree.text(paragraph))
+            if entry[1] > best_length:
+                best, best_length = parent, entry[1]
+        if best is None or best is body:
+            self.main_content = body
+        else:
+            self.main_content = tree.new_container()
+            tree.append(self.main_content, best)
+        self.mode = 'fast'
+
+    def _apply_template(self):
+        '''Main content found with the domain's template, or None when
+        there is no template or what it finds does not look like content.
+        Only the subtrees taken are pruned and measured.
+        '''
+        templates = self._templates
+        template = templates.get(self.url)
+        if template is None:
+            return None
+        tree = self._tree
+        tree.ensure_body()
+        node = resolve_path(tree, template.path)
+        if node is not None:
+            self._scan(node, score=False)
+            stats = self._text_stats[id(node)]
+            if not templates.accepts(stats.text_length,
+                                     self._link_density(node)):
+                node = None
+        if node is None:
+            templates.failed(self.url)
+            return None
+        templates.hit(self.url)
+        scanned = {id(node): self._title_nodes}
+        siblings = [sibling for sibling in tree.next_siblings(node)
+                    if node_signature(tree, sibling) in template.siblings]
+        for sibling in siblings:
+            self._scan(sibling, score=False)
+            scanned[id(sibling)] = self._title_nodes
+        # The title signals of the whole page, not only the subtrees taken
+        self._find_title_nodes(scanned)
+        output = tree.new_container()
+        for node in [node] + siblings:
+            tree.append(output, node)
+        return output
+
+    def _refresh(self):
+        '''Main content found from the fingerprint of the page's previous
+        version, or None when there is none or the page no longer fits it.
+        Only the content region is pruned and measured, and nothing at all
+        when the page has not changed.
+        '''
+        fingerprints = self._fingerprints
+        fingerprint = self._previous
+        if fingerprint is None:
+            return None
+        tree = self._tree
+        if self._unchanged:
+            # The tree holds the main content kept last time
+            fingerprints.refreshed('reused')
+            self.mode = 'reused'
+            self.title = fingerprint.title
+            return tree.children(tree.ensure_body())[0]
+        refresh = incremental.refresh(self, fingerprint)
+        if refresh is None:
+            fingerprints.failed(self.url)
+            return None
+        fingerprints.refreshed(refresh.mode)
+        self._learned = refresh.fingerprint
+        self.mode = refresh.mode
+        if self.metrics:
+            self.metrics.count('rescored_children', refresh.rescored)
+        # The title signals of the whole page, not only the region
+        self._find_title_nodes()
+        self.title = self._parse_title()
+        return refresh.content
+
+    def _release(self):
+        '''Keep the title and the main content, detached from the source
+        tree, and free everything else.
+        '''
+        self.main_content = self._tree.detach(self.main_content)
+        self._tree.release()
+        self._text_stats = {}
+        self._node_table = None
+        self._title_nodes = (None, None, [])
+
+    def content_html(self):
+        '''Serialize ``main_content`` to an HTML string.'''
+        if self.main_content is None:
+            return u''
+        return self._tree.to_html(self.main_content)
+
+    # Scoring of parts of the tree, for lattr.parser.incremental
+
+    @property
+    def tree(self):
+        '''The tree (see :mod:`lattr.parser.trees`) the page is parsed into.'''
+        return self._tree
+
+    def measure(self, root):
+        '''Clean the subtree at ``root`` and measure its text, without
+        scoring it.
+        '''
+        self._scan(root, score=False)
+
+    def paragraph_score(self, node):
+        '''Points a measured ``node`` gives its parent as a paragraph, None
+        when it is not one.
+        '''
+        return self._paragraph_score(node, self._text_stats[id(node)])
+
+    def score_paragraphs(self, nodes):
+        '''Candidates keyed by ``id(node)`` from the measured paragraphs in
+        ``nodes`` alone, their link density taken into account.
+        '''
+        candidates = {}
+        table = self._text_stats
+        for node in nodes:
+            self._score_paragraph(candidates, node, table[id(node)])
+        for candidate in candidates.itervalues():
+            candidate.score *= 1 - self._link_density(candidate.node)
+        return candidates
+
+    def candidate_score(self, node, points):
+        '''Score of ``node`` as a candidate given ``points`` by its
+        paragraphs.
+        '''
+        return ((self._score_node(node) + points) *
+                (1 - self._link_density(node)))
+
+    def merge_siblings(self, top, scores):
+        '''Main content made of the ``top`` node and the siblings it is
+        merged with, going by ``scores``, (node, score) pairs for ``top`` and
+        its siblings.
+        '''
+        candidates = {}
+        for node, score in scores:
+            self._candidate(candidates, node).score = score
+        return self._merge_siblings(candidates[id(top)], candidates)
+
+    def _describe(self, node):
+        return '%s[id=%s,class=%s]' % (self._tree.tag(node),
+                                       self._tree.get_id(node),
+                                       self._tree.class_name(node))
+
+    def _scan(self, root=None, score=True, deadline=None, layout=False):
+        '''Walk the tree (or the subtree at ``root``) once, depth first.
+
+        On the way down scripts, styles, embeds and unlikely candidates
+        (those the tree was not built without) are removed and the
+        title elements are noted; on the way up each node's text stats are
+        completed and paragraphs add their score to their parent and
+        grandparent, unless ``score`` is off. With ``layout`` the nodes are
+        also laid out for :mod:`lattr.parser.vectorized` in ``_node_table``.
+        Returns the candidates keyed by ``id(node)``, or None when the walk
+        is still going at ``deadline``.
+        '''
+        tree = self._tree
+        tree.ensure_body()
+
         # TODO(jiluo): Turn all double br's into p's
-        # TODO(jiluo): Note, this is pretty costly as far as processing goes.
-        #              Maybe optimize later
         # TODO(jiluo): Turn all relative urls into absolute urls
-        for node in self._walk_nodes(self._soup.html):
-            if not node.name:
-                node.extract()
+        if root is None:
+            root = tree.root
+        table = self._text_stats = {}
+        candidates = {}
+        verdict = self._class_weights.verdict
+        # Pruned subtrees are freed right away in low-memory mode
+        discard = tree.destroy if self.low_memory else tree.remove
+        title_by_id = title = None
+        h1_nodes = []
+        index = scripts = unlikely = 0
+        if layout:
+            tag_codes = self._vectorized.TAG_CODES
+            records = []
+            parents = []
+            tags = []
+        debug = logger.isEnabledFor(logging.DEBUG)
+        countdown = BUDGET_CHECK_INTERVAL
+        # Nodes with the preorder index of their parent
+        pending = [(root, None, -1)]
+        while pending:
+            if deadline is not None:
+                countdown -= 1
+                if not countdown:
+                    if time.time() > deadline:
+                        # The title elements seen so far, for the fast mode
+                        self._title_nodes = (title_by_id, title, h1_nodes)
+                        return None
+                    countdown = BUDGET_CHECK_INTERVAL
+            node, stats, parent = pending.pop()
+            if stats is not None:
+                _finish_text_stats(tree, table, node, stats)
+                if score:
+                    self._score_paragraph(candidates, node, stats)
+                continue
+
+            name = tree.tag(node)
+            node_id = tree.get_id(node)
+            if node is not root:
+                if name in PRUNED_TAGS:
+                    discard(node)
+                    scripts += 1
+                    continue
+                class_name = tree.class_name(node)
+                if (name not in KEPT_TAGS and
+                        verdict(class_name, node_id).unlikely):
+                    discard(node)
+                    unlikely += 1
+                    if debug:
+                        logger.debug('Remove unlikely candidate - %s%s',
+                                     node_id, class_name)
+                    continue
+
+            if title_by_id is None and node_id == 'title':
+                title_by_id = node
+            if name == 'title' and title is None:
+                title = node
+            elif name == 'h1':
+                h1_nodes.append(node)
+
+            stats = table[id(node)] = _TextStats(node, index)
+            if layout:
+                records.append(stats)
+                parents.append(parent)
+                tags.append(tag_codes.get(name, 0))
+            pending.append((node, stats, parent))
+            for child in reversed(tree.children(node)):
+                pending.append((child, None, index))
+            index += 1
+
+        self._title_nodes = (title_by_id, title, h1_nodes)
+        if layout:
+            self._node_table = self._vectorized.node_table(records, parents,
+                                                           tags)
+        if self.metrics:
+            self.metrics.count('nodes', index)
+            self.metrics.count('removed_scripts', scripts)
+            self.metrics.count('removed_unlikely', unlikely)
+            self.metrics.count('candidates', len(candidates))
+        return candidates
+
+    def _find_title_nodes(self, scanned=None):
+        '''Note the title elements of the whole tree in a single walk that
+        skips what ``_scan`` prunes, without removing anything. The
+        subtrees in ``scanned`` have been through ``_scan`` and bring the
+        title elements it noted for them, keyed by ``id()`` of their root.
+        '''
+        tree = self._tree
+        verdict = self._class_weights.verdict
+        scanned = scanned or {}
+        title_by_id = title = None
+        h1_nodes = []
+        pending = [tree.root]
+        while pending:
+            node = pending.pop()
+            found = scanned.get(id(node))
+            if found is not None:
+                found_by_id, found_title, found_h1_nodes = found
+                if title_by_id is None:
+                    title_by_id = found_by_id
+                if title is None:
+                    title = found_title
+                h1_nodes.extend(found_h1_nodes)
                 continue
-            id = node.attrs.get('id') or ''
-            class_name = _class_name(node) or ''
-            unlikely_match_string = '%s%s' % (id, class_name)
-            if RE_UNLIKELY_CANDIDATES.search(unlikely_match_string):
-                node.extract()
-                _dbg('Remove unlikely candidate - ' + unlikely_match_string)
+            name = tree.tag(node)
+            node_id = tree.get_id(node)
+            if name in PRUNED_TAGS:
+                continue
+            if (name not in KEPT_TAGS and
+                    verdict(tree.class_name(node), node_id).unlikely):
+                continue
+            if title_by_id is None and node_id == 'title':
+                title_by_id = node
+            if name == 'title' and title is None:
+                title = node
+            elif name == 'h1':
+                h1_nodes.append(node)
+            pending.extend(reversed(tree.children(node)))
+        self._title_nodes = (title_by_id, title, h1_nodes)
+
+    def _paragraph_score(self, node, stats):
+        '''Points ``node`` gives its parent as a paragraph, None when it is
+        not one. Its grandparent gets half.
+        '''
+        if self._tree.tag(node) not in ('p', 'td', 'pre', 'div'):
+            return None
+        if stats.text_length < self.NODE_TO_SCORE_MIN_LENGHT:
+            return None
+
+        # Add a point for the paragraph itself as a base.
+        content_score = 1
+
+        # Add points for any commas within this paragraph
+        content_score += stats.comma_count
+
+        # For every 100 characters in this paragraph, add another point.
+        # Up to 3 points.
+        content_score += min(math.floor(stats.text_length / 100), 3)
+        return content_score
+
+    def _score_paragraph(self, candidates, node, stats):
+        content_score = self._paragraph_score(node, stats)
+        if content_score is None:
+            return
+        tree = self._tree
+        parent_node = tree.parent(node)
+        if parent_node is None:
+            return
+        parent = self._candidate(candidates, parent_node)
+        grand_parent = None
+        grand_parent_node = tree.parent(parent_node)
+        if grand_parent_node is not None:
+            grand_parent = self._candidate(candidates, grand_parent_node)
+
+        # Add the score to the parent. The grandparent gets half.
+        parent.score += content_score
+        if grand_parent:
+            grand_parent.score += content_score / 2
 
     def _parse_title(self):
         current_title = original_title = ''
-        title_tag = self._soup.find(id='title')
-        if title_tag:
-            current_title = original_title = title_tag.text
-        elif self._soup.title:
-            current_title = original_title = self._soup.title.text
+        title_by_id, title_tag, h1tags = self._title_nodes
+        if title_by_id is not None:
+            title_tag = title_by_id
+        if title_tag is not None:
+            current_title = original_title = self._tree.text(title_tag)
         if re.search(r' [\|\-] ', current_title):
             current_title = re.sub(r'(.*) [\|\-] .*', r'\1', original_title)
         elif (len(current_title) < self.MINIMUM_TITLE_LENGTH or
               len(current_title) > self.MAXIMUM_TITLE_LENGTH):
-            h1tags = self._soup.find_all('h1')
             if h1tags and len(h1tags) == 1:
-                current_title = h1tags[0].text
+                current_title = self._tree.text(h1tags[0])
         return current_title
 
     def _score_node(self, node):
         content_score = self._class_weight(node)
-        if node.name == 'div':
+        name = self._tree.tag(node)
+        if name == 'div':
             content_score += 5
-        elif node.name in ('pre', 'td', 'blockquote'):
+        elif name in ('pre', 'td', 'blockquote'):
             content_score += 3
-        elif node.name in ('address', 'ol', 'ul', 'dl', 'dd', 'dt', 'li', 'form'):
+        elif name in ('address', 'ol', 'ul', 'dl', 'dd', 'dt', 'li', 'form'):
             content_score -= 3
-        elif node.name in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'th'):
+        elif name in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'th'):
             content_score -= 5
         return content_score
 
     def _class_weight(self, node):
-        weight = 0
-        class_name = _class_name(node)
-        if class_name:
-            if RE_POSITIVE_TAG.search(class_name):
-                weight += 25
-            if RE_NEGATIVE_TAG.search(class_name):
-                weight -= 25
-        id = node.attrs.get('id')
-        if id:
-            if RE_POSITIVE_TAG.search(id):
-                weight += 25
-            if RE_NEGATIVE_TAG.search(id):
-                weight -= 25
-        if node.name == 'article':
+        weight = self._class_weights.verdict(self._tree.class_name(node),
+                                             self._tree.get_id(node)).weight
+        if self._tree.tag(node) == 'article':
             weight += 50
         return weight
 
-    def _grab_main_content(self):
-        scores = {}
-        for node in self._walk_nodes(self._soup.html):
-            if node.name not in ('p', 'td', 'pre', 'div'):
-                continue
-            inner_text = node.text
-            if len(inner_text) < self.NODE_TO_SCORE_MIN_LENGHT:
-                continue
-            parent_node = node.parent
-            if not parent_node or not parent_node.name:
-                continue
-            parent_node_key = _HashableNode(parent_node)
-            if parent_node_key not in scores:
-                scores[parent_node_key] = self._score_node(parent_node)
-            grand_parent_node = parent_node.parent
-            grand_parent_node_key = None
-            if (grand_parent_node and
-                grand_parent_node.name and
-                grand_parent_node not in scores):
-                grand_parent_node_key = _HashableNode(grand_parent_node)
-                scores[grand_parent_node_key] = self._score_node(grand_parent_node)
-
-            # Add a point for the paragraph itself as a base.
-            content_score = 1
-
-            # Add points for any commas within this paragraph
-            content_score += inner_text.count(',')
-
-            # For every 100 characters in this paragraph, add another point.
-            # Up to 3 points.
-            content_score += min(math.floor(len(inner_text) / 100), 3)
-
-            # Add the score to the parent. The grandparent gets half.
-            scores[parent_node_key] = scores[parent_node_key] + content_score
-            if grand_parent_node_key:
-                scores[grand_parent_node_key] += content_score / 2
-
-        # After we've calculated scores, loop through all of the possible
-        # candidate nodes we found and find the one with the highest score.
-        top_candidate_key = self._find_top_candidate(scores)
-        top_candidate = top_candidate_key.node
+    def _merge_siblings(self, top, candidates):
+        tree = self._tree
+        top_candidate = top.node
 
         # Now that we have the top candidate, look through its siblings
         # for content that might also be related.
         # Things like preambles, content split by ads that we removed, etc.
-        sibling_score_threshold = max(10, scores[top_candidate_key] * 0.2)
+        sibling_score_threshold = max(10, top.score * 0.2)
 
-        top_candidate_class_name = _class_name(top_candidate)
-        if top_candidate.name == 'body':
+        top_candidate_class_name = tree.class_name(top_candidate)
+        siblings = tree.next_siblings(top_candidate)
+        if tree.tag(top_candidate) == 'body':
             output = top_candidate
         else:
-            output = self._soup.new_tag('div')
-            output.append(top_candidate)
-        for sibling in top_candidate.next_siblings:
-            if isinstance(sibling, NavigableString): continue
+            output = tree.new_container()
+            tree.append(output, top_candidate)
+        for sibling in siblings:
             append = False
             content_bonus = 0
             if (top_candidate_class_name and
-                _class_name(sibling) == top_candidate_class_name):
-                content_bonus = content_bonus + scores[top_candidate_key] * 0.2
-            sibling_key = _HashableNode(sibling)
-            if (sibling in scores and
-                (scores[sibling_key] + content_bonus) >= sibling_score_threshold):
+                tree.class_name(sibling) == top_candidate_class_name):
+                content_bonus = content_bonus + top.score * 0.2
+            candidate = candidates.get(id(sibling))
+            if (candidate and
+                (candidate.score + content_bonus) >= sibling_score_threshold):
                 append = True
             if append:
-                output.append(sibling)
-        if not output:
-            output.append(top_candidate)
+                tree.append(output, sibling)
         return output
 
-    def _find_top_candidate(self, scores):
+    def _candidate(self, candidates, node):
+        candidate = candidates.get(id(node))
+        if candidate is None:
+            candidate = _Candidate(node, self._text_stats[id(node)],
+                                   self._score_node(node))
+            candidates[id(node)] = candidate
+        return candidate
+
+    def _find_top_candidate(self, candidates):
         top_candidate = None
-        for candidate, score in scores.iteritems():
-            scores[candidate] *= (1 - self._link_density(candidate.node))
-            _dbg('Candidate: %s with score %d' % (candidate, scores[candidate]))
-            if not top_candidate or scores[candidate] > scores[top_candidate]:
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for candidate in candidates.itervalues():
+            stats = self._text_stats[id(candidate.node)]
+            candidate.text_length = stats.text_length
+            candidate.link_density = self._link_density(candidate.node)
+            candidate.score *= (1 - candidate.link_density)
+            if debug:
+                logger.debug('Candidate: %s with score %d',
+                             self._describe(candidate.node), candidate.score)
+            if (not top_candidate or
+                candidate.score > top_candidate.score or
+                (candidate.score == top_candidate.score and
+                 candidate.index < top_candidate.index)):
                 top_candidate = candidate
         if not top_candidate:
-            top_candidate = _HashableNode(self._soup.body)
-            scores[top_candidate] = 0
-        _dbg('top_candidate %s with score %d' % (top_candidate,
-                                                 scores[top_candidate]))
+            body = self._tree.body
+            stats = self._text_stats.get(id(body)) or _TextStats(body, 0)
+            top_candidate = _Candidate(body, stats, 0)
+            top_candidate.text_length = stats.text_length
+        if debug:
+            logger.debug('top_candidate %s with score %d',
+                         self._describe(top_candidate.node),
+                         top_candidate.score)
         return top_candidate
 
+    def _score_vectorized(self):
+        '''Score the scanned tree with :mod:`lattr.parser.vectorized`.
+        Returns the candidates and the top candidate ``_scan`` and
+        ``_find_top_candidate`` would have found.
+        '''
+        vectorized = self._vectorized
+        table = self._text_stats
+        nodes = self._node_table
+        indexes, scores = vectorized.score(nodes, self._class_weight,
+                                           self.NODE_TO_SCORE_MIN_LENGHT)
+        if self.metrics:
+            self.metrics.count('candidates', len(indexes))
+        if not len(indexes):
+            return {}, self._find_top_candidate({})
+        candidates = {}
+        for index, score in zip(indexes.tolist(), scores.tolist()):
+            node = nodes.nodes[index]
+            candidate = _Candidate(node, table[id(node)], score)
+            candidate.text_length = table[id(node)].text_length
+            candidate.link_density = self._link_density(node)
+            candidates[id(node)] = candidate
+        # argmax takes the first of equal scores, the earliest in preorder
+        top = candidates[id(nodes.nodes[indexes[scores.argmax()]])]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('top_candidate %s with score %d',
+                         self._describe(top.node), top.score)
+        return candidates, top
+
     def _link_density(self, node):
         '''Get the density of links as a percentage of the content.
         This is the amount of text that is inside a link
         divided by the total text in the node.
         '''
-        links = node.find_all('a')
-        if links:
-            link_length = reduce(lambda accum, x: accum + len(x.text), links, 0.0)
-            return link_length / len(node.text)
+        stats = self._text_stats.get(id(node))
+        if stats is None:
+            stats = _collect_text_stats(self._tree, node)[id(node)]
+        if stats.link_length and stats.text_length:
+            return float(stats.link_length) / stats.text_length
         return 0
 
 
-def _wrap_content(title, content_node, wrap):
-    if wrap:
-        doc = BeautifulSoup(
-            '''
-            <html>
-                <head>
-                    <title><title/>
-                </head>
-                <body></body>
-            </html>''')
-        doc.title.append(doc.new_string(title))
-        doc.body.append(content_node)
-        return doc
-    else:
-        return content_node
+class Extraction(namedtuple('Extraction', ['title', 'content', 'mode'])):
+    '''Title and main content as HTML, and the :attr:`Document.mode`
+    that found them: 'fast' when the document ran out of its time budget.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, title, content, mode=None):
+        return super(Extraction, cls).__new__(cls, title, content, mode)
+
+
+def extract(html, backend=None, scoring=None, time_budget=None,
+            encoding=None):
+    '''Parse ``html`` and return its title and main content as HTML.'''
+    doc = Document(html, backend=backend, scoring=scoring,
+                   time_budget=time_budget, encoding=encoding)
+    doc.parse()
+    return Extraction(doc.title, doc.content_html(), doc.mode)
 
 
 def _read_html(args):
+    '''The page to extract as raw bytes and the charset it was served
+    with, if any.
+    '''
     if args.url:
-        return requests.get(args.url).text
+        from lattr.fetch import Fetcher
+
+        with Fetcher() as fetcher:
+            result = fetcher.fetch(args.url)
+        if result.error:
+            raise RuntimeError('Failed to fetch %s: %s' % (args.url,
+                                                          result.error))
+        return result.content, result.encoding
 
     if args.file:
         if args.file == '-':
-            return sys.stdin.read()
+            return sys.stdin.read(), None
         else:
-            with open(args.file, 'rb') as fp:
-                return fp.read()
-    return ''
+            return read_file(args.file), None
+    return '', None
+
+
+def _stream_html(args):
+    from lattr.parser.streaming import iter_file
+
+    if args.url:
+        from lattr.fetch import Fetcher
+
+        with Fetcher() as fetcher:
+            for chunk in fetcher.stream(args.url):
+                yield chunk
+    elif args.file == '-':
+        for chunk in iter_file(sys.stdin):
+            yield chunk
+    else:
+        with open(args.file, 'rb') as fp:
+            for chunk in iter_file(fp):
+                yield chunk
+
+
+def _open_document(args):
+    if args.stream:
+        from lattr.parser.streaming import StreamingDocument
+        return StreamingDocument(_stream_html(args),
+                                 byte_budget=args.byte_budget,
+                                 low_memory=args.low_memory,
+                                 time_budget=args.time_budget)
+    html, encoding = _read_html(args)
+    return Document(html, backend=args.backend, low_memory=args.low_memory,
+                    scoring=args.scoring, time_budget=args.time_budget,
+                    encoding=encoding)
 
 
 def _define_options():
+    from argparse import ArgumentParser
+
     arg_parser = ArgumentParser()
     group = arg_parser.add_mutually_exclusive_group()
     group.add_argument('-f', '--file', dest='file',
@@ -345,32 +1094,124 @@ def _define_options():
                              'if file is "-", means read from stdin'))
     group.add_argument('-u', '--url', dest='url',
                        help='use URL instead of a local file')
+    group.add_argument('--batch', dest='batch',
+                       help=('extract many documents: a directory, a glob, '
+                             'a .jsonl file or "-" for JSONL on stdin; '
+                             'results are written as JSON lines'))
     arg_parser.add_argument('-o', '--output', dest='output',
                             help='write main content to output file')
     arg_parser.add_argument('-w', dest='wrap_content', action='store_true',
                             help='wrap the main content in <html> tag')
+    arg_parser.add_argument('--format', dest='format', choices=FORMATS,
+                            help=('write only the result in this format: a '
+                                  'wrapped html page, the bare html '
+                                  'fragment, plain text or json'))
+    arg_parser.add_argument('-b', '--backend', dest='backend',
+                            choices=('soup', 'lxml'),
+                            help=('tree backend used for extraction, '
+                                  'defaults to settings.PARSER_BACKEND'))
+    arg_parser.add_argument('--scoring', dest='scoring',
+                            choices=SCORING_ENGINES,
+                            help=('candidate scoring, numpy needs NumPy; '
+                                  'defaults to settings.SCORING_ENGINE'))
+    arg_parser.add_argument('--all-pages', dest='all_pages',
+                            action='store_true',
+                            help=('with --url, follow the next page links '
+                                  'and join the pages of the article'))
+    arg_parser.add_argument('--stream', dest='stream', action='store_true',
+                            help=('parse while reading the input, '
+                                  'always uses the lxml backend'))
+    arg_parser.add_argument('--max-bytes', dest='byte_budget', type=int,
+                            help=('with --stream, ignore the input after '
+                                  'this many bytes'))
+    arg_parser.add_argument('--low-memory', dest='low_memory',
+                            action='store_true', default=None,
+                            help=('free pruned subtrees and the source tree '
+                                  'as soon as they are no longer needed'))
+    arg_parser.add_argument('--time-budget', dest='time_budget',
+                            type=float,
+                            help=('seconds a document may take before a fast '
+                                  'fallback picks its content, defaults to '
+                                  'settings.DOCUMENT_TIME_BUDGET'))
+    arg_parser.add_argument('--log-config', dest='log_config',
+                            help='logging config file, see etc/logging.cfg')
+    arg_parser.add_argument('--metrics', dest='metrics', action='store_true',
+                            help=('log stage timings and node counts to the '
+                                  'lattr.metrics logger'))
+    batch_group = arg_parser.add_argument_group('batch mode')
+    batch_group.add_argument('-j', '--jobs', dest='jobs', type=int,
+                             help='worker processes, defaults to one per CPU')
+    batch_group.add_argument('--chunksize', dest='chunksize', type=int,
+                             help='documents sent to a worker at a time')
+    batch_group.add_argument('--timeout', dest='timeout', type=float,
+                             help='seconds allowed per document')
+    batch_group.add_argument('--unordered', dest='ordered',
+                             action='store_false',
+                             help='write results as soon as they are ready')
+    batch_group.add_argument('--max-tasks-per-child',
+                             dest='max_tasks_per_child', type=int,
+                             help='documents a worker extracts before it is '
+                                  'replaced')
     return arg_parser
 
 
+def _run_batch(args):
+    from lattr.parser import batch
+
+    results = batch.extract_many(batch.iter_jobs(args.batch),
+                                 processes=args.jobs,
+                                 chunksize=args.chunksize,
+                                 timeout=args.timeout,
+                                 ordered=args.ordered,
+                                 backend=args.backend,
+                                 low_memory=args.low_memory,
+                                 max_tasks_per_child=args.max_tasks_per_child,
+                                 time_budget=args.time_budget)
+    if args.output:
+        with open(args.output, 'wb') as fp:
+            failures = batch.write_results(results, fp)
+    else:
+        failures = batch.write_results(results, sys.stdout)
+    return failures
+
+
 def main():
     arg_parser = _define_options()
     args = arg_parser.parse_args()
+    if args.log_config:
+        log.configure(args.log_config)
+    if args.metrics:
+        if not args.log_config:
+            logging.basicConfig()
+            log.metrics_logger.setLevel(logging.INFO)
+        log.add_hook(log.log_metrics)
+    if args.batch:
+        exit(1 if _run_batch(args) else 0)
     if not (args.file or args.url):
         arg_parser.print_help()
         exit(1)
 
-    doc = Document(_read_html(args))
-    doc.parse()
-    print 'Title: %s' % doc.title
+    if args.all_pages and args.url:
+        from lattr.parser.pagination import assemble_pages
+        doc = assemble_pages(args.url, backend=args.backend).document
+    else:
+        doc = _open_document(args)
+        doc.parse()
+    report = args.format is None
+    if report:
+        print 'Title: %s' % doc.title.encode('utf-8')
 
-    main_content = str(_wrap_content(doc.title,
-                                     doc.main_content,
-                                     args.wrap_content))
+    output_format = args.format or ('html' if args.wrap_content
+                                    else 'fragment')
     if args.output:
         with open(args.output, 'wb') as fp:
-            fp.write(main_content)
+            write_document(fp, doc, output_format)
     else:
-        print 'Main content: %s' % main_content
+        if report:
+            sys.stdout.write('Main content: ')
+        write_document(sys.stdout, doc, output_format)
+        if report:
+            sys.stdout.write('\n')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Write an extraction result straight to a byte stream.
+
+Formats:
+
+    html      a complete page with the title and the main content
+    fragment  the main content alone
+    text      the title and the text of the main content
+    json      {"title": ..., "content": ...} with the content as HTML
+
+The main content is serialized by the tree backend, with lxml's own
+serializer for the lxml backend. The parts around it are written as they
+are, without building a wrapper document.
+'''
+
+import json
+
+
+FORMATS = ('html', 'fragment', 'text', 'json')
+
+_PAGE_START = ('<!DOCTYPE html>\n<html><head><meta charset="%s">'
+               '<title>%s</title></head><body>')
+_PAGE_END = '</body></html>\n'
+
+
+def _escape(text):
+    return (text.replace(u'&', u'&amp;').replace(u'<', u'&lt;')
+            .replace(u'>', u'&gt;'))
+
+
+def write(stream, title, content, tree, format='fragment', encoding='utf-8'):
+    '''Write ``title`` and the ``content`` node of ``tree`` to ``stream``
+    in ``format``.
+    '''
+    title = title or u''
+    if format == 'html':
+        stream.write(_PAGE_START % (encoding, _escape(title).encode(encoding)))
+        if content is not None:
+            stream.write(tree.to_bytes(content, encoding))
+        stream.write(_PAGE_END)
+    elif format == 'fragment':
+        if content is not None:
+            stream.write(tree.to_bytes(content, encoding))
+    elif format == 'text':
+        stream.write(title.encode(encoding))
+        stream.write('\n\n')
+        if content is not None:
+            stream.write(tree.text(content).strip().encode(encoding))
+        stream.write('\n')
+    elif format == 'json':
+        html = tree.to_html(content) if content is not None else u''
+        stream.write('{"title": %s, "content": %s}\n' % (json.dumps(title),
+                                                          json.dumps(html)))
+    else:
+        raise ValueError('Unknown output format %r, expected one of %s' %
+                         (format, ', '.join(FORMATS)))
+
+
+def write_document(stream, doc, format='fragment', encoding='utf-8'):
+    '''Write a parsed :class:`lattr.parser.Document` to ``stream``.'''
+    write(stream, doc.title, doc.main_content, doc._tree, format, encoding)
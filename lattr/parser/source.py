@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Raw HTML input.
+
+Pages go to the tree backends as the bytes they were read as. Decoding
+them first only for the parser to encode them again costs a copy of the
+page, and with lxml a round trip through UTF-8. The charset comes from, in
+order, a byte order mark, the charset the page was served with and a
+``<meta>`` declaration near the start of the page. Without any of them the
+parser sniffs it itself.
+
+Large local files are memory-mapped instead of read, so the page is not
+copied into a string before the parser reads it.
+'''
+
+import os
+import re
+import mmap
+import codecs
+
+from lattr.conf import settings
+
+
+# Bytes searched for a <meta> charset declaration
+SNIFF_SIZE = 4096
+
+_BOMS = ((codecs.BOM_UTF8, 'utf-8'),
+         (codecs.BOM_UTF16_LE, 'utf-16le'),
+         (codecs.BOM_UTF16_BE, 'utf-16be'))
+
+# Both <meta charset="..."> and <meta http-equiv="Content-Type"
+# content="text/html; charset=...">
+_META_CHARSET = re.compile(r'<meta\s[^>]*?charset\s*=\s*["\']?\s*([\w.:+-]+)',
+                           re.IGNORECASE)
+
+
+def _known(label):
+    # The lower cased label, or None when Python has no codec for it
+    if not label:
+        return None
+    label = label.strip().strip('"\'').lower()
+    try:
+        codecs.lookup(label)
+    except LookupError:
+        return None
+    return label
+
+
+def sniff_encoding(html, declared=None):
+    '''Charset of the bytes ``html`` (a string or an ``mmap``) served with
+    the charset ``declared``, or None to leave it to the parser.
+    '''
+    head = html[:SNIFF_SIZE]
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    encoding = _known(declared)
+    if encoding is None:
+        meta = _META_CHARSET.search(head)
+        if meta:
+            encoding = _known(meta.group(1))
+            # A declaration that could be read as ASCII is not UTF-16
+            if encoding and encoding.startswith('utf-16'):
+                encoding = 'utf-8'
+    return encoding
+
+
+def read_file(path, mmap_size=None):
+    '''Contents of the file at ``path``: its bytes, or a read-only ``mmap``
+    of it when it has at least ``mmap_size`` bytes.
+    '''
+    if mmap_size is None:
+        mmap_size = settings.MMAP_MIN_SIZE
+    with open(path, 'rb') as fp:
+        if mmap_size and os.fstat(fp.fileno()).st_size >= mmap_size:
+            # The mapping stays valid once the file is closed
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return fp.read()
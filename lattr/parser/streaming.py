@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Extract a page while it is still being read.
+
+:class:`StreamingDocument` feeds chunks of HTML, from a file or an HTTP
+response, to lxml's incremental parser. It does the work of
+``Document._scan`` as the parse events arrive. Scripts and unlikely
+candidates are dropped as soon as they close. Text stats are folded
+together as elements close, and paragraphs are scored right away. When
+the input ends, or ``byte_budget`` bytes have been read, the elements
+still open are closed. Then the usual title, top candidate and sibling
+passes run over the lxml tree::
+
+    with open(path, 'rb') as fp:
+        doc = StreamingDocument(iter_file(fp), byte_budget=512 * 1024)
+        doc.parse()
+'''
+
+import lxml.html
+from lxml import etree
+
+from lattr.conf import settings
+from lattr.parser.parser import (KEPT_TAGS, PRUNED_TAGS, Document,
+                                 Extraction, _TextStats, _finish_text_stats)
+from lattr.parser.trees import LxmlTree
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_file(fp, chunk_size=CHUNK_SIZE):
+    '''Read ``fp`` in chunks of ``chunk_size``.'''
+    return iter(lambda: fp.read(chunk_size), '')
+
+
+def _tag_aligned(chunks):
+    # libxml2's push parser can miss a ``</script>`` split across two feeds
+    # and swallow the rest of the page as script text, so only ever feed
+    # up to the last ``>`` seen.
+    pending = ''
+    for chunk in chunks:
+        pending += chunk
+        cut = pending.rfind('>') + 1
+        if cut:
+            yield pending[:cut]
+            pending = pending[cut:]
+    if pending:
+        yield pending
+
+
+class StreamingDocument(Document):
+    '''A :class:`Document` parsed from an iterable of HTML chunks.
+
+    Chunks may be bytes, decoded with ``encoding`` or sniffed by libxml2,
+    or unicode. Always uses the lxml backend. After parsing,
+    ``bytes_read`` tells how much input was used and ``truncated``
+    whether the byte budget or the time budget cut it short.
+    '''
+
+    def __init__(self, chunks, byte_budget=None, encoding=None,
+                 class_weights=None, metrics=None, low_memory=None,
+                 time_budget=None):
+        # Paragraphs are scored as the parse events come in
+        self._setup(LxmlTree.name, class_weights, metrics, low_memory,
+                    time_budget, 'python')
+        self._chunks = chunks
+        if byte_budget is None:
+            byte_budget = settings.STREAMING_BYTE_BUDGET
+        self.byte_budget = byte_budget
+        self.encoding = encoding
+        self.bytes_read = 0
+        self.truncated = False
+        self._tree = LxmlTree.from_document(None)
+
+    def _read(self):
+        budget = self.byte_budget
+        try:
+            for chunk in self._chunks:
+                if budget is not None and self.bytes_read + len(chunk) > budget:
+                    chunk = chunk[:budget - self.bytes_read]
+                    self.truncated = True
+                self.bytes_read += len(chunk)
+                if chunk:
+                    yield chunk
+                if self.truncated:
+                    break
+                if self._out_of_time():
+                    # Parse what has arrived, parse() goes on in fast mode
+                    self.truncated = True
+                    break
+        finally:
+            # Let a download stop as soon as we have read enough
+            close = getattr(self._chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def _events(self):
+        try:
+            parser = etree.HTMLPullParser(events=('start', 'end'),
+                                          encoding=self.encoding)
+        except LookupError:
+            # A charset Python knows but libxml2 does not, let it sniff
+            parser = etree.HTMLPullParser(events=('start', 'end'))
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+        for chunk in _tag_aligned(self._read()):
+            parser.feed(chunk)
+            for event in parser.read_events():
+                yield event
+        self._tree.document = parser.close()
+        for event in parser.read_events():
+            yield event
+
+    def _scan(self, deadline=None):
+        '''Parse the input, doing the work of ``Document._scan`` on the parse
+        events: a node is pruned or noted when it opens and its stats are
+        completed and scored when it closes. Reading stops at the
+        ``deadline``.
+        '''
+        tree = self._tree
+        table = self._text_stats = {}
+        candidates = {}
+        verdict = self._class_weights.verdict
+        title_by_id = title = None
+        h1_nodes = []
+        index = scripts = unlikely = 0
+        # Root of the subtree being dropped, skipped until it closes
+        dropped = None
+        removed = []
+        for event, node in self._events():
+            if dropped is not None:
+                if event == 'end' and node is dropped:
+                    # Unlinking the element mid-parse crashes libxml2 and
+                    # clearing its text makes it drop the whitespace that
+                    # follows, so only the children are freed here. It is
+                    # unlinked after parsing and counts as empty until then.
+                    del node[:]
+                    table[id(node)] = _TextStats(node, -1)
+                    removed.append(node)
+                    dropped = None
+                continue
+            if event == 'end':
+                stats = table[id(node)]
+                _finish_text_stats(tree, table, node, stats)
+                self._score_paragraph(candidates, node, stats)
+                continue
+
+            name = tree.tag(node)
+            node_id = tree.get_id(node)
+            if index:
+                if name in PRUNED_TAGS:
+                    dropped = node
+                    scripts += 1
+                    continue
+                if (name not in KEPT_TAGS and
+                        verdict(tree.class_name(node), node_id).unlikely):
+                    dropped = node
+                    unlikely += 1
+                    continue
+
+            if title_by_id is None and node_id == 'title':
+                title_by_id = node
+            if name == 'title' and title is None:
+                title = node
+            elif name == 'h1':
+                h1_nodes.append(node)
+            table[id(node)] = _TextStats(node, index)
+            index += 1
+
+        for node in removed:
+            tree.remove(node)
+            del table[id(node)]
+        body = tree.ensure_body()
+        if id(body) not in table:
+            table[id(body)] = _TextStats(body, index)
+        self._title_nodes = (title_by_id, title, h1_nodes)
+        if self.metrics:
+            self.metrics.count('nodes', index)
+            self.metrics.count('removed_scripts', scripts)
+            self.metrics.count('removed_unlikely', unlikely)
+            self.metrics.count('candidates', len(candidates))
+            self.metrics.count('bytes_read', self.bytes_read)
+        return candidates
+
+
+def extract_stream(chunks, byte_budget=None, encoding=None):
+    '''Parse the HTML in ``chunks`` and return its title and main content.'''
+    doc = StreamingDocument(chunks, byte_budget=byte_budget,
+                            encoding=encoding)
+    doc.parse()
+    return Extraction(doc.title, doc.content_html(), doc.mode)
+
+
+def extract_url(url, fetcher=None, byte_budget=None):
+    '''Download and extract ``url``, parsing the body as it arrives.'''
+    from lattr.fetch import Fetcher
+
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = Fetcher()
+    try:
+        body = fetcher.open(url)
+        return extract_stream(body.chunks, byte_budget=byte_budget,
+                              encoding=body.encoding)
+    finally:
+        if own_fetcher:
+            fetcher.close()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Per-domain extraction templates.
+
+Pages of one site mostly share a layout. After a page has been scored,
+the path to its top candidate is remembered for the site. Each step of the
+path is a tag, id and class, with the position among same-looking
+siblings. The look of the siblings merged with the candidate is
+remembered too. The next page of the site tries that path first. Only
+the subtree found there is pruned and measured. If it has enough text and
+not too many links, it becomes the main content without scoring the page.
+
+Digits in ids and classes are ignored (``post-1234`` matches
+``post-98``). A template whose validation keeps failing is dropped. So is
+one that full scoring no longer agrees with, because the layout changed.
+'''
+
+import re
+from collections import namedtuple
+from urlparse import urlparse
+
+from lattr.conf import settings
+from lattr.lru import LRUCache
+
+
+Template = namedtuple('Template', ['path', 'siblings'])
+
+TemplateStats = namedtuple('TemplateStats',
+                           ['hits', 'misses', 'failures', 'invalidations',
+                            'currsize', 'maxsize'])
+
+_DIGITS = re.compile(r'\d+')
+
+
+def node_signature(tree, node):
+    '''What ``node`` looks like: its tag, id and class without digits.'''
+    return (tree.tag(node), _DIGITS.sub('0', tree.get_id(node)),
+            _DIGITS.sub('0', tree.class_name(node)))
+
+
+def node_path(tree, node):
+    '''Steps from the root down to ``node``. Each one is a signature and
+    the position among the siblings sharing it.
+    '''
+    path = []
+    parent = tree.parent(node)
+    while parent is not None:
+        signature = node_signature(tree, node)
+        position = 0
+        for child in tree.children(parent):
+            if child is node:
+                break
+            if node_signature(tree, child) == signature:
+                position += 1
+        path.append(signature + (position,))
+        node, parent = parent, tree.parent(parent)
+    path.reverse()
+    return tuple(path)
+
+
+def resolve_path(tree, path):
+    '''The node at ``path``, or None when the page has no such node.'''
+    node = tree.root
+    for step in path:
+        signature, position = step[:3], step[3]
+        matches = [child for child in tree.children(node)
+                   if node_signature(tree, child) == signature]
+        if position >= len(matches):
+            return None
+        node = matches[position]
+    return node
+
+
+def domain(url):
+    host = urlparse(url).netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+
+class TemplateCache(object):
+    '''Templates of the ``maxsize`` most recently seen domains.'''
+
+    def __init__(self, maxsize=None, max_failures=None, min_text_length=None,
+                 max_link_density=None):
+        self._cache = LRUCache(maxsize or settings.TEMPLATE_CACHE_SIZE)
+        self.max_failures = max_failures or settings.TEMPLATE_MAX_FAILURES
+        if min_text_length is None:
+            min_text_length = settings.TEMPLATE_MIN_TEXT_LENGTH
+        if max_link_density is None:
+            max_link_density = settings.TEMPLATE_MAX_LINK_DENSITY
+        self.min_text_length = min_text_length
+        self.max_link_density = max_link_density
+        self.hits = self.misses = self.failures = self.invalidations = 0
+
+    def get(self, url):
+        # Entries are [template, consecutive failures]
+        entry = self._cache.get(domain(url))
+        if entry is None:
+            self.misses += 1
+            return None
+        return entry[0]
+
+    def accepts(self, text_length, link_density):
+        '''Whether a node found by a template looks like content.'''
+        return (text_length >= self.min_text_length and
+                link_density <= self.max_link_density)
+
+    def hit(self, url):
+        self.hits += 1
+        entry = self._cache.get(domain(url))
+        if entry is not None:
+            entry[1] = 0
+
+    def failed(self, url):
+        '''Record a failed validation, dropping the template of a domain
+        after ``max_failures`` in a row.
+        '''
+        self.failures += 1
+        key = domain(url)
+        entry = self._cache.get(key)
+        if entry is None:
+            return
+        entry[1] += 1
+        if entry[1] >= self.max_failures:
+            self._cache.pop(key)
+            self.invalidations += 1
+
+    def learn(self, url, template):
+        '''Remember ``template`` from a fully scored page of ``url``'s
+        domain. A different template replaces the old one.
+        '''
+        key = domain(url)
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry[0] == template:
+                return
+            self.invalidations += 1
+        self._cache.put(key, [template, 0])
+
+    def invalidate(self, url):
+        if self._cache.pop(domain(url)) is not None:
+            self.invalidations += 1
+
+    def info(self):
+        return TemplateStats(self.hits, self.misses, self.failures,
+                             self.invalidations, len(self._cache),
+                             self._cache.maxsize)
+
+    def clear(self):
+        self._cache.clear()
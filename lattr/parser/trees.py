@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Tree backends used by :class:`lattr.parser.Document`.
+
+A backend wraps one parsed document and exposes the handful of node
+operations the extraction passes need, so the scoring code does not care
+whether it runs on BeautifulSoup tags or on ``lxml.html`` elements.
+
+Both take a ``prune(tag, attrs)`` callable and a ``deadline``. The soup
+backend skips the subtrees ``prune`` picks while the page is parsed, so
+they are never built, and stops building at the deadline, leaving
+``truncated`` set.
+'''
+
+import copy
+import mmap
+import time
+
+# bs4 and lxml are imported by the first tree that needs them, which
+# keeps importing the parser (and the CLI) cheap.
+BeautifulSoup = NavigableString = CData = Tag = None
+_PruningTreeBuilder = None
+lxml_html = etree = None
+
+
+def _load_bs4():
+    global BeautifulSoup, NavigableString, CData, Tag, _PruningTreeBuilder
+    if BeautifulSoup is None:
+        from bs4 import BeautifulSoup, NavigableString, CData, Tag
+        from bs4.builder import LXMLTreeBuilder
+
+        class _PruningTreeBuilder(_PruningEvents, LXMLTreeBuilder):
+            # BeautifulSoup's lxml builder is itself the parser target
+
+            def reset(self):
+                # Called again when BeautifulSoup retries another encoding
+                super(_PruningTreeBuilder, self).reset()
+                self._dropping = 0
+                self.truncated = False
+
+
+def _load_lxml():
+    global lxml_html, etree
+    if lxml_html is None:
+        import lxml.html as lxml_html
+        from lxml import etree
+
+
+# Tags whose own strings are not part of the document text
+# (BeautifulSoup stores them as Script/Stylesheet/TemplateString).
+_NON_TEXT_TAGS = frozenset(['script', 'style', 'template'])
+
+# BeautifulSoup collapses strings made only of these characters to a single
+# newline or space, except inside these tags.
+_ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+_PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+
+
+class _PruningEvents(object):
+    '''lxml parser target events without the subtrees ``prune(tag, attrs)``
+    picks, so they are never built. The ``html`` root is always kept.
+
+    Past ``deadline`` nothing more is built: the elements already open are
+    closed as the parser ends them and ``truncated`` is set.
+    '''
+
+    # Elements started between two looks at the clock
+    DEADLINE_CHECK_INTERVAL = 64
+
+    def __init__(self, prune, deadline=None, *args, **kwargs):
+        super(_PruningEvents, self).__init__(*args, **kwargs)
+        self.prune = prune
+        self.deadline = deadline
+        self.truncated = False
+        self._countdown = self.DEADLINE_CHECK_INTERVAL
+        # Depth inside the subtree being dropped
+        self._dropping = 0
+
+    def _out_of_time(self):
+        if self.deadline is None:
+            return False
+        self._countdown -= 1
+        if self._countdown:
+            return False
+        self._countdown = self.DEADLINE_CHECK_INTERVAL
+        return time.time() > self.deadline
+
+    def start(self, name, attrs, *args):
+        if self._dropping or self.truncated:
+            self._dropping += 1
+        elif (name != 'html' and self.prune is not None and
+                self.prune(name, attrs)):
+            self._dropping = 1
+        elif self._out_of_time():
+            self.truncated = True
+            self._dropping = 1
+        else:
+            super(_PruningEvents, self).start(name, attrs, *args)
+
+    def end(self, name):
+        if self._dropping:
+            self._dropping -= 1
+        else:
+            super(_PruningEvents, self).end(name)
+
+    def data(self, content):
+        if not (self._dropping or self.truncated):
+            super(_PruningEvents, self).data(content)
+
+    def comment(self, content):
+        if not (self._dropping or self.truncated):
+            super(_PruningEvents, self).comment(content)
+
+
+class SoupTree(object):
+    '''Backend on top of ``BeautifulSoup(html, 'lxml')``.'''
+
+    name = 'soup'
+
+    def __init__(self, html, encoding=None, prune=None, deadline=None):
+        _load_bs4()
+        if isinstance(html, mmap.mmap):
+            html = html[:]
+        self.truncated = False
+        if prune is None and deadline is None:
+            self.soup = BeautifulSoup(html, 'lxml', from_encoding=encoding)
+        else:
+            builder = _PruningTreeBuilder(prune, deadline)
+            self.soup = BeautifulSoup(html, builder=builder,
+                                      from_encoding=encoding)
+            self.truncated = builder.truncated
+
+    @property
+    def root(self):
+        return self.soup.html
+
+    @property
+    def body(self):
+        return self.soup.body
+
+    def ensure_body(self):
+        if not self.soup.body:
+            self.soup.html.append(self.soup.new_tag('body'))
+        return self.soup.body
+
+    def tag(self, node):
+        return node.name
+
+    def get_id(self, node):
+        return node.attrs.get('id') or ''
+
+    def class_name(self, node):
+        if 'class' in node.attrs:
+            class_name = node['class']
+            if isinstance(class_name, basestring):
+                return class_name
+            return ' '.join(class_name)
+        return ''
+
+    def attribute(self, node, name):
+        value = node.attrs.get(name)
+        if isinstance(value, list):
+            # Multi-valued attributes such as rel
+            return ' '.join(value)
+        return value
+
+    def parent(self, node):
+        parent = node.parent
+        if parent is None or parent is self.soup:
+            return None
+        return parent
+
+    def children(self, node):
+        return [child for child in node.contents if isinstance(child, Tag)]
+
+    def strings(self, node):
+        '''Strings directly under ``node`` that count as its text.'''
+        return [child for child in node.contents
+                if type(child) in (NavigableString, CData)]
+
+    def next_siblings(self, node):
+        return [sibling for sibling in node.next_siblings
+                if isinstance(sibling, Tag)]
+
+    def find(self, name):
+        return self.soup.find(name)
+
+    def find_all(self, name):
+        return self.soup.find_all(name)
+
+    def find_by_id(self, id):
+        return self.soup.find(id=id)
+
+    def text(self, node):
+        return node.text
+
+    def remove(self, node):
+        node.extract()
+
+    def destroy(self, node):
+        '''Remove ``node`` and free its subtree.'''
+        node.decompose()
+
+    def detach(self, node):
+        '''Take ``node`` out of the document so it can outlive
+        :meth:`release`.
+        '''
+        node.extract()
+        return node
+
+    def release(self):
+        '''Free the document, only detached nodes remain usable.'''
+        self.soup.decompose()
+
+    def new_container(self):
+        return self.soup.new_tag('div')
+
+    def append(self, parent, node):
+        parent.append(node)
+
+    def to_html(self, node):
+        return unicode(node)
+
+    def to_bytes(self, node, encoding='utf-8'):
+        return node.encode(encoding)
+
+
+class LxmlTree(object):
+    '''Backend working directly on ``lxml.html`` elements.
+
+    It produces the same tree and text as :class:`SoupTree` without going
+    through BeautifulSoup's object model. The only difference is that the
+    text around a removed element ends up in a single lxml tail, so runs
+    of whitespace there may collapse differently.
+    '''
+
+    name = 'lxml'
+    truncated = False
+
+    def __init__(self, html, encoding=None, prune=None, deadline=None):
+        _load_lxml()
+        if isinstance(html, unicode):
+            html = html.encode('utf-8')
+            encoding = 'utf-8'
+        # ``prune`` and ``deadline`` are left to the scan. libxml2 builds
+        # the whole tree in C faster than a Python parser target can filter
+        # it, and a target gets the attributes as a dict, which loses their
+        # order.
+        try:
+            parser = lxml_html.HTMLParser(encoding=encoding)
+        except LookupError:
+            # A charset Python knows but libxml2 does not, let it sniff
+            parser = lxml_html.HTMLParser()
+        if isinstance(html, mmap.mmap):
+            # libxml2 reads the mapping a buffer at a time
+            html.seek(0)
+            self.document = lxml_html.parse(html, parser=parser).getroot()
+        else:
+            self.document = lxml_html.document_fromstring(html, parser=parser)
+
+    @classmethod
+    def from_document(cls, document):
+        '''Wrap an already parsed ``lxml.html`` document.'''
+        _load_lxml()
+        tree = cls.__new__(cls)
+        tree.document = document
+        return tree
+
+    @property
+    def root(self):
+        return self.document
+
+    @property
+    def body(self):
+        return next(self.document.iter('body'), None)
+
+    def ensure_body(self):
+        body = self.body
+        if body is None:
+            body = self.document.makeelement('body', {})
+            self.document.append(body)
+        return body
+
+    def tag(self, node):
+        return node.tag
+
+    def get_id(self, node):
+        return node.get('id') or ''
+
+    def class_name(self, node):
+        class_name = node.get('class')
+        if class_name:
+            return ' '.join(class_name.split())
+        return ''
+
+    def attribute(self, node, name):
+        return node.get(name)
+
+    def parent(self, node):
+        return node.getparent()
+
+    def children(self, node):
+        return [child for child in node if isinstance(child.tag, basestring)]
+
+    def strings(self, node):
+        '''Strings directly under ``node`` that count as its text.'''
+        strings = []
+        if node.text and node.tag not in _NON_TEXT_TAGS:
+            strings.append(self._collapse(node.text, node))
+        for child in node:
+            if child.tail:
+                strings.append(self._collapse(child.tail, node))
+        return strings
+
+    def _collapse(self, string, node):
+        if string.strip(_ASCII_SPACES):
+            return string
+        if node.tag in _PRESERVE_WHITESPACE_TAGS:
+            return string
+        for ancestor in node.iterancestors():
+            if ancestor.tag in _PRESERVE_WHITESPACE_TAGS:
+                return string
+        return u'\n' if '\n' in string else u' '
+
+    def next_siblings(self, node):
+        return [sibling for sibling in node.itersiblings()
+                if isinstance(sibling.tag, basestring)]
+
+    def find(self, name):
+        return next(self.document.iter(name), None)
+
+    def find_all(self, name):
+        return list(self.document.iter(name))
+
+    def find_by_id(self, id):
+        for node in self.document.iter(etree.Element):
+            if node.get('id') == id:
+                return node
+        return None
+
+    def text(self, node):
+        parts = []
+        pending = [node]
+        while pending:
+            item = pending.pop()
+            if isinstance(item, list):
+                parts.extend(item)
+                continue
+            strings = self.strings(item)
+            if item.text and item.tag not in _NON_TEXT_TAGS:
+                parts.append(strings.pop(0))
+            for child in reversed(item):
+                if child.tail:
+                    pending.append([strings.pop()])
+                if isinstance(child.tag, basestring):
+                    pending.append(child)
+        return u''.join(parts)
+
+    def remove(self, node):
+        # Unlike BeautifulSoup, lxml keeps the text following an element in
+        # its tail, which has to stay in the document.
+        parent = node.getparent()
+        if parent is None:
+            return
+        if node.tail:
+            previous = node.getprevious()
+            if previous is not None:
+                previous.tail = (previous.tail or '') + node.tail
+            else:
+                parent.text = (parent.text or '') + node.tail
+            node.tail = None
+        parent.remove(node)
+
+    def destroy(self, node):
+        '''Remove ``node`` and free its subtree.'''
+        self.remove(node)
+        node.clear()
+
+    def detach(self, node):
+        '''Copy ``node`` out of the document so it can outlive
+        :meth:`release`: any element keeps its whole document alive.
+        '''
+        node = copy.deepcopy(node)
+        node.tail = None
+        return node
+
+    def release(self):
+        '''Free the document, only detached nodes remain usable.'''
+        self.document = None
+
+    def new_container(self):
+        return self.document.makeelement('div', {})
+
+    def append(self, parent, node):
+        self.remove(node)
+        parent.append(node)
+
+    def to_html(self, node):
+        return lxml_html.tostring(node, encoding='unicode', with_tail=False)
+
+    def to_bytes(self, node, encoding='utf-8'):
+        return lxml_html.tostring(node, encoding=encoding, with_tail=False)
+
+
+BACKENDS = {
+    SoupTree.name: SoupTree,
+    LxmlTree.name: LxmlTree,
+}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError('Unknown parser backend %r, expected one of %s' %
+                         (name, ', '.join(sorted(BACKENDS))))
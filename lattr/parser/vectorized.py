@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''Candidate scoring with NumPy over a flattened node table.
+
+The pruned tree is laid out in preorder as parallel arrays: parent index,
+tag code, text length, comma count and link text length. ``Document._scan``
+records the first two as it walks the tree, so laying it out costs no
+second walk. The class and id
+weights are only looked up for the nodes that end up as candidates. From
+there the paragraph scores, their propagation to parents and grandparents,
+the link density scaling and the choice of the top candidate are array
+operations instead of a Python loop per node.
+
+The result is the same as the scalar scoring in :class:`Document`,
+including ties, which go to the candidate that comes first in the
+document. NumPy is optional and only needed with ``scoring='numpy'``::
+
+    Document(html, scoring='numpy')
+'''
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NodeTable = namedtuple('NodeTable', ['nodes', 'parent', 'tag',
+                                     'text_length', 'comma_count',
+                                     'link_length'])
+
+# Tag codes, 0 is any other tag
+_TAGS = ('p', 'td', 'pre', 'div', 'blockquote',
+         'address', 'ol', 'ul', 'dl', 'dd', 'dt', 'li', 'form',
+         'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'th')
+TAG_CODES = dict((name, code) for code, name in enumerate(_TAGS, 1))
+# Codes of the tags scored as paragraphs
+_PARAGRAPHS = [TAG_CODES[name] for name in ('p', 'td', 'pre', 'div')]
+
+
+def _tag_weights():
+    # Same as Document._score_node, indexed by tag code
+    weights = np.zeros(len(_TAGS) + 1)
+    for name, code in TAG_CODES.iteritems():
+        if name == 'div':
+            weights[code] = 5
+        elif name in ('pre', 'td', 'blockquote'):
+            weights[code] = 3
+        elif name in ('address', 'ol', 'ul', 'dl', 'dd', 'dt', 'li', 'form'):
+            weights[code] = -3
+        elif name in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'th'):
+            weights[code] = -5
+    return weights
+
+
+def available():
+    return np is not None
+
+
+def node_table(records, parent, tag):
+    '''A :class:`NodeTable` from what ``Document._scan`` lays out: the
+    text stats of the nodes in preorder, and for each of them the preorder
+    index of its parent (-1 for the root) and its tag code.
+    '''
+    count = len(records)
+    return NodeTable(
+        [stats.node for stats in records],
+        np.array(parent, np.intp), np.array(tag, np.intp),
+        np.fromiter((stats.text_length for stats in records), np.intp,
+                    count),
+        np.fromiter((stats.comma_count for stats in records), np.intp,
+                    count),
+        np.fromiter((stats.link_length for stats in records), np.intp,
+                    count))
+
+
+def score(nodes, class_weight, min_length):
+    '''Scores of the candidates in ``nodes``, a :class:`NodeTable`.
+
+    Returns the preorder indexes of the candidates and their scores after
+    the link density scaling. ``class_weight(node)`` is the class and id
+    weight of a node.
+    '''
+    parent = nodes.parent
+    paragraphs = np.flatnonzero(np.in1d(nodes.tag, _PARAGRAPHS) &
+                                (nodes.text_length >= min_length) &
+                                (parent >= 0))
+    hundreds = nodes.text_length[paragraphs] // 100
+    content_score = 1 + nodes.comma_count[paragraphs] + np.minimum(hundreds, 3)
+    # Document._score_paragraph halves a float score, except past 399
+    # characters where min() returns its int 3 and the half is floored
+    half_score = np.where(hundreds > 3, content_score // 2,
+                          content_score / 2.0)
+    parents = parent[paragraphs]
+    grand_parents = parent[parents]
+    has_grand_parent = grand_parents >= 0
+    grand_parents = grand_parents[has_grand_parent]
+
+    is_candidate = np.zeros(len(parent), bool)
+    is_candidate[parents] = True
+    is_candidate[grand_parents] = True
+    candidates = np.flatnonzero(is_candidate)
+
+    scores = np.zeros(len(parent))
+    scores[candidates] = (
+        _tag_weights()[nodes.tag[candidates]] +
+        np.fromiter((class_weight(nodes.nodes[index])
+                     for index in candidates), float, len(candidates)))
+    np.add.at(scores, parents, content_score)
+    np.add.at(scores, grand_parents, half_score[has_grand_parent])
+
+    text_length = nodes.text_length[candidates]
+    link_length = nodes.link_length[candidates]
+    linked = (text_length > 0) & (link_length > 0)
+    link_density = np.zeros(len(candidates))
+    link_density[linked] = (link_length[linked].astype(float) /
+                            text_length[linked])
+    return candidates, scores[candidates] * (1 - link_density)
+
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import re
+from collections import namedtuple
+
+from lattr.lru import LRUCache
+
+
+RE_UNLIKELY_CANDIDATES = re.compile(
+    'combx|comment|community|disqus|extra|foot|'
+    'header|menu|remark|rss|shoutbox|sidebar|'
+    'sponsor|ad-break|agegate|pagination|pager|'
+    'popup|tweet|twitter', re.I)
+RE_POSITIVE_TAG = re.compile(
+    'article|body|content|entry|hentry|post|text', re.I)
+RE_NEGATIVE_TAG = re.compile(
+    'combx|comment|contact|foot|footer|footnote|'
+    'link|media|meta|promo|related|scroll|shoutbox|sponsor|tags|widget', re.I)
+
+
+ClassVerdict = namedtuple('ClassVerdict',
+                          ['positive', 'negative', 'unlikely', 'weight'])
+
+
+def class_verdict(class_name, id):
+    '''Match a node's class and id against the positive, negative and
+    unlikely-candidate patterns.
+
+    ``weight`` is +25 for each of class and id that looks positive and -25
+    for each that looks negative. ``unlikely`` tests id and class
+    concatenated, in that order.
+    '''
+    positive = negative = False
+    weight = 0
+    for value in (class_name, id):
+        if not value:
+            continue
+        if RE_POSITIVE_TAG.search(value):
+            positive = True
+            weight += 25
+        if RE_NEGATIVE_TAG.search(value):
+            negative = True
+            weight -= 25
+    unlikely = bool(RE_UNLIKELY_CANDIDATES.search('%s%s' % (id, class_name)))
+    return ClassVerdict(positive, negative, unlikely, weight)
+
+
+class ClassWeightCache(object):
+    '''Memoizes :func:`class_verdict` by ``(class, id)``.
+
+    Sites reuse a few hundred class strings across thousands of nodes, so
+    a bounded LRU avoids running the three patterns again for each of them.
+    ``info()`` exposes hit and miss counts for sizing.
+    '''
+
+    def __init__(self, maxsize=1024):
+        self._cache = LRUCache(maxsize)
+
+    def verdict(self, class_name, id):
+        key = (class_name, id)
+        verdict = self._cache.get(key)
+        if verdict is None:
+            verdict = class_verdict(class_name, id)
+            self._cache.put(key, verdict)
+        return verdict
+
+    def info(self):
+        return self._cache.info()
+
+    def clear(self):
+        self._cache.clear()
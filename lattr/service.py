@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+'''HTTP extraction service.
+
+A long running process that keeps a pool of warm workers, so extracting an
+article costs a request instead of starting the ``parser`` CLI::
+
+    POST /extract          {"html": "..."} or {"url": "..."}, or an HTML
+                           body sent as text/html
+    POST /extract/batch    {"documents": [{"id": "a", "html": "..."},
+                                          {"id": "b", "url": "..."}]}
+    GET  /health
+
+Responses are JSON with ``title``, ``content``, ``error``, ``elapsed`` and
+``mode`` (``fast`` when the document ran out of its time budget)
+(the batch endpoint returns them under ``results``, in request order).
+At most ``SERVICE_QUEUE_SIZE`` documents wait for or are being extracted
+by the workers, counted from before their URLs are fetched. When a request
+would go past that it is refused with a 503 and a ``Retry-After`` header
+instead of queueing without bound, and one whose documents are not
+extracted in time gets a 504.
+'''
+
+import sys
+import threading
+import multiprocessing
+from argparse import ArgumentParser
+from multiprocessing.pool import ThreadPool
+
+from flask import Flask, jsonify, request
+
+from lattr.conf import settings
+from lattr.fetch import Fetcher
+from lattr.parser.batch import Job, _Worker
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class ServiceTimeout(Exception):
+    pass
+
+
+class ExtractionPool(object):
+    '''Worker processes with a bounded number of queued documents.
+
+    With a single process, documents are extracted on one thread of the
+    service process instead, without a per-document deadline.
+    '''
+
+    def __init__(self, processes=None, queue_size=None, timeout=None,
+                 backend=None):
+        if processes is None:
+            processes = (settings.SERVICE_PROCESSES or
+                         multiprocessing.cpu_count())
+        if queue_size is None:
+            queue_size = settings.SERVICE_QUEUE_SIZE
+        if timeout is None:
+            timeout = settings.BATCH_TIMEOUT
+        self.processes = processes
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._worker = _Worker(backend, timeout)
+        if processes > 1:
+            self._pool = multiprocessing.Pool(processes)
+        else:
+            self._pool = ThreadPool(1)
+        self._lock = threading.Lock()
+        self._queued = 0
+
+    @property
+    def queued(self):
+        return self._queued
+
+    def reserve(self, count):
+        '''Hold room for ``count`` documents until :meth:`release`.
+
+        Raises :class:`ServiceBusy` right away when the queue is too full.
+        '''
+        with self._lock:
+            if self._queued + count > self.queue_size:
+                raise ServiceBusy('%d documents queued, limit is %d' %
+                                  (self._queued, self.queue_size))
+            self._queued += count
+
+    def release(self, count):
+        with self._lock:
+            self._queued -= count
+
+    def extract(self, jobs):
+        '''Extract ``jobs`` and return their :class:`BatchResult` in order.
+
+        Raises :class:`ServiceBusy` right away when the queue has no room
+        for all of them.
+        '''
+        self.reserve(len(jobs))
+        try:
+            return self.run(jobs)
+        finally:
+            self.release(len(jobs))
+
+    def run(self, jobs):
+        '''Like :meth:`extract`, for jobs already given room with
+        :meth:`reserve`.
+
+        Raises :class:`ServiceTimeout` when they are not all extracted in
+        time.
+        '''
+        if not jobs:
+            return []
+        pending = self._pool.map_async(self._worker, jobs, chunksize=1)
+        # Every document has its own deadline in the worker, leave room
+        # for the queue ahead of them.
+        timeout = (self.timeout * (len(jobs) + self.queue_size)
+                   if self.timeout else None)
+        try:
+            return pending.get(timeout)
+        except multiprocessing.TimeoutError:
+            raise ServiceTimeout('%d documents not extracted in %ss' %
+                                 (len(jobs), timeout))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+def _result(result):
+    return {'id': result.source, 'title': result.title,
+            'content': result.content, 'error': result.error,
+            'elapsed': result.elapsed, 'mode': result.mode}
+
+
+def _error(status, message, **headers):
+    response = jsonify(error=message)
+    response.status_code = status
+    response.headers.extend(headers)
+    return response
+
+
+def _busy(e):
+    return _error(503, str(e), **{'Retry-After': '1'})
+
+
+def _timed_out(e):
+    return _error(504, str(e))
+
+
+def _document_jobs(documents, fetcher):
+    '''Jobs for ``documents``, fetching the ones given by URL.'''
+    jobs = [None] * len(documents)
+    urls = []
+    for position, document in enumerate(documents):
+        if not isinstance(document, dict):
+            raise ValueError('document %d is not an object' % position)
+        source = document.get('id', position)
+        if document.get('html'):
+            jobs[position] = Job(source, html=document['html'],
+                                 encoding=document.get('encoding'))
+        elif document.get('url'):
+            urls.append((position, source, document['url']))
+        else:
+            raise ValueError('document %r has neither html nor url' % source)
+    results = []
+    if len(urls) == 1:
+        # No need for the fetch pool
+        results = [fetcher.fetch(urls[0][2])]
+    elif urls:
+        results = fetcher.fetch_many([url for _, _, url in urls],
+                                     ordered=True)
+    for (position, source, _), result in zip(urls, results):
+        jobs[position] = Job(source, html=result.content,
+                             error=result.error,
+                             encoding=result.encoding)
+    return jobs
+
+
+def create_app(pool=None, fetcher=None, max_batch=None):
+    '''Build the Flask application around ``pool`` and ``fetcher``.'''
+    app = Flask(__name__)
+    app.pool = pool or ExtractionPool()
+    app.fetcher = fetcher or Fetcher()
+    if max_batch is None:
+        max_batch = settings.SERVICE_MAX_BATCH
+
+    @app.route('/health')
+    def health():
+        return jsonify(status='ok', queued=app.pool.queued,
+                       queue_size=app.pool.queue_size)
+
+    @app.route('/extract', methods=['POST'])
+    def extract():
+        try:
+            app.pool.reserve(1)
+        except ServiceBusy as e:
+            return _busy(e)
+        try:
+            if request.mimetype == 'text/html':
+                document = {'html': request.get_data(),
+                            'encoding': request.mimetype_params.get('charset')}
+            else:
+                document = request.get_json(silent=True)
+            try:
+                jobs = _document_jobs([document], app.fetcher)
+            except ValueError:
+                return _error(400, 'expected a JSON object with "html" or '
+                                   '"url", or a text/html body')
+            job = jobs[0]
+            if job.error:
+                return _error(502, job.error)
+            try:
+                result, = app.pool.run(jobs)
+            except ServiceTimeout as e:
+                return _timed_out(e)
+        finally:
+            app.pool.release(1)
+        response = jsonify(_result(result))
+        if result.error:
+            response.status_code = 422
+        return response
+
+    @app.route('/extract/batch', methods=['POST'])
+    def extract_batch():
+        payload = request.get_json(silent=True)
+        documents = isinstance(payload, dict) and payload.get('documents')
+        if not isinstance(documents, list):
+            return _error(400, 'expected a JSON object with a "documents" '
+                               'list')
+        if len(documents) > max_batch:
+            return _error(413, 'at most %d documents per batch' % max_batch)
+        try:
+            app.pool.reserve(len(documents))
+        except ServiceBusy as e:
+            return _busy(e)
+        try:
+            try:
+                jobs = _document_jobs(documents, app.fetcher)
+            except ValueError as e:
+                return _error(400, str(e))
+            try:
+                results = app.pool.run(jobs)
+            except ServiceTimeout as e:
+                return _timed_out(e)
+        finally:
+            app.pool.release(len(documents))
+        return jsonify(results=[_result(result) for result in results])
+
+    return app
+
+
+def _define_options():
+    arg_parser = ArgumentParser(description='Run the lattr extraction service')
+    arg_parser.add_argument('--host', dest='host',
+                            help='address to listen on, '
+                                 'defaults to settings.SERVICE_HOST')
+    arg_parser.add_argument('-p', '--port', dest='port', type=int,
+                            help='port to listen on, '
+                                 'defaults to settings.SERVICE_PORT')
+    arg_parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                            help='worker processes, defaults to one per CPU')
+    arg_parser.add_argument('-b', '--backend', dest='backend',
+                            choices=('soup', 'lxml'),
+                            help=('tree backend used for extraction, '
+                                  'defaults to settings.PARSER_BACKEND'))
+    return arg_parser
+
+
+def main(argv=None):
+    from werkzeug.serving import WSGIRequestHandler
+
+    args = _define_options().parse_args(argv)
+    pool = ExtractionPool(processes=args.jobs, backend=args.backend)
+    app = create_app(pool)
+    # HTTP/1.1 lets clients keep their connection open between requests
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    try:
+        app.run(host=args.host or settings.SERVICE_HOST,
+                port=args.port or settings.SERVICE_PORT,
+                threaded=True)
+    finally:
+        app.fetcher.close()
+        pool.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,6 +23,8 @@ setup(name='lattr',
       ],
       entry_points={
           'console_scripts': [
-              'parser=lattr.parser:main'
+              'parser=lattr.parser:main',
+              'parser-bench=lattr.parser.benchmark:main',
+              'lattr-server=lattr.service:main'
           ]
       })
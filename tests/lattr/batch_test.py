@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import json
+import time
+import signal
+import unittest
+from StringIO import StringIO
+
+from lattr.parser import batch
+from lattr.parser.batch import (
+    Job, ExtractionTimeout, iter_jobs, extract_job, extract_many)
+
+HTML_DOCUMENTS = os.path.join(os.path.dirname(__file__), os.pardir,
+                              'html_documents')
+DEFAULT_PAGE = os.path.join(HTML_DOCUMENTS, 'default_page.html')
+
+
+def _page(title):
+    return ('<html><title>%s</title><body><div><p>%s</p></div></body></html>'
+            % (title, 'Some text, with commas, ' * 10))
+
+
+class _SlowDocument(batch.Document):
+    # Runs past any timeout below
+
+    def parse(self):
+        time.sleep(5)
+
+
+class _StubbornDocument(batch.Document):
+    # Swallows timeouts for a while, like a __del__ method would
+
+    def parse(self):
+        started = time.time()
+        while time.time() - started < 0.2:
+            try:
+                time.sleep(0.01)
+            except ExtractionTimeout:
+                pass
+        super(_StubbornDocument, self).parse()
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def test_iter_jobs_from_directory(self):
+        jobs = list(iter_jobs(HTML_DOCUMENTS))
+        self.assertEqual([os.path.join(HTML_DOCUMENTS, 'default_page.html')],
+                         [job.path for job in jobs])
+
+    def test_iter_jobs_from_glob(self):
+        jobs = list(iter_jobs(os.path.join(HTML_DOCUMENTS, '*.html')))
+        self.assertEqual(1, len(jobs))
+
+    def test_iter_jobs_from_jsonl(self):
+        stream = StringIO('\n'.join([
+            json.dumps({'id': 'a', 'html': _page('a')}),
+            '',
+            json.dumps({'path': DEFAULT_PAGE})]))
+        jobs = list(iter_jobs('-', stream))
+        self.assertEqual(['a', 3], [job.source for job in jobs])
+        self.assertEqual(DEFAULT_PAGE, jobs[1].path)
+
+    def test_bad_jsonl_lines_are_reported(self):
+        stream = StringIO('\n'.join([
+            json.dumps({'id': 'a', 'html': _page('a')}),
+            '{"id": "b", "html": ',
+            json.dumps({'id': 'c'}),
+            json.dumps(['d']),
+            json.dumps({'id': 'e', 'html': _page('e')})]))
+        results = list(extract_many(iter_jobs('-', stream), processes=2))
+        self.assertEqual(['a', 2, 'c', 4, 'e'],
+                         [result.source for result in results])
+        self.assertEqual([None, 'invalid JSON on line 2',
+                          'neither html nor path on line 3',
+                          'not a JSON object on line 4', None],
+                         [result.error for result in results])
+        self.assertEqual('e', results[-1].title)
+
+    def test_extract_job_reports_errors(self):
+        result = extract_job(Job('missing', '/nonexistent/page.html', None))
+        self.assertIsNone(result.title)
+        self.assertIn('IOError', result.error)
+
+    def _extract_with(self, document, timeout):
+        batch.Document = document
+        try:
+            started = time.time()
+            result = extract_job(Job('slow', DEFAULT_PAGE, None),
+                                 timeout=timeout)
+            return result, time.time() - started
+        finally:
+            batch.Document = document.__bases__[0]
+
+    def test_extract_job_timeout(self):
+        result, elapsed = self._extract_with(_SlowDocument, 0.05)
+        self.assertEqual('timed out after 0.05s', result.error)
+        self.assertLess(elapsed, 1)
+
+    def test_extract_job_restores_alarm_handler(self):
+        def handler(signum, frame):
+            pass
+        previous = signal.signal(signal.SIGALRM, handler)
+        try:
+            extract_job(Job('a', None, _page('a')), timeout=10)
+            self._extract_with(_SlowDocument, 0.05)
+            self.assertIs(handler, signal.getsignal(signal.SIGALRM))
+        finally:
+            signal.signal(signal.SIGALRM, previous)
+
+    def test_extract_job_swallowed_timeout(self):
+        # Whether or not a later alarm interrupts the parse, work that
+        # outlived its timeout is not reported as a success
+        result, elapsed = self._extract_with(_StubbornDocument, 0.05)
+        self.assertEqual('timed out after 0.05s', result.error)
+        self.assertLess(elapsed, 1)
+
+    def test_extract_many_ordered(self):
+        jobs = [Job(str(i), None, _page('title %d' % i)) for i in range(10)]
+        results = list(extract_many(jobs, processes=2, chunksize=3))
+        self.assertEqual([str(i) for i in range(10)],
+                         [result.source for result in results])
+        self.assertEqual('title 9', results[-1].title)
+        self.assertTrue(all(result.error is None for result in results))
+
+    def test_extract_many_unordered(self):
+        jobs = [Job(str(i), None, _page('title %d' % i)) for i in range(10)]
+        results = extract_many(jobs, processes=2, ordered=False)
+        self.assertEqual(set(str(i) for i in range(10)),
+                         set(result.source for result in results))
+
+    def test_extract_many_in_process(self):
+        results = list(extract_many([Job('a', None, _page('a'))], processes=1))
+        self.assertEqual('a', results[0].title)
+        self.assertTrue(results[0].peak_rss_kb > 0)
+
+    def test_extract_many_reports_mode(self):
+        jobs = [Job('a', None, _page('a'))]
+        results = list(extract_many(jobs, processes=1))
+        self.assertEqual('full', results[0].mode)
+        results = list(extract_many(jobs, processes=1, time_budget=1e-9))
+        self.assertEqual('fast', results[0].mode)
+        self.assertEqual('a', results[0].title)
+
+    def test_extract_many_low_memory(self):
+        jobs = [Job(str(i), None, _page('title %d' % i)) for i in range(6)]
+        results = list(extract_many(jobs, processes=2, low_memory=True,
+                                    max_tasks_per_child=2))
+        self.assertEqual(['title %d' % i for i in range(6)],
+                         [result.title for result in results])
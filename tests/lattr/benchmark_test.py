@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from lattr.conf import settings
+from lattr.parser.benchmark import STAGES, benchmark, generate_corpus, main
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_generated_corpus_extracts(self):
+        names = [name for name, html in generate_corpus()]
+        self.assertEqual(['small', 'large', 'nested'], names)
+
+    def test_benchmark(self):
+        corpus = generate_corpus()[:1]
+        result = benchmark(corpus, 'lxml', repeat=2)
+        document = result['documents'][0]
+        self.assertEqual('small', document['name'])
+        self.assertEqual(list(STAGES), list(document['stages']))
+        self.assertGreater(result['docs_per_sec'], 0)
+        self.assertIn('memory', document)
+
+    def test_documents_out_of_time(self):
+        budget = settings.DOCUMENT_TIME_BUDGET
+        settings.DOCUMENT_TIME_BUDGET = 1e-9
+        try:
+            result = benchmark(generate_corpus()[:1], 'lxml', repeat=2)
+        finally:
+            settings.DOCUMENT_TIME_BUDGET = budget
+        document = result['documents'][0]
+        self.assertEqual(['fast', 'fast'], document['modes'])
+        self.assertEqual({'min': 0.0, 'mean': 0.0},
+                         document['stages']['siblings'])
+
+    def test_save_and_compare(self):
+        page = os.path.join(self.directory, 'page.html')
+        with open(page, 'w') as fp:
+            fp.write('<html><title>t</title><body><p>text</p></body></html>')
+        saved = os.path.join(self.directory, 'results.json')
+        args = ['--no-generated', '-n', '1', page]
+        output = StringIO()
+        self.assertEqual(0, main(args + ['--save', saved], output))
+        self.assertIn('backend soup, python scoring', output.getvalue())
+        self.assertIn(' full ', output.getvalue())
+        self.assertNotIn('vs before', output.getvalue())
+        with open(saved) as fp:
+            results = json.load(fp)['results']
+        self.assertEqual('page.html', results[0]['documents'][0]['name'])
+        output = StringIO()
+        self.assertEqual(0, main(args + ['--compare', saved], output))
+        report = output.getvalue().splitlines()
+        self.assertTrue(report[2].startswith('page.html'))
+        self.assertTrue(report[3].startswith('  vs before'))
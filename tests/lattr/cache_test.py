@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lattr.cache import ExtractionCache, MemoryTier, SqlTier, content_key
+from lattr.parser import Extraction
+
+HTML = ('<html><title>cached title</title><body><div><p>%s</p></div></body>'
+        '</html>' % ('Some text, with commas, ' * 10))
+
+
+class ExtractionCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ExtractionCache(maxsize=8, ttl=60)
+
+    def test_extract_once(self):
+        first = self.cache.extract(HTML)
+        second = self.cache.extract(HTML)
+        self.assertEqual('cached title', first.title)
+        self.assertEqual('full', first.mode)
+        self.assertEqual(first, second)
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_fast_results_are_not_cached(self):
+        for _ in range(2):
+            result = self.cache.extract(HTML, url='http://a/', etag='"1"',
+                                        time_budget=1e-9)
+            self.assertEqual('fast', result.mode)
+        self.assertEqual((0, 2), (self.cache.hits, self.cache.misses))
+        self.assertIsNone(self.cache.lookup('http://a/', etag='"1"'))
+        self.assertEqual('full', self.cache.extract(HTML).mode)
+
+    def test_key_depends_on_backend(self):
+        self.assertNotEqual(content_key(HTML, 'soup'),
+                            content_key(HTML, 'lxml'))
+        self.assertEqual(content_key(HTML), content_key(HTML.decode('utf-8')))
+
+    def test_key_depends_on_encoding(self):
+        self.assertNotEqual(content_key(HTML),
+                            content_key(HTML, encoding='cp1251'))
+        page = (u'<html><title>\u041d\u043e\u0432\u043e\u0441\u0442\u0438'
+                u' of the day</title><body><p>%s</p></body></html>' %
+                (u'Some text, with commas, ' * 10)).encode('koi8-r')
+        decoded = self.cache.extract(page, backend='lxml', encoding='koi8-r')
+        self.assertTrue(decoded.title.startswith(u'\u041d\u043e\u0432'))
+        guessed = self.cache.extract(page, backend='lxml')
+        self.assertNotEqual(decoded.title, guessed.title)
+        self.assertEqual((0, 2), (self.cache.hits, self.cache.misses))
+
+    def test_lookup_by_url_validators(self):
+        self.assertIsNone(self.cache.lookup('http://a/', etag='"1"'))
+        result = self.cache.extract(HTML, url='http://a/', etag='"1"')
+        self.assertEqual(result, self.cache.lookup('http://a/', etag='"1"'))
+        self.assertIsNone(self.cache.lookup('http://a/', etag='"2"'))
+        self.assertIsNone(self.cache.lookup('http://a/'))
+
+    def test_memory_tier_expires(self):
+        tier = MemoryTier(2, ttl=-1)
+        tier.put('key', 'value')
+        self.assertIsNone(tier.get('key'))
+
+
+class SqlTierTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.url = 'sqlite:///' + os.path.join(self.directory, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store_survives_memory(self):
+        store = SqlTier.from_url(self.url)
+        ExtractionCache(maxsize=1, store=store).extract(HTML)
+        cache = ExtractionCache(maxsize=1, store=SqlTier.from_url(self.url))
+        result = cache.get(content_key(HTML))
+        self.assertEqual('cached title', result.title)
+        self.assertEqual('full', result.mode)
+
+    def test_put_replaces(self):
+        store = SqlTier.from_url(self.url)
+        store.put('key', Extraction(u'a', u'<p>a</p>'))
+        store.put('key', Extraction(u'b', u'<p>b</p>'))
+        self.assertEqual(u'b', store.get('key').title)
+
+    def test_expired_rows(self):
+        store = SqlTier.from_url(self.url, ttl=-1)
+        store.put('key', Extraction(u'a', u'<p>a</p>'))
+        self.assertIsNone(store.get('key'))
+
+    def test_trim(self):
+        store = SqlTier.from_url(self.url, maxsize=2)
+        for key in 'abc':
+            store.put(key, Extraction(unicode(key), unicode(key)))
+        store.trim()
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(u'c', store.get('c').title)
@@ -58,3 +58,11 @@ class SettingsTestCase(unittest.TestCase):
         os.environ[ENVIRONMENT_VARIABLE] = 'unknown.module'
         with self.assertRaises(ImportError):
             self.settings.configure()
+
+    def test_configure_on_first_access(self):
+        self.assertEqual(default_settings.DB_BACKEND,
+                         self.settings.DB_BACKEND)
+
+    def test_unknown_setting(self):
+        with self.assertRaises(AttributeError):
+            self.settings.UNKNOWN_SETTING
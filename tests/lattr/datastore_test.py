@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import inspect
+
+from lattr.conf import settings
+from lattr.datastore import (Article, ArticleStore, create_pooled_engine,
+                             database_url, hash_content)
+from lattr.dedup import SimHashIndex, html_fingerprint
+from lattr.parser.batch import BatchResult
+
+
+class ArticleStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(self.directory, 'articles.db')
+        self.store = ArticleStore(create_pooled_engine(url), bulk_size=3)
+
+    def tearDown(self):
+        self.store.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def test_indexes(self):
+        inspector = inspect(self.store.engine)
+        indexed = set()
+        for index in inspector.get_indexes('articles'):
+            indexed.update(index['column_names'])
+        for constraint in inspector.get_unique_constraints('articles'):
+            indexed.update(constraint['column_names'])
+        self.assertTrue(set(['url_key', 'content_hash']) <= indexed)
+
+    def test_save_and_get(self):
+        self.assertEqual((1, 0), self.store.save([
+            Article(u'http://a/1', u'Title', u'<p>caf\xe9</p>', status=200)]))
+        article = self.store.get(u'http://a/1')
+        self.assertEqual(u'Title', article.title)
+        self.assertEqual(200, article.status)
+        self.assertEqual(hash_content(u'<p>caf\xe9</p>'), article.content_hash)
+        self.assertIsNone(self.store.get(u'http://a/2'))
+
+    def test_bulk_upsert(self):
+        articles = [Article(u'http://a/%d' % i, u'Title %d' % i, u'<p/>')
+                    for i in range(7)]
+        self.assertEqual((7, 0), self.store.save(articles))
+        self.assertEqual((1, 2), self.store.save([
+            Article(u'http://a/1', u'New title'),
+            Article(u'http://a/2', u'Other title'),
+            Article(u'http://a/9', u'Title 9')]))
+        self.assertEqual(8, self.store.count())
+        self.assertEqual(u'New title', self.store.get(u'http://a/1').title)
+
+    def test_find_by_content_hash(self):
+        self.store.save([Article(u'http://a/1', content=u'same'),
+                         Article(u'http://b/1', content=u'same'),
+                         Article(u'http://c/1', content=u'other')])
+        urls = [article.url for article in
+                self.store.find_by_content_hash(hash_content(u'same'))]
+        self.assertEqual([u'http://a/1', u'http://b/1'], urls)
+
+    def test_iter_articles(self):
+        self.store.save(Article(u'http://a/%d' % i) for i in range(10))
+        articles = list(self.store.iter_articles(page_size=4))
+        self.assertEqual([u'http://a/%d' % i for i in range(10)],
+                         [article.url for article in articles])
+        after = articles[5].id
+        self.assertEqual(4, len(list(self.store.iter_articles(after=after))))
+
+    def test_save_results(self):
+        results = [BatchResult(u'http://a/1', u'Title', u'<p/>', None, 0.1),
+                   BatchResult(u'http://a/2', None, None, u'HTTP 404', 0.1)]
+        self.assertEqual(results, list(self.store.save_results(results)))
+        self.assertEqual(1, self.store.count())
+        self.assertIsNotNone(self.store.get(u'http://a/1').fetched_at)
+
+    def test_save_results_skips_near_duplicates(self):
+        text = u' '.join(u'Sentence %d of the story, told at length.' % i
+                         for i in range(40))
+        results = [BatchResult(u'http://a/1', u'Title', u'<p>%s</p>' % text,
+                               None, 0.1),
+                   BatchResult(u'http://b/1', u'Title',
+                               u'<div><p>%s</p> Via a wire.</div>' % text,
+                               None, 0.1)]
+        index = SimHashIndex()
+        self.assertEqual(results, list(self.store.save_results(
+            results, duplicates=index)))
+        self.assertEqual(1, self.store.count())
+        self.assertEqual(u'http://a/1', index.find(
+            html_fingerprint(results[1].content)).key)
+
+
+class DatabaseUrlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict((name, getattr(settings, name)) for name in
+                          ('DB_URL', 'DB_BACKEND', 'DB_NAME', 'DB_USER',
+                           'DB_HOST'))
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+
+    def test_from_settings(self):
+        settings.DB_URL = None
+        settings.DB_BACKEND = 'mysql'
+        settings.DB_USER = 'reader'
+        settings.DB_HOST = 'db'
+        settings.DB_NAME = 'lattr'
+        self.assertEqual('mysql://reader@db/lattr', str(database_url()))
+        settings.DB_BACKEND = 'sqlite'
+        settings.DB_NAME = '/tmp/lattr.db'
+        self.assertEqual('sqlite:////tmp/lattr.db', database_url())
+        settings.DB_URL = 'sqlite://'
+        self.assertEqual('sqlite://', database_url())
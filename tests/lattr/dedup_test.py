@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from lattr.dedup import (SimHashIndex, SqlFingerprints, distance,
+                         document_fingerprint, html_fingerprint, simhash)
+from lattr.parser import Document
+
+
+DEFAULT_PAGE = os.path.join(os.path.dirname(__file__), os.pardir,
+                            'html_documents', 'default_page.html')
+
+ARTICLE = u' '.join(
+    u'Sentence number %d of the article talks about topic %d, at length.' %
+    (i, i % 7) for i in range(60))
+
+
+class SimHashTestCase(unittest.TestCase):
+
+    def test_near_duplicates_are_close(self):
+        edited = ARTICLE.replace(u'number 12 ', u'no. 12 ') + u' Via a wire.'
+        self.assertLessEqual(distance(simhash(ARTICLE), simhash(edited)), 3)
+
+    def test_different_texts_are_far(self):
+        other = u' '.join(u'Another story %d covers different ground %d.' %
+                          (i, i * 3) for i in range(60))
+        self.assertGreater(distance(simhash(ARTICLE), simhash(other)), 10)
+
+    def test_empty_text(self):
+        self.assertEqual(0, simhash(u''))
+        self.assertEqual(0, simhash(u' ,. '))
+
+    def test_html_fingerprint_ignores_markup(self):
+        self.assertEqual(simhash(ARTICLE), html_fingerprint(
+            u'<div class="a"><p>%s</p></div>' % ARTICLE))
+        self.assertEqual(html_fingerprint('<p>%s</p>' % ARTICLE),
+                         html_fingerprint(u'<section>%s</section>' % ARTICLE))
+
+    def test_document_fingerprint(self):
+        with open(DEFAULT_PAGE, 'rb') as fp:
+            html = fp.read()
+        soup = Document(html, backend='soup')
+        soup.parse()
+        lxml = Document(html, backend='lxml')
+        lxml.parse()
+        self.assertLessEqual(distance(document_fingerprint(soup),
+                                      document_fingerprint(lxml)), 3)
+
+
+class SimHashIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SimHashIndex(max_distance=3)
+
+    def test_check(self):
+        self.assertIsNone(self.index.check('a', 0b1111 << 40, 'result a'))
+        match = self.index.check('b', 0b1101 << 40 | 1, 'result b')
+        self.assertEqual(('a', 2, 'result a'), match)
+        self.assertNotIn('b', self.index)
+        self.assertIsNone(self.index.check('c', 0b1111 << 40 | 0b1111))
+        self.assertEqual(2, len(self.index))
+
+    def test_every_close_fingerprint_is_found(self):
+        fingerprint = 0x0123456789abcdef
+        self.index.add('a', fingerprint)
+        for bits in ((0, 1, 2), (15, 16, 17), (31, 47, 63), (5, 6, 7)):
+            changed = fingerprint
+            for bit in bits:
+                changed ^= 1 << bit
+            self.assertEqual('a', self.index.find(changed).key)
+        self.assertIsNone(self.index.find(fingerprint ^ 0b1111))
+
+    def test_closest_then_earliest(self):
+        self.index.add('far', 0b111)
+        self.index.add('near', 0b1)
+        self.index.add('near again', 0b1)
+        self.assertEqual('near', self.index.find(0).key)
+
+    def test_same_key_is_replaced(self):
+        self.index.check('a', 0b1)
+        self.assertIsNone(self.index.check('a', 0b11))
+        self.index.remove('a')
+        self.assertEqual(0, len(self.index))
+        self.assertIsNone(self.index.find(0b11))
+
+    def test_empty_text_never_matches(self):
+        self.assertIsNone(self.index.check('a', 0))
+        self.assertIsNone(self.index.check('b', 0))
+        self.assertEqual(0, len(self.index))
+
+    def test_lookup_is_fast(self):
+        for i in xrange(20000):
+            self.index.add(i, simhash(u'document %d' % i))
+        fingerprint = simhash(u'document 1234')
+        started = time.time()
+        for _ in xrange(100):
+            self.index.find(fingerprint)
+        self.assertLess((time.time() - started) / 100, 0.001)
+
+
+class SqlFingerprintsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.url = 'sqlite:///' + os.path.join(self.directory, 'dedup.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_persistence(self):
+        index = SimHashIndex(max_distance=3,
+                             store=SqlFingerprints.from_url(self.url))
+        index.add(u'http://a/1', 2 ** 64 - 1, 'result')
+        index.add(u'http://a/2', 0b1)
+        index.add(u'http://a/2', 0b11)
+        index.add(u'http://a/3', 0b111000)
+        index.remove(u'http://a/3')
+        index.store.engine.dispose()
+
+        index = SimHashIndex(max_distance=3,
+                             store=SqlFingerprints.from_url(self.url))
+        self.assertEqual(2, len(index))
+        self.assertEqual((u'http://a/1', 1, None),
+                         index.find(2 ** 64 - 2))
+        self.assertEqual(u'http://a/2', index.find(0b10).key)
+        index.store.engine.dispose()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import gzip
+import threading
+import unittest
+from StringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from lattr.fetch import Fetcher, FetchError
+from lattr.parser.batch import extract_urls
+from lattr.parser.streaming import extract_url
+
+PAGE = (u'<html><title>Caf\xe9</title><body><div><p>%s</p></div></body>'
+        u'</html>' % (u'Some text, with commas, ' * 10))
+# Served in a charset libxml2 does not guess
+SJIS_PAGE = PAGE.replace(u'Caf\xe9', u'\u898b\u51fa\u3057')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = PAGE.encode('utf-8')
+        headers = {'Content-Type': 'text/html; charset=utf-8'}
+        if self.path == '/sjis':
+            body = SJIS_PAGE.encode('shift_jis')
+            headers['Content-Type'] = 'text/html; charset=shift_jis'
+        elif self.path == '/gzip':
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as fp:
+                fp.write(body)
+            body = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        elif self.path == '/large':
+            body = 'x' * 4096
+        elif self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FetcherTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _Server(('127.0.0.1', 0), _Handler)
+        cls.base_url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.fetcher = Fetcher(max_size=1024, workers=4, per_host=2)
+
+    def tearDown(self):
+        self.fetcher.close()
+
+    def test_fetch(self):
+        result = self.fetcher.fetch(self.base_url + '/page')
+        self.assertIsNone(result.error)
+        self.assertEqual(200, result.status)
+        self.assertEqual('utf-8', result.encoding)
+        self.assertEqual(PAGE.encode('utf-8'), result.content)
+
+    def test_fetch_gzip(self):
+        result = self.fetcher.fetch(self.base_url + '/gzip')
+        self.assertEqual(PAGE.encode('utf-8'), result.content)
+
+    def test_fetch_too_large(self):
+        result = self.fetcher.fetch(self.base_url + '/large')
+        self.assertIn('exceeds 1024', result.error)
+        self.assertIsNone(result.content)
+
+    def test_fetch_http_error(self):
+        result = self.fetcher.fetch(self.base_url + '/missing')
+        self.assertEqual('HTTP 404', result.error)
+
+    def test_fetch_connection_error(self):
+        result = self.fetcher.fetch('http://127.0.0.1:1/')
+        self.assertIn('ConnectionError', result.error)
+
+    def test_fetch_many(self):
+        urls = ['%s/page?%d' % (self.base_url, i) for i in range(20)]
+        results = list(self.fetcher.fetch_many(urls, ordered=True))
+        self.assertEqual(urls, [result.url for result in results])
+        self.assertTrue(all(result.error is None for result in results))
+
+    def test_fetch_many_reuses_sessions(self):
+        urls = ['%s/page?%d' % (self.base_url, i) for i in range(8)]
+        for _ in range(20):
+            list(self.fetcher.fetch_many(urls))
+        self.assertLessEqual(len(self.fetcher._sessions),
+                             self.fetcher.workers)
+
+    def test_exited_threads_drop_their_sessions(self):
+        for _ in range(5):
+            thread = threading.Thread(target=self.fetcher.fetch,
+                                      args=(self.base_url + '/page',))
+            thread.start()
+            thread.join()
+        self.fetcher.fetch(self.base_url + '/page')
+        self.assertEqual(1, len(self.fetcher._sessions))
+
+    def test_extract_urls(self):
+        urls = [self.base_url + '/page', self.base_url + '/missing']
+        results = dict((result.source, result) for result in
+                       extract_urls(urls, self.fetcher, processes=1))
+        self.assertEqual(u'Caf\xe9', results[urls[0]].title)
+        self.assertEqual('HTTP 404', results[urls[1]].error)
+
+    def test_stream(self):
+        chunks = list(self.fetcher.stream(self.base_url + '/page'))
+        self.assertEqual(PAGE.encode('utf-8'), ''.join(chunks))
+
+    def test_stream_errors(self):
+        with self.assertRaises(FetchError):
+            list(self.fetcher.stream(self.base_url + '/missing'))
+        with self.assertRaises(FetchError):
+            list(self.fetcher.stream(self.base_url + '/large'))
+
+    def test_extract_url(self):
+        result = extract_url(self.base_url + '/page', self.fetcher)
+        self.assertEqual(u'Caf\xe9', result.title)
+        result = extract_url(self.base_url + '/sjis', self.fetcher)
+        self.assertEqual(u'\u898b\u51fa\u3057', result.title)
+
+    def test_open(self):
+        body = self.fetcher.open(self.base_url + '/sjis')
+        self.assertEqual('shift_jis', body.encoding)
+        self.assertEqual(SJIS_PAGE.encode('shift_jis'), ''.join(body.chunks))
+        with self.assertRaises(FetchError):
+            self.fetcher.open(self.base_url + '/missing')
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import json
+import subprocess
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir,
+                                    os.pardir))
+DEFAULT_PAGE = os.path.join(ROOT, 'tests', 'html_documents',
+                            'default_page.html')
+
+# Seconds ``import lattr.parser`` may take, the CLI has to start quickly
+IMPORT_BUDGET = 0.1
+
+HEAVY_MODULES = ('requests', 'bs4', 'lxml', 'argparse', 'sqlalchemy', 'flask',
+                 'numpy')
+
+_PROBE = '''
+import sys, json, time
+started = time.time()
+%s
+elapsed = time.time() - started
+json.dump({'elapsed': elapsed,
+           'modules': sorted(set(name.split('.')[0] for name, module in
+                                 sys.modules.items() if module))},
+          sys.stdout)
+'''
+
+
+def _probe(code):
+    output = subprocess.check_output([sys.executable, '-c', _PROBE % code],
+                                     cwd=ROOT)
+    return json.loads(output)
+
+
+class ImportTestCase(unittest.TestCase):
+
+    def assertNotLoaded(self, names, result):
+        self.assertEqual([], [name for name in names
+                              if name in result['modules']])
+
+    def test_parser_import_is_light(self):
+        self.assertNotLoaded(HEAVY_MODULES, _probe('import lattr.parser'))
+
+    def test_parser_import_budget(self):
+        elapsed = min(_probe('import lattr.parser')['elapsed']
+                      for _ in range(3))
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+    def test_datastore_import_skips_sqlalchemy(self):
+        self.assertNotLoaded(['sqlalchemy'], _probe('import lattr.datastore'))
+
+    def test_local_file_skips_requests(self):
+        result = _probe('''
+sys.argv = ['parser', '-f', %r, '-b', 'lxml', '--format', 'text',
+            '-o', '/dev/null']
+from lattr.parser import main
+main()''' % DEFAULT_PAGE)
+        self.assertNotLoaded(['requests', 'bs4', 'sqlalchemy'], result)
+        self.assertIn('lxml', result['modules'])
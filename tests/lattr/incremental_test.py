@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import unittest
+
+from lattr import log
+from lattr.conf import settings
+from lattr.parser import Document
+from lattr.parser.incremental import FingerprintCache
+
+URL = 'http://example.com/live'
+
+
+def _update(number, lead=u'The council met again, late, and voted.'):
+    paragraph = u'<p>%s %s</p>' % (lead, u'More detail, as it comes in. ' * 3)
+    return (u'<article id="update-%d"><h3>Update %d</h3>%s</article>' %
+            (number, number, paragraph * 3))
+
+
+# A live blog: each refresh adds, edits or moves updates, which are the
+# children of the content region
+UPDATES = [_update(3), _update(2), _update(1)]
+
+
+def _live_blog(updates=UPDATES, trending=u'Weather', feed=u'%s'):
+    return (u'<html><head><title>Live: the council vote</title></head><body>'
+            u'<div class="sidebar"><a href="/trending">%s</a></div>'
+            u'<div id="live"><h2>Live: the council vote</h2>%s</div>'
+            u'</body></html>' % (trending, feed % u''.join(updates)))
+
+
+class IncrementalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fingerprints = FingerprintCache(maxsize=2)
+
+    def _parse(self, html, backend='soup', url=URL, metrics=None):
+        doc = Document(html, backend=backend, url=url, metrics=metrics,
+                       fingerprints=self.fingerprints)
+        doc.parse()
+        return doc
+
+    def _check(self, html, mode, rescored_children):
+        for backend in ('soup', 'lxml'):
+            self.fingerprints.clear()
+            first = self._parse(_live_blog(), backend)
+            self.assertEqual('full', first.mode)
+            metrics = log.Metrics()
+            doc = self._parse(html, backend, metrics=metrics)
+            self.assertEqual(mode, doc.mode)
+            self.assertEqual(rescored_children,
+                             metrics.counters.get('rescored_children', 0))
+            expected = Document(html, backend=backend)
+            expected.parse()
+            self.assertEqual(expected.title, doc.title)
+            self.assertEqual(expected.content_html(), doc.content_html())
+
+    def test_region_is_the_parent_of_the_top_candidate(self):
+        self._parse(_live_blog())
+        fingerprint = self.fingerprints.get(URL)
+        self.assertEqual(('div', 'live', '', 0), fingerprint.path[-1])
+        self.assertEqual(4, len(fingerprint.children))
+
+    def test_unchanged_page_is_reused(self):
+        self._check(_live_blog(), 'reused', 0)
+        self.assertEqual(2, self.fingerprints.info().reused)
+
+    def test_unchanged_page_is_not_parsed(self):
+        for backend in ('soup', 'lxml'):
+            self.fingerprints.clear()
+            self._parse(_live_blog(), backend)
+            doc = self._parse(_live_blog(), backend)
+            self.assertEqual('reused', doc.mode)
+            self.assertEqual(u'Live: the council vote', doc.title)
+            # Only the content kept last time is in the tree
+            self.assertIsNone(doc._tree.find('title'))
+            # The same bytes in another charset are another page
+            doc = Document(_live_blog().encode('utf-8'), backend=backend,
+                           url=URL, encoding='iso-8859-1',
+                           fingerprints=self.fingerprints)
+            self.assertIsNotNone(doc._tree.find('title'))
+
+    def test_change_outside_region_is_reused(self):
+        self._check(_live_blog(trending=u'Sport'), 'reused', 0)
+
+    def test_new_update_is_scored_alone(self):
+        self._check(_live_blog([_update(4)] + UPDATES), 'incremental', 1)
+        self.assertEqual(2, self.fingerprints.info().rescored)
+
+    def test_edited_update_is_scored_alone(self):
+        edited = _update(3, u'Correction: the vote, it seems, was close.')
+        self._check(_live_blog([edited] + UPDATES[1:]), 'incremental', 1)
+
+    def test_moved_updates_keep_their_scores(self):
+        self._check(_live_blog(UPDATES[::-1]), 'incremental', 0)
+
+    def test_rescored_page_is_remembered(self):
+        self._parse(_live_blog())
+        updates = [_update(4)] + UPDATES
+        self._parse(_live_blog(updates))
+        self.assertEqual('reused', self._parse(_live_blog(updates)).mode)
+
+    def test_content_out_of_region_is_scored_in_full(self):
+        # The updates move one level down, out of the region's children
+        feed = u'<section>%s</section>'
+        self._parse(_live_blog())
+        doc = self._parse(_live_blog(feed=feed))
+        self.assertEqual('full', doc.mode)
+        self.assertEqual(1, self.fingerprints.info().failures)
+        self.assertEqual('reused', self._parse(_live_blog(feed=feed)).mode)
+
+    def test_page_without_region_is_forgotten(self):
+        # The body wins, the updates are no longer a region's children
+        self._parse(_live_blog())
+        doc = self._parse(_live_blog(feed=u'<div>%s</div>'))
+        self.assertEqual('full', doc.mode)
+        self.assertEqual(0, self.fingerprints.info().currsize)
+
+    def test_info(self):
+        self._parse(_live_blog())
+        self._parse(_live_blog(), url='http://example.com/other')
+        self._parse(_live_blog(), url='http://example.com/third')
+        info = self.fingerprints.info()
+        self.assertEqual((0, 0, 3, 0), info[:4])
+        self.assertEqual((2, 2), (info.currsize, info.maxsize))
+
+    def test_needs_url(self):
+        doc = Document(_live_blog(), fingerprints=self.fingerprints)
+        doc.parse()
+        self.assertEqual('full', doc.mode)
+        self.assertEqual(0, self.fingerprints.info().currsize)
+
+    def test_off_by_default(self):
+        self.assertFalse(settings.INCREMENTAL_EXTRACTION)
+        doc = Document(_live_blog(), url=URL)
+        self.assertIsNone(doc._fingerprints)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import logging
+import unittest
+
+from lattr import log
+from lattr.parser import Document, HTMLCleaner
+
+HTML = '''<html><head><title>A title long enough to keep</title></head>
+<body><div id="sidebar"><a href="/">home</a></div>
+<script>var x = 1;</script>
+<div class="post"><p>%s</p><p>%s</p></div></body></html>''' % (
+    'Some text, with commas, long enough to score. ' * 3,
+    'More text, with commas, long enough to score. ' * 3)
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        log.add_hook(self.received.append)
+
+    def tearDown(self):
+        log.remove_hook(self.received.append)
+
+    def test_hook_receives_stages_and_counters(self):
+        doc = Document(HTML)
+        doc.parse()
+        self.assertEqual([doc.metrics], self.received)
+        self.assertEqual(['build', 'scan', 'title', 'top', 'siblings'],
+                         list(doc.metrics.durations))
+        counters = doc.metrics.counters
+        self.assertEqual(1, counters['removed_scripts'])
+        self.assertEqual(1, counters['removed_unlikely'])
+        self.assertTrue(counters['candidates'] >= 1)
+        self.assertTrue(counters['nodes'] > counters['candidates'])
+
+    def test_clean_is_recorded(self):
+        metrics = log.Metrics()
+        HTMLCleaner().clean(HTML, metrics)
+        self.assertEqual(['clean'], list(metrics.durations))
+
+    def test_no_metrics_without_hooks(self):
+        log.remove_hook(self.received.append)
+        doc = Document(HTML)
+        doc.parse()
+        self.assertIsNone(doc.metrics)
+        self.assertEqual([], self.received)
+
+    def test_log_metrics(self):
+        messages = []
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                messages.append(record.getMessage())
+
+        handler = Handler()
+        level = log.metrics_logger.level
+        log.metrics_logger.addHandler(handler)
+        log.metrics_logger.setLevel(logging.INFO)
+        try:
+            metrics = log.Metrics()
+            metrics.record('scan', 0)
+            metrics.count('nodes', 3)
+            log.log_metrics(metrics)
+        finally:
+            log.metrics_logger.removeHandler(handler)
+            log.metrics_logger.setLevel(level)
+        self.assertEqual(1, len(messages))
+        self.assertIn('scan=', messages[0])
+        self.assertIn('nodes=3', messages[0])
+
+    def test_logging_config_loads(self):
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        config = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                              'etc', 'logging.cfg')
+        try:
+            log.configure(config)
+            self.assertEqual(logging.INFO,
+                             logging.getLogger('lattr.metrics').level)
+        finally:
+            root.handlers = handlers
+            root.setLevel(level)
+            for name in ('lattr', 'lattr.metrics'):
+                logger = logging.getLogger(name)
+                logger.handlers = []
+                logger.propagate = True
+                logger.setLevel(logging.NOTSET)
+
+
+class PeakRSSTestCase(unittest.TestCase):
+    SIZE_KB = 64 * 1024
+
+    def _measure(self, peak_rss, size_kb):
+        peak_rss.start()
+        data = bytearray(size_kb * 1024)
+        del data
+        return peak_rss.stop()
+
+    @unittest.skipUnless(os.path.exists(log.PeakRSS.CLEAR_REFS),
+                         'needs /proc/self/clear_refs')
+    def test_peak_is_reset(self):
+        peak_rss = log.PeakRSS()
+        large = self._measure(peak_rss, self.SIZE_KB)
+        self.assertTrue(peak_rss.reset)
+        small = self._measure(peak_rss, 0)
+        self.assertGreater(large - small, self.SIZE_KB // 2)
+
+    def test_growth_elsewhere(self):
+        peak_rss = log.PeakRSS()
+        peak_rss.CLEAR_REFS = '/nonexistent/clear_refs'
+        grown = self._measure(peak_rss, 2 * log.peak_rss_kb())
+        self.assertFalse(peak_rss.reset)
+        self.assertGreater(grown, 0)
+        self.assertEqual(0, self._measure(peak_rss, 0))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import random
+import sys
+import threading
+import unittest
+
+from lattr.lru import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LRUCache(2)
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', 1)
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual((1, 1, 2, 1), tuple(self.cache.info()))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(['a', 'c'], self.cache.keys())
+
+    def test_put_existing_key(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.put('a', 3)
+        self.cache.put('c', 4)
+        self.assertEqual(['a', 'c'], self.cache.keys())
+        self.assertEqual(3, self.cache.get('a'))
+
+    def test_pop(self):
+        self.cache.put('a', 1)
+        self.assertEqual(1, self.cache.pop('a'))
+        self.assertIsNone(self.cache.pop('a'))
+        self.assertEqual(0, len(self.cache))
+
+    def test_invalid_maxsize(self):
+        with self.assertRaises(ValueError):
+            LRUCache(0)
+
+    def test_shared_between_threads(self):
+        cache = LRUCache(16)
+        errors = []
+
+        def work(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(20000):
+                    key = rng.randint(0, 31)
+                    operation = rng.random()
+                    if operation < 0.4:
+                        cache.get(key)
+                    elif operation < 0.9:
+                        cache.put(key, key)
+                    else:
+                        cache.pop(key)
+            except Exception as e:
+                errors.append(e)
+
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            threads = [threading.Thread(target=work, args=(seed,))
+                       for seed in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+        self.assertEqual([], errors)
+        self.assertEqual(len(cache), len(cache.keys()))
+        self.assertEqual(sorted(cache._links), sorted(cache.keys()))
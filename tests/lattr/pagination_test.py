@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import time
+import threading
+import unittest
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from lattr.fetch import Fetcher
+from lattr.parser import Document
+from lattr.parser.pagination import (assemble_pages, base_url,
+                                     extract_pages, find_pagination,
+                                     page_number)
+
+# Seconds the server takes to answer for a page after the first
+DELAY = 0.3
+
+
+def _page(number, links):
+    paragraph = (u'<p>Page %d of the article, with commas, and words. %s</p>' %
+                 (number, u'Sentence %d, and more text. ' % number * 10))
+    return (u'<html><head><title>The article</title></head><body>'
+            u'<div class="post">%s</div>%s</body></html>' %
+            (paragraph * 3, links))
+
+
+def _numbered(number, last=4):
+    links = [u'<a href="/article">1</a>']
+    links.extend(u'<a href="/article/%d">%d</a>' % (n, n)
+                 for n in range(2, last + 1))
+    if number < last:
+        links.append(u'<a href="/article/%d" rel="next">Next \xbb</a>' %
+                     (number + 1))
+    return u'<div class="pagination">%s</div>' % u''.join(links)
+
+
+def _chained(number):
+    # Page 3 links back to page 1 as its "next" page
+    target = number + 1 if number < 3 else 1
+    return (u'<div class="pager"><a href="/chain/%d">Next page</a></div>' %
+            target)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        number = int(parts[1]) if len(parts) > 1 else 1
+        if number > 1:
+            time.sleep(DELAY)
+        if parts[0] == 'article' and number <= 4:
+            body = _page(number, _numbered(number))
+        elif parts[0] == 'chain':
+            body = _page(number, _chained(number))
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FindPaginationTestCase(unittest.TestCase):
+
+    def _pagination(self, links, url='http://a.com/story/2'):
+        doc = Document(u'<html><body><p>text</p>%s</body></html>' % links)
+        return find_pagination(doc._tree, url)
+
+    def test_page_number(self):
+        self.assertEqual(1, page_number('http://a.com/story'))
+        self.assertEqual(3, page_number('http://a.com/story/page/3/'))
+        self.assertEqual(2, page_number('http://a.com/read?id=7&page=2'))
+
+    def test_base_url(self):
+        self.assertEqual('http://a.com/story', base_url('http://a.com/story/2'))
+        self.assertEqual('http://a.com/story',
+                         base_url('http://a.com/story/page/3/'))
+        self.assertEqual('http://a.com/read?id=7',
+                         base_url('http://a.com/read?id=7&page=2#top'))
+
+    def test_next_link(self):
+        pagination = self._pagination(
+            u'<a href="/story">\xab Previous</a>'
+            u'<a href="/story/3">Next \xbb</a>'
+            u'<a href="/other-story-2">Another story</a>')
+        self.assertEqual('http://a.com/story/3', pagination.next_url)
+
+    def test_previous_and_unrelated_links(self):
+        pagination = self._pagination(
+            u'<a href="/story">Previous page</a>'
+            u'<a href="http://b.com/story/3">Next</a>'
+            u'<a href="/story/3/comments">Comments</a>')
+        self.assertIsNone(pagination.next_url)
+
+    def test_numbered_links(self):
+        pagination = self._pagination(
+            u'<div class="pages"><a href="/story">1</a><a href="/story/2">2'
+            u'</a><a href="/story/3">3</a><a href="/story/4">4</a></div>')
+        self.assertEqual('http://a.com/story/3', pagination.next_url)
+        self.assertEqual(['http://a.com/story/3', 'http://a.com/story/4'],
+                         pagination.numbered)
+
+    def test_found_before_pruning(self):
+        doc = Document(_page(1, _numbered(1)), url='http://a.com/article',
+                       find_next_page=True)
+        doc.parse()
+        self.assertEqual('http://a.com/article/2', doc.pagination.next_url)
+        self.assertNotIn(u'Next', doc.content_html())
+
+    def test_off_by_default(self):
+        doc = Document(_page(1, _numbered(1)), url='http://a.com/article')
+        doc.parse()
+        self.assertIsNone(doc.pagination)
+
+
+class AssemblePagesTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _Server(('127.0.0.1', 0), _Handler)
+        cls.base_url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.fetcher = Fetcher(workers=4, per_host=4)
+
+    def tearDown(self):
+        self.fetcher.close()
+
+    def test_numbered_pages_are_fetched_at_once(self):
+        for backend in ('soup', 'lxml'):
+            started = time.time()
+            assembly = assemble_pages(self.base_url + '/article',
+                                      fetcher=self.fetcher, backend=backend)
+            elapsed = time.time() - started
+            self.assertEqual([self.base_url + '/article'] +
+                             [self.base_url + '/article/%d' % n
+                              for n in (2, 3, 4)], assembly.urls)
+            self.assertLess(elapsed, DELAY * 2)
+            content = assembly.document.content_html()
+            positions = [content.index(u'Page %d of the article' % n)
+                         for n in (1, 2, 3, 4)]
+            self.assertEqual(sorted(positions), positions)
+
+    def test_max_pages(self):
+        result = assemble_pages(self.base_url + '/article',
+                                fetcher=self.fetcher, max_pages=2)
+        self.assertEqual(2, len(result.urls))
+
+    def test_loops_end_the_article(self):
+        result = extract_pages(self.base_url + '/chain/1',
+                               fetcher=self.fetcher)
+        self.assertEqual(u'The article', result.title)
+        for n in (1, 2, 3):
+            self.assertIn(u'Page %d of the article' % n, result.content)
+
+    def test_single_page(self):
+        url = self.base_url + '/article'
+        result = assemble_pages(url, html=_page(1, u''),
+                                fetcher=self.fetcher)
+        self.assertEqual([url], result.urls)
@@ -1,9 +1,35 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import os
+import re
+import time
+import random
 import unittest
 
-from lattr.parser import HTMLCleaner, Document
+from lattr import log
+from lattr.parser import HTMLCleaner, Document, extract
+from lattr.parser.parser import _collect_text_stats
+from lattr.parser.weights import ClassWeightCache
+
+
+DEFAULT_PAGE = os.path.join(os.path.dirname(__file__), os.pardir,
+                            'html_documents', 'default_page.html')
+
+# The cleaner as it was first written, one re.sub after the other
+SEQUENTIAL_REPLACEMENTS = [
+    (re.compile('<script.*?</script[^>]*>', re.DOTALL | re.IGNORECASE), ''),
+    (re.compile('(="[^"]+")"+'), '\\1'),
+    (re.compile('(<[a-zA-Z]+[^>]*)(<[a-zA-Z]+[^<>]*>)'), '\\1>\\2'),
+    (re.compile('(<[^>]*[a-zA-Z]+\s*=\s*"[0-9]+)( [a-zA-Z]+="\w+"|/?>)'),
+     '\\1"\\2'),
+]
+
+
+def _clean_sequentially(html):
+    for regex, replacement in SEQUENTIAL_REPLACEMENTS:
+        html = regex.sub(replacement, html)
+    return html
 
 
 class HTMLCleanerTestCase(unittest.TestCase):
@@ -31,6 +57,57 @@ class HTMLCleanerTestCase(unittest.TestCase):
         cleaned = self.cleaner.clean(self.UNCLOSED_ATTRIBUTE_VALUES)
         self.assertEqual('<div id="7" class="test">', cleaned)
 
+    def test_clean_all_repairs(self):
+        cleaned = self.cleaner.clean(self.BROKEN_JAVASCRIPT +
+                                     self.DOUBLE_DOUBLE_QUOTED_ATTRIBUTES +
+                                     self.UNCLOSED_ATTRIBUTE_VALUES)
+        self.assertEqual('<html></html><div id="test"></div>'
+                         '<div id="7" class="test">', cleaned)
+
+    def test_clean_unterminated_scripts(self):
+        for html in ['<p>text</p>' + '<script>var a = 1;' * 20000,
+                     '<script' + '</script' * 20000,
+                     '<SCRIPT' + '</Script x' * 20000]:
+            started = time.time()
+            self.assertEqual(html, self.cleaner.clean(html))
+            self.assertLess(time.time() - started, 1, html[:10])
+
+    def test_clean_overlapping_repairs(self):
+        for html, cleaned in [
+                ('<p<script><pid =">"</script> a', '<p a'),
+                ('<a href="x""<b>', '<a href="x"><b>'),
+                ('<img width="5 height="6"<br>',
+                 '<img width="5" height="6"><br>'),
+                ('<div<div id="3>', '<div><div id="3">')]:
+            self.assertEqual(cleaned, self.cleaner.clean(html))
+
+    def test_clean_like_sequential_cleaner(self):
+        fragments = ['<', '>', '"', '=', ' ', '\n', '/', 'a', 'id', '5', '12',
+                     'x_', '="', 'b="c"', '<div', '<script', '<SCRIPT>',
+                     '</script', '</SCRIPT x']
+        generator = random.Random(5)
+        for _ in xrange(5000):
+            html = ''.join(generator.choice(fragments)
+                           for _ in xrange(generator.randint(0, 30)))
+            self.assertEqual(_clean_sequentially(html),
+                             self.cleaner.clean(html), repr(html))
+
+    def test_clean_unterminated_tags(self):
+        for html in ['<a ' * 20000, '<ab' * 40000, '<a x="1' * 20000,
+                     '<a="1 b="' * 20000, '<a<<<' * 20000]:
+            started = time.time()
+            self.cleaner.clean(html)
+            self.assertLess(time.time() - started, 1, html[:10])
+
+    def test_dry_run(self):
+        self.assertEqual(
+            ["javascript:['<script></script >']",
+             "double double-quoted attributes:['=\"test\"']",
+             'unclosed tags:[]',
+             'unclosed (numerical) attribute values:[]'],
+            self.cleaner.dry_run(self.BROKEN_JAVASCRIPT +
+                                 self.DOUBLE_DOUBLE_QUOTED_ATTRIBUTES))
+
 
 class DocumentTestCase(unittest.TestCase):
 
@@ -68,3 +145,276 @@ class DocumentTestCase(unittest.TestCase):
         ''')
         doc.parse()
         self.assertEqual('real title', doc.title)
+
+    def test_unlikely_body_is_kept(self):
+        html = ('<html><body class="sidebar"><div class="comment">aside</div>'
+                '<div><p>%s</p></div></body></html>' %
+                ('Some text, with commas, ' * 10))
+        for backend in ('soup', 'lxml'):
+            for prune in (True, False):
+                doc = Document(html, backend=backend,
+                               prune_while_parsing=prune)
+                doc.parse()
+                text = doc._tree.text(doc.main_content)
+                self.assertIn('Some text, with commas', text)
+                self.assertNotIn('aside', text)
+
+    def test_text_stats_match_node_text(self):
+        doc = Document('''
+        <html><body>
+          <div id="main"><p>one, two, <a href="#">three</a></p>
+          <!-- a, comment --><p>four<a href="#">five, six</a></p></div>
+        </body></html>''')
+        soup = doc._tree.soup
+        table = _collect_text_stats(doc._tree, soup.html)
+        for node in soup.find_all(True):
+            stats = table[id(node)]
+            self.assertEqual(len(node.text), stats.text_length)
+            self.assertEqual(node.text.count(','), stats.comma_count)
+            link_length = sum(len(a.text) for a in node.find_all('a'))
+            self.assertEqual(link_length, stats.link_length)
+
+    def test_grab_main_content_keeps_identical_siblings(self):
+        paragraph = '<p>%s</p>' % ('Some text, with commas, ' * 10)
+        doc = Document('''
+        <html><body>
+          <div class="entry">%s</div>
+          <div class="entry">%s</div>
+        </body></html>''' % (paragraph, paragraph))
+        doc.parse()
+        self.assertEqual(2, len(doc.main_content.find_all('p')))
+
+    def test_scan_prunes_and_measures_in_one_pass(self):
+        doc = Document('''
+        <html><body>
+          <div id="sidebar"><p>unlikely, candidate</p></div>
+          <div><p>kept, text<script>var a = 1;</script></p><h1>head</h1></div>
+        </body></html>''', prune_while_parsing=False)
+        doc._scan()
+        soup = doc._tree.soup
+        self.assertIsNone(soup.find(id='sidebar'))
+        self.assertIsNone(soup.find('script'))
+        self.assertEqual(1, len(doc._title_nodes[2]))
+        expected = _collect_text_stats(doc._tree, soup.html)
+        self.assertEqual(sorted(expected), sorted(doc._text_stats))
+        for key, stats in expected.iteritems():
+            scanned = doc._text_stats[key]
+            self.assertEqual(stats.index, scanned.index)
+            self.assertEqual(stats.text_length, scanned.text_length)
+            self.assertEqual(stats.link_length, scanned.link_length)
+
+
+class ClassWeightCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.weights = ClassWeightCache(maxsize=8)
+
+    def test_verdict(self):
+        verdict = self.weights.verdict('entry', 'related-content')
+        self.assertTrue(verdict.positive)
+        self.assertTrue(verdict.negative)
+        self.assertFalse(verdict.unlikely)
+        self.assertEqual(25, verdict.weight)
+        self.assertTrue(self.weights.verdict('', 'sidebar').unlikely)
+
+    def test_unlikely_matches_id_then_class(self):
+        self.assertTrue(self.weights.verdict('ter', 'foo').unlikely)
+
+    def test_hits_and_misses(self):
+        for i in range(3):
+            self.weights.verdict('post', '')
+        info = self.weights.info()
+        self.assertEqual(2, info.hits)
+        self.assertEqual(1, info.misses)
+
+    def test_document_uses_cache(self):
+        doc = Document('''<html><body>
+          <div class="post"><p>%s</p></div>
+          <div class="post"><p>%s</p></div>
+        </body></html>''' % ('text, ' * 10, 'text, ' * 10),
+                       class_weights=self.weights)
+        doc.parse()
+        self.assertGreater(self.weights.info().hits, 0)
+
+
+class PruneWhileParsingTestCase(unittest.TestCase):
+
+    HTML = '''<html><head><style>p {}</style></head><body>
+      <div class="menu"><a href="/">home</a></div>before<script>var a;</script>
+      after<iframe src="/ad"></iframe>
+      <div><p>%s</p><svg><g></g></svg></div>
+      <noscript><img src="/pixel"></noscript></body></html>''' % (
+        'Some text, with commas, ' * 10)
+
+    def test_subtrees_are_never_built(self):
+        doc = Document(self.HTML, backend='soup')
+        soup = doc._tree.soup
+        for name in ('style', 'script', 'iframe', 'svg', 'g', 'noscript',
+                     'img'):
+            self.assertIsNone(soup.find(name), name)
+        self.assertEqual(['div', 'p'], [tag.name for tag in
+                                        soup.body.find_all(True)])
+        # The text after a dropped element stays
+        self.assertEqual(['before', 'after'], soup.body.text.split()[:2])
+
+    def test_same_extraction_as_pruning_in_the_scan(self):
+        with open(DEFAULT_PAGE, 'rb') as fp:
+            html = fp.read()
+        for page in (html, self.HTML):
+            expected = Document(page, backend='soup',
+                                prune_while_parsing=False)
+            expected.parse()
+            doc = Document(page, backend='soup')
+            doc.parse()
+            self.assertEqual(expected.title, doc.title)
+            # Text on both sides of a dropped element is one string here
+            self.assertEqual(
+                expected._tree.text(expected.main_content).split(),
+                doc._tree.text(doc.main_content).split())
+
+    def test_off_when_looking_for_the_next_page(self):
+        doc = Document(self.HTML, backend='soup', url='http://a.com/1',
+                       find_next_page=True)
+        self.assertIsNotNone(doc._tree.soup.find('div', 'menu'))
+
+
+class LxmlBackendTestCase(unittest.TestCase):
+
+    def _parse(self, html, backend):
+        doc = Document(html, backend=backend)
+        doc.parse()
+        return doc
+
+    def assertSameExtraction(self, html):
+        soup_doc = self._parse(html, 'soup')
+        lxml_doc = self._parse(html, 'lxml')
+        self.assertEqual(soup_doc.title, lxml_doc.title)
+        # Whitespace around removed nodes is merged into one lxml tail
+        self.assertEqual(
+            soup_doc._tree.text(soup_doc.main_content).split(),
+            lxml_doc._tree.text(lxml_doc.main_content).split())
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            Document('<html></html>', backend='unknown')
+
+    def test_title(self):
+        doc = self._parse('<html><title>Main - sub</title></html>', 'lxml')
+        self.assertEqual('Main', doc.title)
+
+    def test_same_extraction_as_soup(self):
+        paragraph = '<p>%s</p>' % ('Some text, with commas, ' * 10)
+        self.assertSameExtraction('''
+        <html><body>
+          <div id="header">skip <a href="#">me</a></div>
+          <div class="entry">%s tail<!-- comment --></div>
+          <div class="entry">%s<script>var a = 1;</script></div>
+        </body></html>''' % (paragraph, paragraph))
+
+    def test_same_extraction_on_default_page(self):
+        with open(DEFAULT_PAGE, 'rb') as fp:
+            self.assertSameExtraction(fp.read())
+
+
+class LowMemoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with open(DEFAULT_PAGE, 'rb') as fp:
+            self.html = fp.read()
+
+    def test_same_extraction(self):
+        for backend in ('soup', 'lxml'):
+            expected = Document(self.html, backend=backend)
+            expected.parse()
+            doc = Document(self.html, backend=backend, low_memory=True)
+            doc.parse()
+            self.assertEqual(expected.title, doc.title)
+            self.assertEqual(expected.content_html(), doc.content_html())
+
+    def test_releases_source(self):
+        for backend in ('soup', 'lxml'):
+            doc = Document(self.html, backend=backend, low_memory=True)
+            self.assertIsNone(doc.html)
+            doc.parse()
+            self.assertIsNone(doc._tree.parent(doc.main_content))
+            self.assertEqual({}, doc._text_stats)
+        self.assertIsNone(doc._tree.document)
+
+    def test_pruned_subtrees_are_freed(self):
+        doc = Document('<html><body><div class="sidebar"><p>side</p></div>'
+                       '<div><p>%s</p></div></body></html>' %
+                       ('Some text, with commas, ' * 10),
+                       backend='soup', low_memory=True,
+                       prune_while_parsing=False)
+        sidebar = doc._tree.find('div')
+        doc.parse()
+        self.assertEqual([], sidebar.contents)
+
+
+class TimeBudgetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with open(DEFAULT_PAGE, 'rb') as fp:
+            self.html = fp.read()
+
+    def test_full_mode_within_budget(self):
+        doc = Document(self.html, time_budget=60)
+        doc.parse()
+        self.assertEqual('full', doc.mode)
+
+    def test_fast_mode_past_budget(self):
+        expected = Document(self.html, backend='lxml')
+        expected.parse()
+        doc = Document(self.html, backend='lxml', time_budget=1e-9)
+        doc.parse()
+        self.assertEqual('fast', doc.mode)
+        self.assertFalse(doc.truncated)
+        self.assertEqual(expected.title, doc.title)
+        # The article text is found, without the merged siblings
+        text = doc._tree.text(doc.main_content)
+        self.assertIn(u'In a software team using', text)
+
+    def test_build_stops_at_deadline(self):
+        expected = Document(self.html, backend='soup')
+        expected.parse()
+        for prune in (True, False):
+            doc = Document(self.html, backend='soup', time_budget=1e-9,
+                           prune_while_parsing=prune)
+            self.assertTrue(doc.truncated)
+            # The head comes before the first look at the clock
+            self.assertLess(len(doc._tree.find_all('p')), 5)
+            doc.parse()
+            self.assertEqual('fast', doc.mode)
+            self.assertEqual(expected.title, doc.title)
+        # Built by the pruning builder, to the same tree
+        unpruned = Document(self.html, backend='soup',
+                            prune_while_parsing=False)
+        unpruned.parse()
+        doc = Document(self.html, backend='soup', time_budget=60,
+                       prune_while_parsing=False)
+        doc.parse()
+        self.assertFalse(doc.truncated)
+        self.assertEqual(unpruned.content_html(), doc.content_html())
+
+    def test_fast_mode_without_paragraphs(self):
+        doc = Document('<html><body><div>only text</div></body></html>',
+                       time_budget=1e-9)
+        doc.parse()
+        self.assertEqual('fast', doc.mode)
+        self.assertIs(doc._tree.body, doc.main_content)
+
+    def test_scan_stops_at_deadline(self):
+        doc = Document(self.html)
+        self.assertIsNone(doc._scan(deadline=time.time() - 1))
+        doc = Document('<html><body><p>short</p></body></html>')
+        self.assertEqual({}, doc._scan(deadline=time.time() - 1))
+
+    def test_extraction_mode(self):
+        self.assertEqual('full', extract(self.html).mode)
+        self.assertEqual('fast', extract(self.html, time_budget=1e-9).mode)
+
+    def test_metrics(self):
+        metrics = log.Metrics()
+        Document(self.html, metrics=metrics, time_budget=1e-9).parse()
+        self.assertEqual(1, metrics.counters['budget_exceeded'])
+        self.assertIn('fast', metrics.durations)
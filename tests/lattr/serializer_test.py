@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import json
+import unittest
+from StringIO import StringIO
+
+from lattr.parser import Document
+from lattr.parser.serializer import write_document
+
+HTML = (u'<html><head><title>Caf\xe9 & bar, a long enough title</title>'
+        u'</head><body><div class="post"><p>%s</p></div></body></html>' %
+        (u'Caf\xe9 text, with commas, ' * 10))
+
+
+class SerializerTestCase(unittest.TestCase):
+
+    def _write(self, format, backend='soup', low_memory=False):
+        doc = Document(HTML, backend=backend, low_memory=low_memory)
+        doc.parse()
+        stream = StringIO()
+        write_document(stream, doc, format)
+        return doc, stream.getvalue()
+
+    def test_fragment_matches_content_html(self):
+        for backend in ('soup', 'lxml'):
+            doc, output = self._write('fragment', backend)
+            self.assertEqual(doc.content_html().encode('utf-8'), output)
+
+    def test_html(self):
+        for backend in ('soup', 'lxml'):
+            doc, output = self._write('html', backend, low_memory=True)
+            self.assertTrue(output.startswith('<!DOCTYPE html>'))
+            self.assertIn('<title>Caf\xc3\xa9 &amp; bar, a long enough '
+                          'title</title>', output)
+            self.assertIn(doc.content_html().encode('utf-8'), output)
+            self.assertTrue(output.endswith('</body></html>\n'))
+
+    def test_text(self):
+        doc, output = self._write('text', 'lxml')
+        title, text = output.decode('utf-8').split(u'\n\n', 1)
+        self.assertEqual(doc.title, title)
+        self.assertTrue(text.startswith(u'Caf\xe9 text, with commas'))
+        self.assertNotIn(u'<p>', text)
+
+    def test_json(self):
+        doc, output = self._write('json')
+        self.assertEqual({'title': doc.title, 'content': doc.content_html()},
+                         json.loads(output))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self._write('xml')
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import json
+import time
+import unittest
+
+from lattr.fetch import Fetcher, FetchResult
+from lattr.service import ExtractionPool, create_app
+
+PAGE = ('<html><title>A title long enough to keep</title><body><div>'
+        '<p>%s</p></div></body></html>' % ('Some text, with commas, ' * 10))
+
+
+class _Fetcher(object):
+    # Serves PAGE for every URL but /missing, noting how many documents
+    # the pool had room held for at the time
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.queued = []
+
+    def fetch(self, url):
+        self.queued.append(self.pool.queued)
+        if url.endswith('/missing'):
+            return FetchResult(url, None, 404, {}, '', None, 'HTTP 404', 0)
+        return FetchResult(url, url, 200, {}, PAGE, None, None, 0)
+
+    def fetch_many(self, urls, ordered=False):
+        return [self.fetch(url) for url in urls]
+
+
+class ServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ExtractionPool(processes=1, queue_size=4, timeout=10)
+        self.fetcher = _Fetcher(self.pool)
+        self.app = create_app(self.pool, self.fetcher, max_batch=3)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def post(self, path, payload):
+        response = self.client.post(path, data=json.dumps(payload),
+                                    content_type='application/json')
+        return response, json.loads(response.get_data())
+
+    def test_extract_html(self):
+        response, data = self.post('/extract', {'html': PAGE})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(u'A title long enough to keep', data['title'])
+        self.assertIn(u'Some text, with commas', data['content'])
+        self.assertIsNone(data['error'])
+        self.assertIsNotNone(response.content_length)
+
+    def test_extract_raw_html(self):
+        response = self.client.post('/extract', data=PAGE,
+                                    content_type='text/html')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(u'A title long enough to keep',
+                         json.loads(response.get_data())['title'])
+
+    def test_extract_url(self):
+        response, data = self.post('/extract', {'url': 'http://a/page'})
+        self.assertEqual(u'A title long enough to keep', data['title'])
+        response, data = self.post('/extract', {'url': 'http://a/missing'})
+        self.assertEqual(502, response.status_code)
+        self.assertEqual('HTTP 404', data['error'])
+
+    def test_bad_request(self):
+        response, data = self.post('/extract', {'text': 'nothing'})
+        self.assertEqual(400, response.status_code)
+        response = self.client.post('/extract', data='',
+                                    content_type='text/html')
+        self.assertEqual(400, response.status_code)
+        response, data = self.post('/extract/batch', {'documents': 'a'})
+        self.assertEqual(400, response.status_code)
+
+    def test_batch(self):
+        response, data = self.post('/extract/batch', {'documents': [
+            {'id': 'a', 'html': PAGE},
+            {'id': 'b', 'url': 'http://a/missing'},
+            {'id': 'c', 'url': 'http://a/page'}]})
+        self.assertEqual(200, response.status_code)
+        results = data['results']
+        self.assertEqual(['a', 'b', 'c'], [result['id'] for result in results])
+        self.assertEqual('HTTP 404', results[1]['error'])
+        self.assertEqual(results[0]['content'], results[2]['content'])
+
+    def test_batch_too_large(self):
+        response, data = self.post('/extract/batch', {
+            'documents': [{'html': PAGE}] * 4})
+        self.assertEqual(413, response.status_code)
+
+    def test_busy(self):
+        self.pool.reserve(3)
+        response, data = self.post('/extract/batch', {
+            'documents': [{'html': PAGE}] * 2})
+        self.assertEqual(503, response.status_code)
+        self.assertEqual('1', response.headers['Retry-After'])
+        self.pool.release(3)
+        response, data = self.post('/extract', {'html': PAGE})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0, self.pool.queued)
+
+    def test_busy_before_fetching(self):
+        self.pool.reserve(4)
+        response, data = self.post('/extract', {'url': 'http://a/page'})
+        self.assertEqual(503, response.status_code)
+        self.pool.release(4)
+        self.assertEqual([], self.fetcher.queued)
+        self.post('/extract/batch', {'documents': [
+            {'url': 'http://a/page'}, {'url': 'http://a/other'}]})
+        self.assertEqual([2, 2], self.fetcher.queued)
+        self.assertEqual(0, self.pool.queued)
+
+    def test_timeout(self):
+        def slow(job):
+            time.sleep(0.5)
+
+        self.pool.timeout = 0.01
+        self.pool._worker = slow
+        response, data = self.post('/extract', {'html': PAGE})
+        self.assertEqual(504, response.status_code)
+        self.assertIn('not extracted', data['error'])
+        response, data = self.post('/extract/batch', {'documents': [
+            {'html': PAGE}]})
+        self.assertEqual(504, response.status_code)
+        self.assertEqual(0, self.pool.queued)
+
+    def test_raw_html_charset(self):
+        page = PAGE.replace('A title', u'見出し, a title')
+        response = self.client.post(
+            '/extract', data=page.encode('shift_jis'),
+            content_type='text/html; charset=shift_jis')
+        self.assertEqual(u'見出し, a title long enough to keep',
+                         json.loads(response.get_data())['title'])
+
+    def test_requests_do_not_leave_sessions(self):
+        fetcher = Fetcher(workers=2, timeout=1)
+        self.app.fetcher = fetcher
+        try:
+            # Nothing listens there, the fetches fail at once
+            for _ in range(5):
+                self.post('/extract', {'url': 'http://127.0.0.1:1/'})
+                self.post('/extract/batch', {'documents': [
+                    {'url': 'http://127.0.0.1:1/a'},
+                    {'url': 'http://127.0.0.1:1/b'}]})
+            self.assertLessEqual(len(fetcher._sessions), 3)
+        finally:
+            fetcher.close()
+
+    def test_health(self):
+        response = self.client.get('/health')
+        self.assertEqual({'status': 'ok', 'queued': 0, 'queue_size': 4},
+                         json.loads(response.get_data()))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import mmap
+import codecs
+import shutil
+import tempfile
+import unittest
+
+from lattr.parser import Document
+from lattr.parser.source import SNIFF_SIZE, read_file, sniff_encoding
+
+
+DEFAULT_PAGE = os.path.join(os.path.dirname(__file__), os.pardir,
+                            'html_documents', 'default_page.html')
+
+TITLE = u'Un caf\xe9 cr\xe8me “pour tous”'
+
+
+def _page(meta=u''):
+    paragraph = (u'<p>Caf\xe9 cr\xe8me, “quoted”, and enough text '
+                 u'for a paragraph, as long as it takes.</p>')
+    return (u'<html><head>%s<title>%s</title></head><body><div>%s</div>'
+            u'</body></html>' % (meta, TITLE, paragraph * 3))
+
+
+class SniffEncodingTestCase(unittest.TestCase):
+
+    def test_bom_wins(self):
+        html = codecs.BOM_UTF8 + '<meta charset="latin-1">'
+        self.assertEqual('utf-8', sniff_encoding(html, 'windows-1252'))
+        self.assertEqual('utf-16le', sniff_encoding(codecs.BOM_UTF16_LE))
+
+    def test_declared_before_meta(self):
+        html = '<meta charset="utf-8">'
+        self.assertEqual('windows-1252', sniff_encoding(html, 'Windows-1252'))
+        self.assertEqual('utf-8', sniff_encoding(html, 'no-such-charset'))
+
+    def test_meta(self):
+        self.assertEqual('iso-8859-15', sniff_encoding(
+            '<meta http-equiv="Content-Type" '
+            'content="text/html; charset=ISO-8859-15">'))
+        self.assertEqual('shift_jis',
+                         sniff_encoding("<META CHARSET='Shift_JIS'>"))
+        self.assertEqual('utf-8', sniff_encoding('<meta charset="utf-16">'))
+        self.assertIsNone(sniff_encoding('<meta charset="bogus">'))
+        self.assertIsNone(sniff_encoding(' ' * SNIFF_SIZE +
+                                         '<meta charset="utf-8">'))
+
+
+class BytesInputTestCase(unittest.TestCase):
+
+    def _check(self, html, encoding=None):
+        for backend in ('soup', 'lxml'):
+            doc = Document(html, backend=backend, encoding=encoding)
+            doc.parse()
+            self.assertEqual(TITLE, doc.title)
+            self.assertIn(u'“quoted”', doc.content_html())
+
+    def test_meta_charset(self):
+        self._check(_page(u'<meta charset="windows-1252">').encode('cp1252'))
+
+    def test_served_charset(self):
+        self._check(_page().encode('cp1252'), 'windows-1252')
+        self._check(_page(u'<meta charset="utf-8">').encode('cp1252'),
+                    'windows-1252')
+
+    def test_bom(self):
+        self._check(codecs.BOM_UTF16_LE + _page().encode('utf-16le'),
+                    'iso-8859-1')
+
+    def test_charset_unknown_to_lxml(self):
+        self._check(_page(u'<meta charset="cp1252">').encode('cp1252'))
+
+
+class ReadFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_small_files_are_read(self):
+        self.assertIsInstance(read_file(DEFAULT_PAGE, mmap_size=None), str)
+
+    def test_large_files_are_mapped(self):
+        with open(DEFAULT_PAGE, 'rb') as fp:
+            html = fp.read()
+        mapped = read_file(DEFAULT_PAGE, mmap_size=1024)
+        self.assertIsInstance(mapped, mmap.mmap)
+        for backend in ('soup', 'lxml'):
+            doc = Document(mapped, backend=backend)
+            doc.parse()
+            expected = Document(html, backend=backend)
+            expected.parse()
+            self.assertEqual(expected.title, doc.title)
+            self.assertEqual(expected.content_html(), doc.content_html())
+
+    def test_mapped_file_charset(self):
+        path = os.path.join(self.directory, 'page.html')
+        with open(path, 'wb') as fp:
+            fp.write(_page(u'<meta charset="windows-1252">').encode('cp1252'))
+        mapped = read_file(path, mmap_size=1)
+        self.assertIsInstance(mapped, mmap.mmap)
+        self.assertEqual('windows-1252', sniff_encoding(mapped))
+        for backend in ('soup', 'lxml'):
+            doc = Document(mapped, backend=backend)
+            doc.parse()
+            self.assertEqual(TITLE, doc.title)
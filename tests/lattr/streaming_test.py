@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import unittest
+
+from lattr.parser import Document
+from lattr.parser.streaming import (StreamingDocument, extract_stream,
+                                    iter_file)
+
+PAGE = os.path.join(os.path.dirname(__file__), os.pardir, 'html_documents',
+                    'default_page.html')
+
+
+def _chunks(html, size):
+    return [html[i:i + size] for i in range(0, len(html), size)]
+
+
+class StreamingDocumentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with open(PAGE, 'rb') as fp:
+            self.html = fp.read()
+
+    def test_same_extraction_as_lxml_backend(self):
+        expected = Document(self.html, backend='lxml')
+        expected.parse()
+        for size in (13, 4096, 64 * 1024):
+            doc = StreamingDocument(_chunks(self.html, size))
+            doc.parse()
+            self.assertEqual(expected.title, doc.title)
+            self.assertEqual(expected.content_html(), doc.content_html())
+            self.assertFalse(doc.truncated)
+            self.assertEqual(len(self.html), doc.bytes_read)
+
+    def test_iter_file(self):
+        with open(PAGE, 'rb') as fp:
+            result = extract_stream(iter_file(fp, 1000))
+        self.assertEqual(u'Git team workflows: merge or rebase?', result.title)
+
+    def test_byte_budget(self):
+        closed = []
+
+        def chunks():
+            try:
+                for chunk in _chunks(self.html, 1000):
+                    yield chunk
+            finally:
+                closed.append(True)
+
+        doc = StreamingDocument(chunks(), byte_budget=20000)
+        doc.parse()
+        self.assertTrue(doc.truncated)
+        self.assertEqual(20000, doc.bytes_read)
+        self.assertEqual([True], closed)
+        self.assertEqual(u'Git team workflows: merge or rebase?', doc.title)
+        self.assertIn(u'<p>', doc.content_html())
+
+    def test_time_budget(self):
+        doc = StreamingDocument(_chunks(self.html, 1000), time_budget=1e-9)
+        doc.parse()
+        self.assertTrue(doc.truncated)
+        self.assertEqual(1000, doc.bytes_read)
+        self.assertEqual('fast', doc.mode)
+
+    def test_script_split_across_chunks(self):
+        html = ('<html><head><title>A title long enough</title></head><body>'
+                '<div><script>var a = "<p>";</script><p>%s</p></div>'
+                '</body></html>' % ('Text, with commas, ' * 10))
+        for size in range(1, 40):
+            doc = StreamingDocument(_chunks(html, size))
+            doc.parse()
+            self.assertNotIn(u'script', doc.content_html())
+            self.assertIn(u'Text, with commas', doc.content_html())
+
+    def test_unicode_chunks(self):
+        html = (u'<html><title>Caf\xe9 au lait, a long title</title><body>'
+                u'<div><p>%s</p></div></body></html>' % (u'Caf\xe9, ' * 20))
+        doc = StreamingDocument(_chunks(html, 7))
+        doc.parse()
+        self.assertEqual(u'Caf\xe9 au lait, a long title', doc.title)
+        self.assertIn(u'Caf\xe9, Caf\xe9', doc.content_html())
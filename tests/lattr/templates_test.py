@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import unittest
+
+from lattr.parser import Document
+from lattr.parser.templates import TemplateCache, Template, domain
+
+PARAGRAPH = '<p>%s</p>' % ('Some text, with commas, for the article. ' * 4)
+
+
+def _page(post_id, paragraphs=3, layout='main'):
+    return '''<html><head><title>Post %(id)s on a site with a layout</title>
+    </head><body>
+      <div id="menu"><a href="/">home</a> <a href="/about">about</a></div>
+      <div class="%(layout)s-wrapper">
+        <div class="intro">Teaser, with commas, for %(id)s</div>
+        <div class="post post-%(id)s">%(text)s</div>
+        <div class="post-more post-%(id)s">%(text)s</div>
+        <div class="share"><a href="/s">share</a></div>
+      </div>
+    </body></html>''' % {'id': post_id, 'layout': layout,
+                         'text': PARAGRAPH * paragraphs}
+
+
+class TemplateCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.templates = TemplateCache(maxsize=2, max_failures=2)
+
+    def _parse(self, html, url, backend='soup'):
+        doc = Document(html, backend=backend, url=url,
+                       templates=self.templates)
+        doc.parse()
+        return doc
+
+    def test_template_gives_same_content(self):
+        for backend in ('soup', 'lxml'):
+            self.templates.clear()
+            first = self._parse(_page(1), 'http://example.com/1', backend)
+            self.assertFalse(first.used_template)
+            second = self._parse(_page(22), 'http://www.example.com/22',
+                                 backend)
+            self.assertTrue(second.used_template)
+            expected = Document(_page(22), backend=backend)
+            expected.parse()
+            self.assertEqual(expected.title, second.title)
+            self.assertEqual(expected.content_html(), second.content_html())
+        self.assertEqual(2, self.templates.info().hits)
+
+    def test_failed_validation_falls_back(self):
+        self._parse(_page(1), 'http://example.com/1')
+        doc = self._parse(_page(2, paragraphs=0), 'http://example.com/2')
+        self.assertFalse(doc.used_template)
+        self.assertEqual(1, self.templates.info().failures)
+
+    def test_layout_change_replaces_template(self):
+        self._parse(_page(1), 'http://example.com/1')
+        doc = self._parse(_page(2, layout='entry'), 'http://example.com/2')
+        self.assertFalse(doc.used_template)
+        self.assertEqual(1, self.templates.info().invalidations)
+        doc = self._parse(_page(3, layout='entry'), 'http://example.com/3')
+        self.assertTrue(doc.used_template)
+
+    def test_repeated_failures_drop_template(self):
+        self.templates.learn('http://example.com/', Template((), frozenset()))
+        self.templates.failed('http://example.com/1')
+        self.assertIsNotNone(self.templates.get('http://example.com/'))
+        self.templates.failed('http://example.com/2')
+        self.assertIsNone(self.templates.get('http://example.com/'))
+        self.assertEqual(1, self.templates.info().invalidations)
+
+    def test_bounded(self):
+        for host in ('a', 'b', 'c'):
+            self.templates.learn('http://%s.com/' % host,
+                                 Template((), frozenset()))
+        info = self.templates.info()
+        self.assertEqual((2, 2), (info.currsize, info.maxsize))
+        self.assertIsNone(self.templates.get('http://a.com/'))
+
+    def test_no_url_no_template(self):
+        doc = Document(_page(1), templates=self.templates)
+        doc.parse()
+        self.assertEqual(0, self.templates.info().currsize)
+
+    def test_domain(self):
+        self.assertEqual('example.com', domain('https://WWW.Example.com/a'))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import unittest
+
+from lattr.parser import Document
+from lattr.parser import vectorized
+from lattr.parser.benchmark import generate_corpus
+
+
+DEFAULT_PAGE = os.path.join(os.path.dirname(__file__), os.pardir,
+                            'html_documents', 'default_page.html')
+
+
+@unittest.skipUnless(vectorized.available(), 'NumPy is not installed')
+class VectorizedScoringTestCase(unittest.TestCase):
+
+    def _parse(self, html, backend, scoring):
+        doc = Document(html, backend=backend, scoring=scoring)
+        doc.parse()
+        return doc
+
+    def assertSameExtraction(self, html):
+        for backend in ('soup', 'lxml'):
+            expected = self._parse(html, backend, 'python')
+            doc = self._parse(html, backend, 'numpy')
+            self.assertEqual(expected.title, doc.title)
+            self.assertEqual(expected.content_html(), doc.content_html())
+
+    def test_same_extraction_on_default_page(self):
+        with open(DEFAULT_PAGE, 'rb') as fp:
+            self.assertSameExtraction(fp.read())
+
+    def test_same_extraction_on_generated_pages(self):
+        for name, html in generate_corpus():
+            self.assertSameExtraction(html)
+
+    def test_same_scores(self):
+        with open(DEFAULT_PAGE, 'rb') as fp:
+            html = fp.read()
+        expected = Document(html)
+        candidates = expected._scan()
+        top = expected._find_top_candidate(candidates)
+        doc = Document(html, scoring='numpy')
+        doc._scan(score=False, layout=True)
+        scored, best = doc._score_vectorized()
+        self.assertEqual(sorted((c.index, c.score)
+                                for c in candidates.itervalues()),
+                         sorted((c.index, c.score)
+                                for c in scored.itervalues()))
+        self.assertEqual((top.index, top.score), (best.index, best.score))
+
+    def test_ties_go_to_the_first_candidate(self):
+        paragraph = '<p>%s</p>' % ('Some text, with commas, ' * 10)
+        doc = self._parse('<html><body><div id="a">%s</div>'
+                          '<div id="b">%s</div></body></html>' %
+                          (paragraph, paragraph), 'soup', 'numpy')
+        self.assertEqual(['a', 'b'],
+                         [doc._tree.get_id(node) for node in
+                          doc._tree.children(doc.main_content)])
+
+    def test_body_without_candidates(self):
+        self.assertSameExtraction('<html><body><p>short</p></body></html>')
+
+    def test_unknown_scoring(self):
+        with self.assertRaises(ValueError):
+            Document('<html></html>', scoring='unknown')